@@ -8,15 +8,26 @@
 *************************************************************************************************************
 """
 
-from dash import html, dcc, Dash, dash_table
+from dash import html, dcc, Dash, dash_table, DiskcacheManager
 from dash.dependencies import Input, Output, State
 import plotly.graph_objects as go
+import os
+import pickle
+import uuid
+import requests
+import diskcache
 import numpy as np 
 import pandas as pd 
 import networkx as nx 
 from make_plots import *
 import methods
-import scipy.stats as stats
+from gene_index import GeneIndex
+from batch_stats import group_tests
+from session_store import SessionStore
+from disk_cache import DiskCache
+from violin_summary import X_UNITS
+from precompute_stats import load_stats_table, GROUPINGS, RANK_COLUMNS
+import flask
 
 config = {
         'responsive': True, 
@@ -52,14 +63,16 @@ all_tissues = ['All', 'Adipose_Subcutaneous', 'Adipose_Visceral_Omentum', 'Adren
 #template = "plotly_dark"
 template = "plotly_white"
 
-with open('all_genes_dict.txt', 'r') as f:
-    data = f.readline()
-    all_genes_dict = dict(eval(str(data)))
+#gene symbol -> gencode id -> ENSP lookups, shared by the workers through the page cache
+gene_index = GeneIndex()
+default_gene = gene_index.symbols(1)[0]
 
-with open("ENSG_to_ENSP.txt", "r") as f:
-    ensembl_gene_protein_mapping = dict(eval(f.read()))
+#genome wide tests for the ranking view, None until `python precompute_stats.py` is run
+gene_stats_table = load_stats_table()
 
 all_filters = ["No filters", "Group by Gender", "Group by Age", "Group by Gender and Age"]
+#"Summary" draws the All tissues violins from server side KDE and box statistics instead of every sample
+violin_modes = ["Raw samples", "Summary"]
 all_ages = ["20-29", "30-39", "40-49", "50-59", "60-69", "70-79"]
 all_genders = ["male", "female"]
 max_n_clicks = 0
@@ -72,43 +85,77 @@ def empty_figure(title = "Fill Dropdown menus and press the Update Plot Button",
     fig.update_layout(template=template, title=title, title_font_color=color)
     return fig
 
-def get_current_y_range(x_range, y_all):
-    
-    y = y_all[int(x_range[0]):int(x_range[1])] #FIX X RANGE 
-    temp = max(max(y))
-    temp_min = -0.1
-    return [temp_min, temp+0.1]#FIX
+def violin_y_maxima(ys, per_position = 1):
+    """
+    Highest value of the violins at each x position, computed once with the figure for the rangeslider zoom.
+
+    Parameters:
+        ys: list of arrays, values of each violin, the per_position violins of an x position are consecutive
+        per_position: int, number of violins at each x position (2 when grouped by gender)
+    Returns:
+        y_maxima: list of float, one for each x position
+    """
+    maxima = np.array([float(np.max(y)) if len(y) else 0.0 for y in ys])
+    return maxima.reshape(-1, per_position).max(axis=1).round(3).tolist()
+
+def stats_table(ys, between_groups = True):
+    """
+    Anova and Kruskal between the violins (traces) and Shapiro of all their values, as the stats table records.
+    """
+    results = {test: ["None" if value is None else value for value in values] for test, values in group_tests(ys, between_groups).items()}
+    df = pd.DataFrame([[test, *results[test]] for test in ["Anova", "Kruskal", "Shapiro"]], columns = table_columns)
+    return df.to_dict('records')
 
 def get_gencode_id_from_gene_name(gene_name):
 
-    gencode_id = all_genes_dict[gene_name]
+    gencode_id = gene_index[gene_name]
     return gencode_id 
 
-fig_prec_violin = empty_figure()
-fig_prec_pie = empty_figure()
-fig_prec_ppi = empty_figure()
-prec_gene = None
-prec_tissue = None
-prec_filter = None
-prec_method = None 
-prec_href = ""
-prec_href_gene = ""
-prec_table = pd.DataFrame(columns = ["", "f_value", "p_value"])
-prec_table_title = "Anova, Kruskal and Shapiro analysis results only when Update Plots button is clicked" 
-prec_xrange = [0, len(all_tissues)]
-max_download_n_clicks = 0
-max_download_data_n_clicks = 0
-max_about_n_clicks = 0
-curr_violin = fig_prec_violin 
-curr_G = None 
-curr_data = None
-curr_fvalue_shapiro = "None"
-curr_pvalue_shapiro = "None"
-
-app = Dash(__name__)          #create the dash app fist 
+def load_figure(fig):
+    #figures are kept as plotly JSON, rebuilt without validating them again
+    return fast_figure(fig["data"], fig["layout"])
+
+def results_cache_get(key):
+
+    value = results_cache.get(key)
+    return None if value is None else pickle.loads(value)
+
+def results_cache_set(key, result):
+
+    results_cache.set(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+table_columns = ["", "f_value", "p_value"]
+empty_table = [{"": test, "f_value": "None", "p_value": "None"} for test in ["Anova", "Kruskal", "Shapiro"]]
+
+#state of each browser session (see session_store.py), shared by all the workers and expired after SESSION_TTL seconds of inactivity
+SESSION_TTL = float(os.environ.get("SESSION_TTL", 2*60*60))
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", 512*1024*1024))
+sessions = SessionStore(os.path.join(CACHE_DIR, "sessions.sqlite"), max_bytes=SESSION_MAX_BYTES, ttl=SESSION_TTL,
+                        defaults={"plot": {"query": None, "table": empty_table, "table_title": "Anova, Kruskal and Shapiro analysis results only when Update Plots button is clicked",
+                                           "y_maxima": [], "x_units": 1, "hidden": True, "violin": empty_figure().to_plotly_json(), "pie": empty_figure().to_plotly_json(), "data": None},
+                                  "ppi": {"gene": None, "method": None, "ppi": empty_figure().to_plotly_json(), "ppi_graph": None, "ppi_title": None, "ppi_href": "", "gene_href": ""},
+                                  "download_plots_clicks": 0, "download_data_clicks": 0})
+
+#outputs of the plot and PPI callbacks for each query, shared by all the sessions: a repeated query is not computed again
+RESULTS_TTL = float(os.environ.get("RESULTS_TTL", 24*60*60))
+RESULTS_CACHE_MAX_BYTES = int(os.environ.get("RESULTS_CACHE_MAX_BYTES", 256*1024*1024))
+results_cache = DiskCache(os.path.join(CACHE_DIR, "results.sqlite"), max_bytes=RESULTS_CACHE_MAX_BYTES, version=GTEX_DATASET_ID, ttl=RESULTS_TTL)
+
+#the plot and PPI callbacks run as background jobs in processes started by the manager, the requests of the
+#browser only poll them so a long job doesn't hit the gunicorn timeout. A new query cancels the running job
+background_callback_manager = DiskcacheManager(diskcache.Cache(os.path.join(CACHE_DIR, "jobs")))
+#steps reported by the progress bar of update_plot: violins, tests, pie plots
+PLOT_STEPS = 3
+
+app = Dash(__name__, background_callback_manager=background_callback_manager)          #create the dash app fist 
 server = app.server
 app.title = "GTexVisualizer "
 
+@server.route("/stats")
+def server_stats():
+    #counters of the caches, of the sessions store and of the upstream requests, all shared by the workers and their background jobs
+    return flask.jsonify({"expression_cache": expression_cache.stats(), "string_cache": string_cache.stats(), "layout_cache": layout_cache.stats(), "sessions": sessions.cache.stats(), "http": http.stats()})
+
 app_dash_layout_args = [
             
         html.H1("GTexVisualizer: a platform for ageing studies",  
@@ -119,7 +166,7 @@ app_dash_layout_args = [
                 
                     children = [
                         html.Label("Select a gene: ", style={'backgroundColor': bg, 'color': txt_color}),
-                        dcc.Dropdown(list(all_genes_dict.keys()), list(all_genes_dict.keys())[0], id='genes_dd', multi = True, style={'color': 'black', 'border': '3px solid #ff7300'}),#multi=True
+                        dcc.Dropdown([default_gene], default_gene, id='genes_dd', multi = True, style={'color': 'black', 'border': '3px solid #ff7300'}),#multi=True
                         html.A("Gene info", id = "ensembl-gene-link", href='', target="_blank",style={"position": "absolute", 'backgroundColor': bg, "left": "150px", "top": "10%", 'color': "blue", 'width': "20%"}),
 
                     ],
@@ -143,6 +190,14 @@ app_dash_layout_args = [
                     ],
                     style={'width': '100%', 'display': 'inline-block'}
         ),
+        html.Div(
+                
+                    children = [
+                        html.Label("Violins: ", style={'backgroundColor': bg, 'color': txt_color}),
+                        dcc.RadioItems(violin_modes, violin_modes[0], id='violin_mode_radio', inline=True, style={'display': 'inline-block'})
+                    ],
+                    style={'width': '100%', 'display': 'inline-block'}
+        ),
         html.Div(
                 [       
                     html.Button(
@@ -219,6 +274,7 @@ app_dash_layout_args = [
         style={"position": "absolute", 'backgroundColor': bg, "left": "0%", "top": "140%",  'color': txt_color, 'width': "100%", 'height': '45%'},
         ),
         html.A("See this PPI with STRING", id = "ppi-string-link", href='', target="_blank",style={"position": "absolute", 'backgroundColor': 'rgb(17, 17, 17)', "left": "50%", "top": "130%",  'color': 'white', 'width': "45%"}),
+        html.Progress(id="ppi-progress", value="0", max="2", style={"position": "absolute", "left": "80%", "top": "130%", "visibility": "hidden"}),
 
         #add save data and save plot for ppi 
         html.Div(
@@ -237,6 +293,7 @@ app_dash_layout_args = [
                            'border-radius': '3px', 'background-color': 'rgb(31, 24, 252)', 'color': 'white', 'font-size': '12px',
                            'font-family': 'Open Sans', 'width': "200px", 'height': '40px', 'border': '3px solid #ff7300'}
         ),
+        html.Progress(id="plot-progress", value="0", max=str(PLOT_STEPS), style={"position": "absolute", "left": "220px", "top": "36%", "visibility": "hidden"}),
         html.Div(
                 [       
                     html.Button(
@@ -254,15 +311,30 @@ app_dash_layout_args = [
 
         html.Div(
             [
-                html.Label(prec_table_title, id="table_title"),
-                dash_table.DataTable(data = [{"": "Anova", "f_value": "None", "p_value": "None"}, {"": "Kruskal", "f_value": "None", "p_value": "None"}, {"": "Shapiro", "f_value": "None", "p_value": "None"}],  export_format="csv",
-                                     columns = [{"name": name, "id": name} for name in prec_table.columns], id='anova_table', style_header={'backgroundColor': 'rgb(30, 30, 30)','color': 'white'},
+                html.Label(sessions.defaults["plot"]["table_title"], id="table_title"),
+                dash_table.DataTable(data = empty_table,  export_format="csv",
+                                     columns = [{"name": name, "id": name} for name in table_columns], id='anova_table', style_header={'backgroundColor': 'rgb(30, 30, 30)','color': 'white'},
                                      style_data={'backgroundColor': 'rgb(50, 50, 50)', 'color': 'white'})
             ],  
             style={"position": "absolute", "left": "0px", "top": "120%", 
                                             'backgroundColor': bg, 'color': txt_color, 'width': '45%', 'height': '5%', 'display': 'inline-block'}
         ),
 
+        html.Div(
+            [
+                html.Label("Rank genes by Anova and Kruskal tests (precomputed for all the genes): ", style={'backgroundColor': bg, 'color': txt_color}),
+                dcc.Dropdown(all_tissues[1:], all_tissues[1], id='rank_tissues_dd', style={'color': 'black', 'border': '3px solid #ff7300'}),
+                dcc.Dropdown(list(GROUPINGS.keys()), "Group by Age", id='rank_filters_dd', style={'color': 'black', 'border': '3px solid #ff7300'}),
+                dcc.Dropdown(RANK_COLUMNS, "kruskal_p", id='rank_order_dd', style={'color': 'black', 'border': '3px solid #ff7300'}),
+                dcc.Input(id='rank_gene_input', placeholder="Gene symbol starts with...", debounce=True, style={'width': '30%'}),
+                html.Label("", id="rank_table_title"),
+                dash_table.DataTable(data = [], columns = [{"name": name, "id": name} for name in ["gene", "gencode_id", "n", "anova_f", "anova_p", "kruskal_h", "kruskal_p"]],
+                                     id='rank_table', page_size=20, sort_action="native", filter_action="native", export_format="csv",
+                                     style_header={'backgroundColor': 'rgb(30, 30, 30)','color': 'white'}, style_data={'backgroundColor': 'rgb(50, 50, 50)', 'color': 'white'})
+            ],
+            style={"position": "absolute", "left": "0px", "top": "220%", 'backgroundColor': bg, 'color': txt_color, 'width': '100%', 'display': 'inline-block'}
+        ),
+
         html.Div([
             html.Span('Contributors', className='contributors'),
             html.Ul([
@@ -274,55 +346,78 @@ app_dash_layout_args = [
             ]),
             ],
             className="footer",
-            style={"position": "absolute", "left": "0px", "top": "220%", 'width': '100%'}
+            style={"position": "absolute", "left": "0px", "top": "300%", 'width': '100%'}
         )
     ]    
 
-app.layout = html.Div(
-        app_dash_layout_args,
+def serve_layout():
+    #called for each page load: a new session id, the session storage keeps the first one of the tab across reloads
+    return html.Div(
+        app_dash_layout_args + [dcc.Store(id="session-id", storage_type="session", data=uuid.uuid4().hex), dcc.Store(id="violin-zoom", data={"y_maxima": [], "x_units": 1})],
         style = {'border': '0px', 'backgroundColor': 'white', 'background-size': '100%', 'position': 'absolute',
                 'width': '100%', 'height': '100%', 'margin': '0px'}
 )
+
+app.layout = serve_layout
   
+@app.callback(
+    Output("genes_dd", "options"),
+    Input("genes_dd", "search_value"),
+    State("genes_dd", "value")
+)
+def search_genes(search_value, selected):
+    #server side search, the layout only ships the selected genes instead of all the ~60k symbols
+
+    if selected is None:
+        selected = []
+    elif isinstance(selected, str):
+        selected = [selected]
+    options = [{"label": gene, "value": gene} for gene in selected]
+    if search_value:
+        #"search" keeps the trigram and id matches visible, the dropdown filters options client side by that text
+        options += [{"label": gene, "value": gene, "search": "{} {}".format(search_value, gene)} for gene in gene_index.search(search_value) if gene not in selected]
+    return options
+
+@app.callback(
+    Output("rank_table", "data"),
+    Output("rank_table_title", "children"),
+    Input("rank_tissues_dd", "value"),
+    Input("rank_filters_dd", "value"),
+    Input("rank_order_dd", "value"),
+    Input("rank_gene_input", "value")
+)
+def rank_genes(tissue, filters, order_by, gene_query):
+    #only reads the local table, no GTex request
+
+    if gene_stats_table is None:
+        return [], "Run precompute_stats.py to rank the genes"
+    if not tissue or not filters or not order_by:
+        return [], ""
+    rows = gene_stats_table.rank(tissue, filters, order_by, gene_query or "")
+    return rows, "Top {} genes of {} by {} ({})".format(len(rows), tissue, order_by, filters)
+
+def download_name(gene_names, tissues, filters):
+
+    genes_str = gene_names if isinstance(gene_names, str) else "".join(gene_names)
+    tissues_str = tissues.replace("[", "").replace("]", "").replace("'", "") if isinstance(tissues, str) else "".join(tissues)
+    return "{}_{}_{}".format(genes_str, tissues_str, filters.replace(" ", ""))
+
 @app.callback(
     Output("download-plots", "data"),
     Input('download-plots-button', 'n_clicks'),
     State('filters_dd', 'value'),
     State('genes_dd', 'value'),
     State('tissues_dd', 'value'),
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
-def download_plots(download_n_clicks, filters, gene_names, tissues):
-
-    global max_download_n_clicks
-    global curr_violin
+def download_plots(download_n_clicks, filters, gene_names, tissues, session_id):
 
-    if download_n_clicks > max_download_n_clicks:
-        max_download_n_clicks = download_n_clicks
-                
-        if isinstance(tissues, str):
-            if isinstance(gene_names, str):
-                curr_violin.write_html("./assets/plots/{}_{}_{}_violin.html".format(gene_names, tissues.replace("[", "").replace("]", "").replace("'", ""), filters.replace(" ", "")))
-                send_violin = dcc.send_file("./assets/plots/{}_{}_{}_violin.html".format(gene_names, tissues.replace("[", "").replace("]", "").replace("'", ""), filters.replace(" ", "")))
-            else:
-                genes_str = ""
-                for gene in gene_names:
-                    genes_str+=gene
-                curr_violin.write_html("./assets/plots/{}_{}_{}_violin.html".format(genes_str, tissues.replace("[", "").replace("]", "").replace("'", ""), filters.replace(" ", "")))
-                send_violin = dcc.send_file("./assets/plots/{}_{}_{}_violin.html".format(genes_str, tissues.replace("[", "").replace("]", "").replace("'", ""), filters.replace(" ", "")))
-        else:
-            tissues_str = ""
-            for tissue in tissues:
-                tissues_str+=tissue
-            if isinstance(gene_names, str):
-                curr_violin.write_html("./assets/plots/{}_{}_{}_violin.html".format(gene_names, tissues_str, filters.replace(" ", "")))
-                send_violin = dcc.send_file("./assets/plots/{}_{}_{}_violin.html".format(gene_names, tissues_str, filters.replace(" ", "")))
-            else:
-                genes_str = ""
-                for gene in gene_names:
-                    genes_str+=gene
-                curr_violin.write_html("./assets/plots/{}_{}_{}_violin.html".format(genes_str, tissues_str, filters.replace(" ", "")))
-                send_violin = dcc.send_file("./assets/plots/{}_{}_{}_violin.html".format(genes_str, tissues_str, filters.replace(" ", "")))
+    session = sessions.session(session_id)
+    if download_n_clicks > session.get("download_plots_clicks"):
+        session.set("download_plots_clicks", download_n_clicks)
+        #sent from memory, no file shared with the other sessions
+        send_violin = dcc.send_string(load_figure(session.get("plot")["violin"]).to_html(), "{}_violin.html".format(download_name(gene_names, tissues, filters)))
         #no download pie plots for now, the user can download them as png image
         return send_violin
 
@@ -333,140 +428,62 @@ def download_plots(download_n_clicks, filters, gene_names, tissues):
     State('filters_dd', 'value'),
     State('genes_dd', 'value'),
     State('tissues_dd', 'value'),
+    State('session-id', 'data'),
     prevent_initial_call=True
 )
-def download_data(download_n_clicks, filters, gene_names, tissues):
-
-    global max_download_data_n_clicks
-   
+def download_data(download_n_clicks, filters, gene_names, tissues, session_id):
 
-    if download_n_clicks > max_download_data_n_clicks:
-        max_download_data_n_clicks = download_n_clicks
-        
-        if isinstance(tissues, str):
-            if isinstance(gene_names, str):
-                with open("./assets/data/{}_{}_{}_data.txt".format(gene_names, tissues.replace("[", "").replace("]", "").replace("'", ""), filters.replace(" ", "")), 'w') as f:
-                    f.write(curr_data.to_string())
-                send_data = dcc.send_file("./assets/data/{}_{}_{}_data.txt".format(gene_names, tissues.replace("[", "").replace("]", "").replace("'", ""), filters.replace(" ", "")))
-            else:
-                genes_str = ""
-                for gene in gene_names:
-                    genes_str+=gene
-                with open("./assets/data/{}_{}_{}_data.txt".format(genes_str, tissues.replace("[", "").replace("]", "").replace("'", ""), filters.replace(" ", "")), 'w') as f:
-                    f.write(curr_data.to_string())
-                send_data = dcc.send_file("./assets/data/{}_{}_{}_data.txt".format(genes_str, tissues.replace("[", "").replace("]", "").replace("'", ""), filters.replace(" ", "")))
-        else:
-            tissues_str = ""
-            for tissue in tissues:
-                tissues_str+=tissue
-            if isinstance(gene_names, str):
-                with open("./assets/data/{}_{}_{}_data.txt".format(gene_names, tissues_str, filters.replace(" ", "")), 'w') as f:
-                    f.write(curr_data.to_string())
-                send_data = dcc.send_file("./assets/data/{}_{}_{}_data.txt".format(gene_names, tissues_str, filters.replace(" ", "")))
-            else:
-                genes_str = ""
-                for gene in gene_names:
-                    genes_str+=gene
-                with open("./assets/data/{}_{}_{}_data.txt".format(genes_str, tissues_str, filters.replace(" ", "")), 'w') as f:
-                    f.write(curr_data.to_string())
-                send_data = dcc.send_file("./assets/data/{}_{}_{}_data.txt".format(genes_str, tissues_str, filters.replace(" ", "")))
+    session = sessions.session(session_id)
+    if download_n_clicks > session.get("download_data_clicks"):
+        session.set("download_data_clicks", download_n_clicks)
+        data = session.get("plot")["data"]
+        send_data = dcc.send_string(data.to_string() if data is not None else "", "{}_data.txt".format(download_name(gene_names, tissues, filters)))
         return send_data
 
-def single_dd_values_handler(x_range, filters, gene_name, tissue, gencode_id):
+def plot_result(fig_violin, fig_pie, table_title, table, hidden, y_maxima = None, data = None, x_units = 1):
+    """
+    Parameters:
+        x_units: float, x axis units of one x position of the violin figure (X_UNITS for the summary violins)
+    Returns:
+        result: dict, outputs of update_plot as stored in the session and in the results cache (figures as plotly JSON)
+    """
+    return {"violin": fig_violin.to_plotly_json(), "pie": fig_pie.to_plotly_json(), "table_title": table_title, "table": table,
+            "hidden": hidden, "y_maxima": y_maxima or [], "x_units": x_units, "data": data}
+
+def plot_outputs(result):
+
+    #the rangeslider zoom needs the maxima and the x scale of the positions
+    zoom = {"y_maxima": result["y_maxima"], "x_units": result.get("x_units", 1)}
+    return result["violin"], result["pie"], result["table_title"], result["table"], result["hidden"], zoom
+
+#violin plots of a single tissue by filter: plot function, expression attribute subsets it reads, Anova and Kruskal between its violins
+single_tissue_plots = {"No filters": (plot_by_gene_and_tissue, [None], False),
+                       "Group by Gender": (plot_by_gene_and_gender_and_tissue, ["sex"], True),
+                       "Group by Age": (plot_by_gene_and_tissue_and_age, ["ageBracket"], True),
+                       "Group by Gender and Age": (plot_by_gene_tissue_age_and_gender, ["sex", "ageBracket"], True)}
+
+def single_dd_values_handler(set_progress, filters, gene_name, tissue, gencode_id, summary = False):
     
-    global fig_prec_violin 
-    global fig_prec_pie
-    global fig_prec_ppi
-    global prec_table_title
-    global prec_table
-    global prec_href 
-    global prec_gene 
-    global prec_tissue 
-    global prec_filter 
-    global prec_xrange
-    global curr_violin
-    global curr_fvalue_shapiro
-    global curr_pvalue_shapiro
-    global curr_data
-
     table_title = "Anova, Kruskal and Shapiro analysis results for: Gene '{}', Tissue '{}' and Plot by '{}'".format(gene_name, tissue, filters)
-    prec_table_title = table_title
+    data = None
+    y_maxima = []
+    x_units = X_UNITS if summary else 1
+    set_progress(("1", str(PLOT_STEPS)))
+    #the fetches of the violin and pie plots run concurrently, the plots are built as soon as their data is there
+    graph = fetch_graph()
     if tissue == "All":
                   
         print("Creating violin plots")
+        hidden1 = False
         if filters == "No filters":
 
-            fig_violin, curr_data = plot_by_gene(gencode_id, gene_name)
-            hidden1 = False
-                
-            ys = [fig_violin.data[i]["y"] for i in range(len(fig_violin.data))]
-            ys_shapiro = [elem for y in ys for elem in y]
-            shapiro_test = stats.shapiro(ys_shapiro)
-            fvalue_shapiro = shapiro_test.statistic
-            pvalue_shapiro = shapiro_test.pvalue
-            curr_fvalue_shapiro = fvalue_shapiro
-            curr_pvalue_shapiro = pvalue_shapiro
-
-            y_range = get_current_y_range(x_range, ys)
-            x_range_real = [prec_xrange[0]-0.5, prec_xrange[1]+0.5]
-            fig_prec_violin.update_layout(xaxis = {'autorange': False, 'range': x_range_real, 'uirevision': True, 'rangeslider': {'autorange': True, 'range': prec_xrange}}, yaxis = {'autorange': False, 'range': y_range})
-
-            fvalue_anova, pvalue_anova = stats.f_oneway(ys[0], ys[1], ys[2], ys[3], ys[4], ys[5], ys[6], ys[7], ys[8], ys[9], ys[10],
-                                                ys[11], ys[12], ys[13], ys[14], ys[15], ys[16], ys[17], ys[18], ys[19], ys[20],
-                                                ys[21], ys[22], ys[23], ys[24], ys[25], ys[26], ys[27], ys[28], ys[29], ys[30],
-                                                ys[31], ys[32], ys[33], ys[34], ys[35], ys[36], ys[37], ys[38], ys[39], ys[40],
-                                                ys[41], ys[42], ys[43], ys[44], ys[45], ys[46], ys[47], ys[48], ys[49], ys[50],
-                                                ys[51], ys[52], ys[53])
-            fvalue_kruskal, pvalue_kruskal = stats.kruskal(ys[0], ys[1], ys[2], ys[3], ys[4], ys[5], ys[6], ys[7], ys[8], ys[9], ys[10],
-                                                ys[11], ys[12], ys[13], ys[14], ys[15], ys[16], ys[17], ys[18], ys[19], ys[20],
-                                                ys[21], ys[22], ys[23], ys[24], ys[25], ys[26], ys[27], ys[28], ys[29], ys[30],
-                                                ys[31], ys[32], ys[33], ys[34], ys[35], ys[36], ys[37], ys[38], ys[39], ys[40],
-                                                ys[41], ys[42], ys[43], ys[44], ys[45], ys[46], ys[47], ys[48], ys[49], ys[50],
-                                                ys[51], ys[52], ys[53])
-            df = pd.DataFrame([["Anova", fvalue_anova, pvalue_anova], ["Kruskal", fvalue_kruskal, pvalue_kruskal], ["Shapiro", fvalue_shapiro, pvalue_shapiro]], columns = ["", "f_value", "p_value"])
-            dict_data = df.to_dict('records')
+            graph.add("violin", lambda records: plot_by_gene(gencode_id, gene_name, summary, groups=expression_groups(records)), add_expression_fetch(graph, gencode_id))
+            per_position = 1
 
         elif filters == "Group by Gender":
                         
-            fig_violin, curr_data = plot_by_gene_and_gender(gencode_id, gene_name)
-            hidden1 = False
-                
-            ys = [fig_violin.data[i]["y"] for i in range(len(fig_violin.data))]
-            y_range = get_current_y_range(x_range, ys)
-            x_range_real = [prec_xrange[0]-0.5, prec_xrange[1]+0.5]
-            fig_prec_violin.update_layout(xaxis = {'autorange': False, 'range': x_range_real, 'uirevision': True, 'rangeslider': {'autorange': True, 'range': prec_xrange}}, yaxis = {'autorange': False, 'range': y_range})
-            ys_shapiro = [elem for y in ys for elem in y]
-            shapiro_test = stats.shapiro(ys_shapiro)
-            fvalue_shapiro = shapiro_test.statistic
-            pvalue_shapiro = shapiro_test.pvalue
-            curr_fvalue_shapiro = fvalue_shapiro
-            curr_pvalue_shapiro = pvalue_shapiro
-
-            fvalue_anova, pvalue_anova = stats.f_oneway(ys[0], ys[1], ys[2], ys[3], ys[4], ys[5], ys[6], ys[7], ys[8], ys[9], ys[10],
-                                                ys[11], ys[12], ys[13], ys[14], ys[15], ys[16], ys[17], ys[18], ys[19], ys[20],
-                                                ys[21], ys[22], ys[23], ys[24], ys[25], ys[26], ys[27], ys[28], ys[29], ys[30],
-                                                ys[31], ys[32], ys[33], ys[34], ys[35], ys[36], ys[37], ys[38], ys[39], ys[40],
-                                                ys[41], ys[42], ys[43], ys[44], ys[45], ys[46], ys[47], ys[48], ys[49], ys[50],
-                                                ys[51], ys[52], ys[53], ys[54], ys[55], ys[56], ys[57], ys[58], ys[59], ys[60],
-                                                ys[61], ys[62], ys[63], ys[64], ys[65], ys[66], ys[67], ys[68], ys[69], ys[70],
-                                                ys[71], ys[72], ys[73], ys[74], ys[75], ys[76], ys[77], ys[78], ys[79], ys[80],
-                                                ys[81], ys[82], ys[83], ys[84], ys[85], ys[86], ys[87], ys[88], ys[89], ys[90],
-                                                ys[91], ys[92], ys[93], ys[94], ys[95], ys[96], ys[97], ys[98], ys[99], ys[100],
-                                                ys[101], ys[102], ys[103], ys[104], ys[105], ys[106], ys[107])
-            fvalue_kruskal, pvalue_kruskal = stats.kruskal(ys[0], ys[1], ys[2], ys[3], ys[4], ys[5], ys[6], ys[7], ys[8], ys[9], ys[10],
-                                                ys[11], ys[12], ys[13], ys[14], ys[15], ys[16], ys[17], ys[18], ys[19], ys[20],
-                                                ys[21], ys[22], ys[23], ys[24], ys[25], ys[26], ys[27], ys[28], ys[29], ys[30],
-                                                ys[31], ys[32], ys[33], ys[34], ys[35], ys[36], ys[37], ys[38], ys[39], ys[40],
-                                                ys[41], ys[42], ys[43], ys[44], ys[45], ys[46], ys[47], ys[48], ys[49], ys[50],
-                                                ys[51], ys[52], ys[53], ys[54], ys[55], ys[56], ys[57], ys[58], ys[59], ys[60],
-                                                ys[61], ys[62], ys[63], ys[64], ys[65], ys[66], ys[67], ys[68], ys[69], ys[70],
-                                                ys[71], ys[72], ys[73], ys[74], ys[75], ys[76], ys[77], ys[78], ys[79], ys[80],
-                                                ys[81], ys[82], ys[83], ys[84], ys[85], ys[86], ys[87], ys[88], ys[89], ys[90],
-                                                ys[91], ys[92], ys[93], ys[94], ys[95], ys[96], ys[97], ys[98], ys[99], ys[100],
-                                                ys[101], ys[102], ys[103], ys[104], ys[105], ys[106], ys[107])
-                
-            df = pd.DataFrame([["Anova", fvalue_anova, pvalue_anova], ["Kruskal", fvalue_kruskal, pvalue_kruskal], ["Shapiro", curr_fvalue_shapiro, curr_pvalue_shapiro]], columns = ["", "f_value", "p_value"])
-            dict_data = df.to_dict('records')
+            graph.add("violin", lambda records: plot_by_gene_and_gender(gencode_id, gene_name, summary, groups=expression_groups(records)), add_expression_fetch(graph, gencode_id, "sex"))
+            per_position = len(all_genders)
 
         else:
 
@@ -474,207 +491,130 @@ def single_dd_values_handler(x_range, filters, gene_name, tissue, gencode_id):
             fig_violin = empty_figure(error, 'red')
             hidden1 = True
             table_title += "Can't compute" 
-            prec_table_title = table_title
-               
-            df = pd.DataFrame([["Anova", "None", "None"], ["Kruskal", "None", "None"], ["Shapiro", "None", "None"]], columns = ["", "f_value", "p_value"])
-            dict_data = df.to_dict('records')
-
-        fig_violin.update_layout(xaxis = {'rangeslider': {'visible':False}})
-        curr_violin = fig_violin
-        fig_prec_violin = fig_violin
-        prec_table = dict_data 
-           
+            dict_data = empty_table
 
         print("Creating pie plots")
-        #if tissue != prec_tissue:
-            #fig_pie = plot_gene_data(gencode_id, gene_name)
-        fig_pie = empty_figure("Pie plots not implemented for tissue == All", "red")
-        #else:
-            #fig_pie = fig_prec_pie
-            
-        if gene_name != prec_gene:
-            print("Changed gene {} -> {}".format(prec_gene, gene_name))
-            prec_gene = gene_name 
-        if tissue != prec_tissue:
-            print("Changed tissue {} -> {}".format(prec_tissue, tissue))
-            prec_tissue = tissue 
-            if filters != prec_filter:
-                print("Changed filter {} -> {}".format(prec_filter, filters))
-                prec_filter = filters 
-
-            #print("Returning figures: ", fig_violin, fig_pie)
-            fig_prec_pie = fig_pie
-            
-        return fig_violin, fig_pie, table_title, dict_data, hidden1
+        graph.add("pie", lambda counts: plot_gene_data(gencode_id, gene_name, counts), add_samples_counts(graph, gencode_id, all_tissues))
+        if not hidden1:
+            fig_violin, data, ys = graph.result("violin")
+            set_progress(("2", str(PLOT_STEPS)))
+            y_maxima = violin_y_maxima(ys, per_position)
+            dict_data = stats_table(ys)
+
+        fig_violin.update_layout(xaxis = {'rangeslider': {'visible':False}})
                 
     else:
                     
         print("Creating violin plots")
         hidden1 = True
-
-        if filters == "No filters":
-                
-            fig_violin, curr_data = plot_by_gene_and_tissue(gencode_id, gene_name, tissue)
-            prec_xrange = [0, 1]
-            ys = [fig_violin.data[i]["y"] for i in range(len(fig_violin.data))]
-            ys_shapiro = [elem for y in ys for elem in y]
-            shapiro_test = stats.shapiro(ys_shapiro)
-            fvalue_shapiro = shapiro_test.statistic
-            pvalue_shapiro = shapiro_test.pvalue
-            curr_fvalue_shapiro = fvalue_shapiro
-            curr_pvalue_shapiro = pvalue_shapiro
-            df = pd.DataFrame([["Anova", "None", "None"], ["Kruskal", "None", "None"], ["Shapiro", fvalue_shapiro, pvalue_shapiro]], columns = ["", "f_value", "p_value"])
-            dict_data = df.to_dict('records')            
-            
-        elif filters == "Group by Gender":
-
-            fig_violin, curr_data = plot_by_gene_and_gender_and_tissue(gencode_id, gene_name, tissue)
-            prec_xrange = [0, 1]
-            ys = [fig_violin.data[i]["y"] for i in range(len(fig_violin.data))]
-            fvalue_anova, pvalue_anova = stats.f_oneway(ys[0], ys[1])
-            fvalue_kruskal, pvalue_kruskal = stats.kruskal(ys[0], ys[1])
-            ys_shapiro = [elem for y in ys for elem in y]
-            shapiro_test = stats.shapiro(ys_shapiro)
-            fvalue_shapiro = shapiro_test.statistic
-            pvalue_shapiro = shapiro_test.pvalue
-            curr_fvalue_shapiro = fvalue_shapiro
-            curr_pvalue_shapiro = pvalue_shapiro
-            df = pd.DataFrame([["Anova", fvalue_anova, pvalue_anova], ["Kruskal", fvalue_kruskal, pvalue_kruskal], ["Shapiro", curr_fvalue_shapiro, curr_pvalue_shapiro]], columns = ["", "f_value", "p_value"])
-            dict_data = df.to_dict('records')
-            
-        elif filters == "Group by Age":
-
-            fig_violin, curr_data = plot_by_gene_and_tissue_and_age(gencode_id, gene_name, tissue)
-            prec_xrange = [0, 1]
-            ys = [fig_violin.data[i]["y"] for i in range(len(fig_violin.data))]
-            fvalue_anova, pvalue_anova = stats.f_oneway(ys[0], ys[1], ys[2], ys[3], ys[4])
-            fvalue_kruskal, pvalue_kruskal = stats.kruskal(ys[0], ys[1], ys[2], ys[3], ys[4])
-            ys_shapiro = [elem for y in ys for elem in y]
-            shapiro_test = stats.shapiro(ys_shapiro)
-            fvalue_shapiro = shapiro_test.statistic
-            pvalue_shapiro = shapiro_test.pvalue
-            curr_fvalue_shapiro = fvalue_shapiro
-            curr_pvalue_shapiro = pvalue_shapiro
-            df = pd.DataFrame([["Anova", fvalue_anova, pvalue_anova], ["Kruskal", fvalue_kruskal, pvalue_kruskal], ["Shapiro", curr_fvalue_shapiro, curr_pvalue_shapiro]], columns = ["", "f_value", "p_value"])
-            dict_data = df.to_dict('records')
-                        
-        else: #"Group by Gender and Age"
-
-            fig_violin, curr_data = plot_by_gene_tissue_age_and_gender(gencode_id, gene_name, tissue)
-            prec_xrange = [0, 1]
-            ys = [fig_violin.data[i]["y"] for i in range(len(fig_violin.data))]
-            fvalue_anova, pvalue_anova = stats.f_oneway(ys[0], ys[1], ys[2], ys[3], ys[4], ys[5], ys[6], ys[7], ys[8], ys[9])
-            fvalue_kruskal, pvalue_kruskal = stats.kruskal(ys[0], ys[1], ys[2], ys[3], ys[4], ys[5], ys[6], ys[7], ys[8], ys[9])
-            ys_shapiro = [elem for y in ys for elem in y]
-            shapiro_test = stats.shapiro(ys_shapiro)
-            fvalue_shapiro = shapiro_test.statistic
-            pvalue_shapiro = shapiro_test.pvalue
-            curr_fvalue_shapiro = fvalue_shapiro
-            curr_pvalue_shapiro = pvalue_shapiro
-            df = pd.DataFrame([["Anova", fvalue_anova, pvalue_anova], ["Kruskal", fvalue_kruskal, pvalue_kruskal], ["Shapiro", curr_fvalue_shapiro, curr_pvalue_shapiro]], columns = ["", "f_value", "p_value"])
-            dict_data = df.to_dict('records')
-           
-        fig_prec_violin = fig_violin
-        curr_violin = fig_violin
-        prec_table = dict_data 
-        
-
-        if filters != prec_filter:
-            print("Changed filter {} -> {}".format(prec_filter, filters))
-            prec_filter = filters 
-
+        plot, attribute_subsets, between_groups = single_tissue_plots[filters]
+        graph.add("violin", lambda *records: plot(gencode_id, gene_name, tissue, groups=expression_groups(*records)), *[add_expression_fetch(graph, gencode_id, subset) for subset in attribute_subsets])
         print("Creating pie plots")
-        if gene_name != prec_gene or tissue != prec_tissue:
-            print(gencode_id, gene_name, tissue)
-            if gene_name != prec_gene:
-                print("Changed gene name {} -> {}".format(prec_gene, gene_name))
-                prec_gene = gene_name 
-            if tissue != prec_tissue:
-                print("Changed tissue {} -> {}".format(prec_tissue, tissue))
-                prec_tissue = tissue 
-            #fig_pie = plot_gene_tissue_data(gencode_id, gene_name, tissue) 
-            #fig_prec_pie = fig_pie
-            #print("Returing figures ", fig_violin, fig_pie)
-                    
-        #else:
-             
-            #print("Returning figures ", fig_violin, fig_prec_pie)
-
-        fig_pie = plot_gene_tissue_data(gencode_id, gene_name, tissue) 
-        fig_prec_pie = fig_pie
-        return fig_violin, fig_pie, table_title, dict_data, hidden1
+        graph.add("pie", lambda counts: plot_gene_tissue_data(gencode_id, gene_name, tissue, counts), add_samples_counts(graph, gencode_id, [tissue]))
+        fig_violin, data, ys = graph.result("violin")
+        set_progress(("2", str(PLOT_STEPS)))
+        dict_data = stats_table(ys, between_groups)
+
+    set_progress(("3", str(PLOT_STEPS)))
+    fig_pie = graph.result("pie")
+    return plot_result(fig_violin, fig_pie, table_title, dict_data, hidden1, y_maxima, data, x_units)
            
 
-def multi_dd_values_handler(x_range, filters, gene_name, tissue, gencode_id):
-
-    global fig_prec_violin 
-    global fig_prec_pie
-    global fig_prec_ppi
-    global prec_table_title
-    global prec_table
-    global prec_href 
-    global prec_gene 
-    global prec_tissue 
-    global prec_filter 
-    global prec_xrange
-    global curr_violin
-    global curr_fvalue_shapiro
-    global curr_pvalue_shapiro
-    global curr_data 
+def multi_dd_values_handler(set_progress, filters, gene_name, tissue, gencode_id):
 
     table_title = "Anova, Kruskal and Shapiro analysis results for: Gene '{}', Tissue '{}' and Plot by '{}'".format(gene_name, tissue, filters)
-    prec_table_title = table_title
 
     if filters == "No filters":
         
+        set_progress(("1", str(PLOT_STEPS)))
+        #expression of the genes fetched concurrently
+        graph = fetch_graph()
+        genes = list(dict.fromkeys(gencode_id))
+        fetches = [add_expression_fetch(graph, gene) for gene in genes]
         if isinstance(gene_name, str):
             
             gene_name = gene_name[0]
-            hidden1 = True        
-            fig_violin, curr_data = multi_tissues_violin_plot(gencode_id, gene_name, tissue)
-            fig_prec_violin = fig_violin 
-            prec_xrange = [0, 1]
-            ys = [fig_violin.data[i]["y"] for i in range(len(fig_violin.data))]
-            ys_shapiro = [elem for y in ys for elem in y]
-            shapiro_test = stats.shapiro(ys_shapiro)
-            fvalue_shapiro = shapiro_test.statistic
-            pvalue_shapiro = shapiro_test.pvalue
-            curr_fvalue_shapiro = fvalue_shapiro
-            curr_pvalue_shapiro = pvalue_shapiro
-            table_title = "Multiple tissues selected, Only Shapiro is supported"
-            prec_table_title = table_title 
-            df = pd.DataFrame([["Anova", "None", "None"], ["Kruskal", "None", "None"], ["Shapiro", fvalue_shapiro, pvalue_shapiro]], columns = ["", "f_value", "p_value"])
-            dict_data = df.to_dict('records')         
+            graph.add("violin", lambda records: multi_tissues_violin_plot(gencode_id, gene_name, tissue, groups=expression_groups(records)), *fetches)
             fig_pie = empty_figure("Pie plot doesn't support multiple tissues selection.", "red")
-            fig_prec_pie = fig_pie
-            curr_violin = fig_violin
-            return fig_violin, fig_pie, table_title, dict_data, hidden1
         
         else:
 
-            hidden1 = True
-            fig_violin, curr_data = multi_genes_violin_plot(gencode_id, gene_name, tissue)
-            fig_prec_violin = fig_violin 
-            prec_xrange = [0, 1]
-            ys = [fig_violin.data[i]["y"] for i in range(len(fig_violin.data))]
-            ys_shapiro = [elem for y in ys for elem in y]
-            shapiro_test = stats.shapiro(ys_shapiro)
-            fvalue_shapiro = shapiro_test.statistic
-            pvalue_shapiro = shapiro_test.pvalue
-            curr_fvalue_shapiro = fvalue_shapiro
-            curr_pvalue_shapiro = pvalue_shapiro
-            table_title = "Multiple tissues and Genes selected, Only Shapiro is supported"
-            prec_table_title = table_title 
-            df = pd.DataFrame([["Anova", "None", "None"], ["Kruskal", "None", "None"], ["Shapiro", fvalue_shapiro, pvalue_shapiro]], columns = ["", "f_value", "p_value"])
-            dict_data = df.to_dict('records')         
+            graph.add("violin", lambda *records: multi_genes_violin_plot(gencode_id, gene_name, tissue, groups={gene: expression_groups(gene_records) for gene, gene_records in zip(genes, records)}), *fetches)
             fig_pie = empty_figure("Pie plot doesn't support multiple tissues and genes selection.", "red") 
-            fig_prec_pie = fig_pie
-            curr_violin = fig_violin
-            return fig_violin, fig_pie, table_title, dict_data, hidden1
+
+        fig_violin, data, ys = graph.result("violin")
+        set_progress(("2", str(PLOT_STEPS)))
+        dict_data = stats_table(ys)
+        return plot_result(fig_violin, fig_pie, table_title, dict_data, True, data=data)
         
     else:
-        return fig_prec_violin, fig_prec_pie, prec_table_title, prec_table, True #to change
+        return None #to change, the plots of the session are kept
+
+
+def network_name(gene_name):
+
+    if isinstance(gene_name, list) and len(gene_name) == 1:
+        return gene_name[0]
+    return gene_name
+
+def ppi_network(gene_name):
+    """
+    STRING network of the selected genes, with the selected proteins in green.
+
+    Returns:
+        G: networkx Graph, None if the genes don't transcribe for any protein
+        href: str, link to the network on the STRING website
+        href_gene: str, link to the Ensembl page of the (last) gene
+    """
+    genes = gene_name if isinstance(gene_name, list) else [gene_name]
+    identifiers = {}
+    for gene in genes:
+        gencode_id = get_gencode_id_from_gene_name(gene).split(".")[0]
+        try:
+            protein_id = gene_index.protein_id(gencode_id)
+        except KeyError:
+            protein_id = ""
+        #the ENSP id is only used when STRING doesn't know the gene name
+        identifiers[gene] = [gene, protein_id]
+
+    final_G = request_genes_network(identifiers)
+    href_gene = "http://www.ensembl.org/Homo_sapiens/Gene/Summary?db=core;g={}".format(gencode_id)
+    if final_G is None:
+        return None, "", href_gene
+    node_colors = {node: ("green" if selected else "blue") for node, selected in final_G.nodes(data="selected")}
+    nx.set_node_attributes(final_G, node_colors, "color")
+    return final_G, get_url_string(gene_name), href_gene
+
+def ppi_figure(G, gene_name, method, title):
+    """
+    Plot of the network G colored by method, the output of the method is set as the "output" node attribute.
+
+    Parameters:
+        method: str, None for the first plot of the network (green selected proteins), "None", "with_labels" or a method of methods.py
+        title: str, title of the first plot of the network
+    """
+    if method is None:
+        return visualize_network(G, color_by = 'color', size_by = 'color', title = title, layout = "spring_layout")
+
+    if method == "with_labels":
+        return visualize_network(G, color_by = 'color', size_by = 'color', title = "{} Protein - Protein Interaction Network".format(network_name(gene_name)), layout = "spring_layout", with_labels = True)
+
+    prec_title = title.split("with")[0].rstrip()
+    if method == "None":
+        return visualize_network(G, color_by = 'color', size_by = 'color', title = prec_title + " with method {} ".format(method),layout = "spring_layout")
+
+    method_to_call = getattr(methods, method)
+    if method == "spectral_clustering":
+        A = nx.adjacency_matrix(G)
+        output = method_to_call(A, list(G.nodes(data=False).keys()))
+    else:
+        output = method_to_call(G)
+
+    nx.set_node_attributes(G, output, "output")
 
+    if "centrality" in method:
+        return visualize_network(G, color_by = 'output', size_by = None, title = prec_title + " with method {} ".format(method),layout = "spring_layout", size_scale=100)
+    return visualize_network(G, color_by = 'output', size_by = None, title = prec_title + " with method {} ".format(method),layout = "spring_layout")
 
 @app.callback(
 
@@ -685,140 +625,77 @@ def multi_dd_values_handler(x_range, filters, gene_name, tissue, gencode_id):
     Input('methods_dd', 'value'), 
     Input('plot-button', 'n_clicks'), 
 
-    State('genes_dd', 'value')
+    State('genes_dd', 'value'),
+    State('session-id', 'data'),
+
+    background=True,
+    progress=[Output("ppi-progress", "value"), Output("ppi-progress", "max")],
+    running=[(Output("ppi-progress", "style"), {"visibility": "visible"}, {"visibility": "hidden"})]
 )
-def update_ppi_plot(method, n_clicks, gene_name):
+def update_ppi_plot(set_progress, method, n_clicks, gene_name, session_id):
     
-    global fig_prec_ppi
-    global curr_G 
-    global prec_gene 
-    global prec_href 
-    global prec_method
-    global prec_href_gene 
-
-    if gene_name != prec_gene:
-        
-        #prec_gene = gene_name 
-        print("Creating PPI network plot")
-        prec_gene = gene_name 
-        protein_name = gene_name
-        gencode_ids = []
-        if isinstance(gene_name, list):
-            for gene in gene_name:
-                gencode_id = get_gencode_id_from_gene_name(gene)
-                gencode_id = gencode_id.split(".")[0]
-                gencode_ids.append(gencode_id)
-            protein_list = protein_name    
-            Gs = []
-
-            for i, protein in enumerate(protein_list):
-               
-                gencode_id = gencode_ids[i]
-                G = request_protein_interactions_network([protein])
-        
-                if G is None:
-
-                    protein_id = ensembl_gene_protein_mapping[gencode_id]
-                    G = request_protein_interactions_network([protein_id])
-                
-                    if G is not None:
-                        Gs.append(G)
-                else:
-                    Gs.append(G)
-
-            if len(Gs)>=2:
-                final_G = nx.compose_all(Gs)
-            elif len(Gs) == 1:
-                final_G = Gs[0]
-            else: 
-                final_G = None
-        elif isinstance(protein_name,str):
-            protein_list = [protein_name]
-            gencode_id = get_gencode_id_from_gene_name(gene_name)
-            gencode_id = gencode_id.split(".")[0]
-            
-            final_G = request_protein_interactions_network(protein_list)
-        
-            if final_G is None:
-
-                protein_id = ensembl_gene_protein_mapping[gencode_id]
-                final_G = request_protein_interactions_network([protein_id])
-
-        curr_G = final_G 
-        href_gene = "http://www.ensembl.org/Homo_sapiens/Gene/Summary?db=core;g={}".format(gencode_id)
-        prec_href_gene = href_gene
-        if final_G is not None:#TO DO: check if method  != None 
-            node_colors = {node: ("green" if node in protein_list else "blue") for node in final_G.nodes}
-            nx.set_node_attributes(final_G, node_colors, "color")
-            if isinstance(gene_name, list):
-                if len(gene_name) == 1:
-                    temp_gene_name = gene_name[0]
-                else:
-                    temp_gene_name = gene_name
-
-            fig_ppi = visualize_network(final_G, color_by = 'color', size_by = 'color', title = "{} Protein - Protein Interaction Network".format(temp_gene_name), layout = "spring_layout")
-                         
-            href = get_url_string(gene_name)
-
+    #the "ppi" entry of the session (query and network together, evicted together) is only written by this
+    #callback, it can run in parallel with update_plot
+    session = sessions.session(session_id)
+    state = session.get("ppi")
+    new_gene = gene_name != state["gene"]
+
+    if not new_gene and method == state["method"]: #nothing changed
+
+        return state["ppi"], state["ppi_href"], state["gene_href"]
+
+    #a new network is plotted with the selected proteins in green, the method is applied by the next method change
+    key = "ppi|{}|{}".format(gene_name, None if new_gene else method)
+    result = results_cache_get(key)
+    if result is None:
+
+        set_progress(("1", "2"))
+        if new_gene:
+            print("Creating PPI network plot")
+            try:
+                G, href, href_gene = ppi_network(gene_name)
+            except (requests.HTTPError, requests.ConnectionError) as e:
+                #nothing is cached or stored in the session, the next click retries
+                print("STRING request failed:", e)
+                return empty_figure("Cannot create a PPI: STRING is not reachable, retry later.", "red").to_plotly_json(), "", ""
+            title = "{} Protein - Protein Interaction Network".format(network_name(gene_name)) if G is not None else "Cannot create a PPI. Gene {} doens't transcribe for any protein.".format(gene_name)
         else:
-            fig_ppi = empty_figure("Cannot create a PPI. Gene {} doens't transcribe for any protein.".format(gene_name), "red")
-            href = ""
-           
-        fig_prec_ppi = fig_ppi
-        prec_href = href
-        prec_method = "None"
-        return fig_ppi, href, href_gene 
-
-    else: #gene not changed
-
-        if method != prec_method:
-            prec_method = method
-            prec_title = fig_prec_ppi.layout.title.text.split("with")[0].rstrip()          
             print("Updating ppi plot with method ", method)
-            if curr_G is not None:
-               
-                if method == "with_labels":
-
-                    if len(gene_name) == 1:
-                        temp_gene_name = gene_name[0]
-                    else:
-                        temp_gene_name = gene_name
-                    fig_ppi = visualize_network(curr_G, color_by = 'color', size_by = 'color', title = "{} Protein - Protein Interaction Network".format(temp_gene_name), layout = "spring_layout", with_labels = True)
-                    fig_prec_ppi = fig_ppi
-                    return fig_ppi, prec_href, prec_href_gene
-                
-                elif method != "None":
-                   
-                    method_to_call = getattr(methods, method)
-
-                    if method == "spectral_clustering":
-                        A = nx.adjacency_matrix(curr_G)
-                        output = method_to_call(A, list(curr_G.nodes(data=False).keys()))
-                    else:
-                        output = method_to_call(curr_G)
+            G, href, href_gene, title = state["ppi_graph"], state["ppi_href"], state["gene_href"], state["ppi_title"]
         
-                    nx.set_node_attributes(curr_G, output, "output")
-
-                    if "centrality" in method:
-                        fig_ppi = visualize_network(curr_G, color_by = 'output', size_by = None, title = prec_title + " with method {} ".format(method),layout = "spring_layout", size_scale=100)
-                    else:
-                        fig_ppi = visualize_network(curr_G, color_by = 'output', size_by = None, title = prec_title + " with method {} ".format(method),layout = "spring_layout")
-                    fig_prec_ppi = fig_ppi
-                    return fig_ppi, prec_href, prec_href_gene
-
-                else:#method None
-                    
-                    fig_ppi = visualize_network(curr_G, color_by = 'color', size_by = 'color', title = prec_title + " with method {} ".format(method),layout = "spring_layout")
-                    fig_prec_ppi = fig_ppi
-                    return fig_ppi, prec_href, prec_href_gene
-            
-            else:#curr_G None
-                
-                return fig_prec_ppi, "", prec_href_gene #fig_prec_ppi in this case is an error figure: empty figure with red title containing the error
-        
-        else: #method not changed
-           
-            return fig_prec_ppi, prec_href, prec_href_gene
+        set_progress(("2", "2"))
+        if G is not None:
+            fig_ppi = ppi_figure(G, gene_name, None if new_gene else method, title)
+        elif new_gene:
+            fig_ppi = empty_figure(title, "red")
+        else: #the ppi figure in this case is an error figure: empty figure with red title containing the error
+            fig_ppi = load_figure(state["ppi"])
+
+        result = {"ppi": fig_ppi.to_plotly_json(), "ppi_graph": G, "ppi_title": title, "ppi_href": href, "gene_href": href_gene}
+        results_cache_set(key, result)
+
+    session.set("ppi", dict(result, gene=gene_name, method="None" if new_gene else method))
+    return result["ppi"], result["ppi_href"], result["gene_href"]
+
+app.clientside_callback(
+    #rangeslider zoom in the browser: only the axes ranges are sent to the figure, no server request
+    """
+    function(x_range, zoom) {
+        if (!zoom || !zoom.y_maxima.length || x_range[0] == x_range[1]) {
+            return window.dash_clientside.no_update;
+        }
+        const y_max = Math.max(...zoom.y_maxima.slice(x_range[0], x_range[1] + 1));
+        return new window.dash_clientside.Patch()
+            .merge(["layout", "xaxis"], {autorange: false, range: [(x_range[0] - 0.5) * zoom.x_units, (x_range[1] + 0.5) * zoom.x_units]})
+            .merge(["layout", "yaxis"], {autorange: false, range: [-0.1, y_max + 0.1]})
+            .build();
+    }
+    """,
+    Output("fig-violin", "figure", allow_duplicate=True),
+    Input("rangeslider-1", "value"),
+    State("violin-zoom", "data"),
+    prevent_initial_call=True
+)
 
 @app.callback(
 
@@ -827,124 +704,84 @@ def update_ppi_plot(method, n_clicks, gene_name):
     Output("table_title", "children"),
     Output("anova_table", "data"),
     Output("slider-conteiner-1", "hidden"),
+    Output("violin-zoom", "data"),
 
     Input('plot-button', 'n_clicks'), 
-    Input("rangeslider-1", "value"),
 
     State('filters_dd', 'value'),
     State('genes_dd', 'value'),
-    State('tissues_dd', 'value')
+    State('tissues_dd', 'value'),
+    State('violin_mode_radio', 'value'),
+    State('session-id', 'data'),
 
+    background=True,
+    progress=[Output("plot-progress", "value"), Output("plot-progress", "max")],
+    running=[(Output("plot-progress", "style"), {"visibility": "visible"}, {"visibility": "hidden"})]
 )
-def update_plot(n_clicks, x_range, filters, gene_name, tissue):
-
-    global fig_prec_violin 
-    global fig_prec_pie
-    global fig_prec_ppi
-    global prec_table_title
-    global prec_table
-    global prec_href 
-    global prec_gene 
-    global prec_tissue 
-    global prec_filter 
-    global prec_xrange
-    global curr_violin
-    global curr_fvalue_shapiro
-    global curr_pvalue_shapiro
-    global curr_data 
+def update_plot(set_progress, n_clicks, filters, gene_name, tissue, violin_mode, session_id):
+
+    #the "plot" entry of the session (query and results together, evicted together) is only written by this callback
+    session = sessions.session(session_id)
 
     if isinstance(gene_name, str):
         gene_name = gene_name.replace("[", "").replace("]", "").split(",")
 
+    error = None
     for gene in gene_name:
-        if gene not in list(all_genes_dict.keys()):
-            
+        if gene not in gene_index:
             error = "Gene {} not in supported genes".format(gene_name)
-            error_fig = empty_figure(error, "red")
-            curr_violin = error_fig
-            fig_prec_violin = error_fig
-            fig_prec_pie = error_fig
-            return error_fig, error_fig, error, prec_table, False #change prec table with table with Nones
     
     if isinstance(tissue, str):
         tissue = tissue.replace("[", "").replace("]", "").split(",")
     
     for t in tissue:
-        if t not in all_tissues:
-         
+        if t not in all_tissues and error is None:
             error = "Tissue {} not in supported tissues".format(tissue)
-            error_fig = empty_figure(error, "red")
-            curr_violin = error_fig
-            fig_prec_violin = error_fig
-            fig_prec_pie = error_fig
-            return error_fig, error_fig, error, prec_table, False
 
-    if filters not in all_filters:
+    if filters not in all_filters and error is None:
         error = "Filter {} not in supported filters".format(filters)
+
+    if error is not None:
         error_fig = empty_figure(error, "red")
-        curr_violin = error_fig
-        fig_prec_violin = error_fig
-        fig_prec_pie = error_fig
-        return error_fig, error_fig, error, prec_table, False
-
-    if prec_xrange != x_range:
-        prec_xrange = x_range
-        if x_range[0] == x_range[1]:
-             curr_violin = fig_prec_violin
-             return fig_prec_violin, fig_prec_pie, prec_table_title, prec_table, False
-
-        print("Setting x_range ", x_range) 
-        if fig_prec_violin is not None:
-            if prec_tissue == "All":
-
-                y_all = [fig_prec_violin.data[i]["y"] for i in range(len(fig_prec_violin.data))]
-                y_range = get_current_y_range(x_range, y_all)
-                print("Setting y_range ", y_range)
-                x_range_real = [x_range[0]-0.5, x_range[1]+0.5]
-                fig_prec_violin.update_layout(xaxis = {'autorange': False, 'range': x_range_real, 'uirevision': True, 'rangeslider': {'autorange': True, 'range': x_range}}, yaxis = {'autorange': False, 'range': y_range})
-                curr_violin = fig_prec_violin
-                return fig_prec_violin, fig_prec_pie, prec_table_title, prec_table, False
-            
+        result = plot_result(error_fig, error_fig, error, session.get("plot")["table"], False) #change prec table with table with Nones
+        session.set("plot", dict(result, query=None))
+        return plot_outputs(result)
+
     print("Clicked {}, {}, {}".format(gene_name, tissue, filters))
     if gene_name is None:
-        gene_name = all_genes_dict.keys()[0]
+        gene_name = default_gene
     if tissue is None:
         tissue = all_tissues[0]
     if filters is None:
         filters = all_filters[0]
 
-    gencode_id = []
-    for gene in gene_name:
-        gencode_id.append(get_gencode_id_from_gene_name(gene))
-    table_title = "Anova, Kruskal and Shapiro analysis results for: Gene '{}', Tissue '{}' and Filter '{}'".format(gene_name, tissue, filters)
-    prec_table_title = table_title
-    if gene_name != prec_gene or tissue != prec_tissue or filters != prec_filter:
-        print("Changed gene name or tissue or filter")
-        if len(tissue) == 1 and len(gene_name) == 1:
-            print("Single tissue and gene")
-            tissue = tissue[0]
-            gene_name = gene_name[0]
-            gencode_id = gencode_id[0]
-            prec_tissue = tissue
-            fig_violin, fig_pie, table_title, dict_data, hidden1 = single_dd_values_handler(x_range, filters, gene_name, tissue, gencode_id)
-            return  fig_violin, fig_pie, table_title, dict_data, hidden1 
-        else:
-            print("List of tissues or list of genes")
-            fig_violin, fig_pie, table_title, dict_data, hidden1 = multi_dd_values_handler(x_range, filters, gene_name, tissue, gencode_id)
-            return  fig_violin, fig_pie, table_title, dict_data, hidden1 
-    else:
+    plot = session.get("plot")
+    query = [gene_name, tissue, filters, violin_mode]
+    if query != plot["query"]:
+        print("Changed gene name or tissue or filter or violin mode")
+        key = "plot|{}|{}|{}|{}".format(gene_name, tissue, filters, violin_mode)
+        result = results_cache_get(key)
+        if result is None:
+            gencode_id = []
+            for gene in gene_name:
+                gencode_id.append(get_gencode_id_from_gene_name(gene))
+            if len(tissue) == 1 and len(gene_name) == 1:
+                print("Single tissue and gene")
+                result = single_dd_values_handler(set_progress, filters, gene_name[0], tissue[0], gencode_id[0], violin_mode == "Summary")
+            else:
+                print("List of tissues or list of genes")
+                result = multi_dd_values_handler(set_progress, filters, gene_name, tissue, gencode_id)
+            if result is not None:
+                results_cache_set(key, result)
+        #the query is stored with its figures, a failed request is computed again at the next click
+        if result is not None:
+            plot = dict(result, query=query)
+            session.set("plot", plot)
 
+    else:
         print("gencode and tissue and filters not changed")
-        if prec_tissue == "All":
-            if prec_filter == "No filters":
-                hidden1 = False
-            elif prec_filter == "Group by Gender":
-                hidden1 = False
-            else: 
-                hidden1 = True
-        else:
-            hidden1 = True
-        return fig_prec_violin, fig_prec_pie, prec_table_title, prec_table, hidden1
+
+    return plot_outputs(plot)
 
 if __name__ == "__main__":
 
@@ -17,6 +17,7 @@ import networkx as nx
 from make_plots import *
 import methods
 import scipy.stats as stats
+from gene_index import GeneIndex
 
 all_methods = ["None", "betweenness_centrality", "closeness_centrality", "degree_centrality", "eigenvector_centrality", "community_louvain", "community_leiden", "spectral_clustering"] # "community_girvan_newmann"
 all_tissues = ['All', 'Adipose_Subcutaneous', 'Adipose_Visceral_Omentum', 'Adrenal_Gland',
@@ -38,12 +39,8 @@ all_tissues = ['All', 'Adipose_Subcutaneous', 'Adipose_Visceral_Omentum', 'Adren
  'Skin_Sun_Exposed_Lower_leg', 'Small_Intestine_Terminal_Ileum', 'Spleen',
  'Stomach', 'Testis', 'Thyroid', 'Uterus', 'Vagina', 'Whole_Blood']
 
-with open('all_genes_dict.txt', 'r') as f:
-    data = f.readline()
-    all_genes_dict = dict(eval(str(data)))
-
-with open("ENSG_to_ENSP.txt", "r") as f:
-    ensembl_gene_protein_mapping = dict(eval(f.read()))
+#gene symbols, gencode ids and ENSP ids of all_genes_dict.txt and ENSG_to_ENSP.txt, as in app.py
+gene_index = GeneIndex()
 
 all_filters = ["No filters", "Divide by Gender", "Divide by Age", "Divide by Gender and Age"]
 all_ages = ["20-29", "30-39", "40-49", "50-59", "60-69", "70-79"]
@@ -67,7 +64,7 @@ def get_current_y_range(x_range, y_all):
 
 def get_gencode_id_from_gene_name(gene_name):
 
-    gencode_id = all_genes_dict[gene_name]
+    gencode_id = gene_index[gene_name]
     return gencode_id 
 
 fig_prec_violin = empty_figure()
@@ -103,7 +100,7 @@ app_dash_layout_args = [
                 
                     children = [
                         html.Label("Select a gene: ", style={'backgroundColor': bg, 'color': txt_color}),
-                        dcc.Dropdown(list(all_genes_dict.keys()), list(all_genes_dict.keys())[0], id='genes_dd', style={'color': 'black', 'border': '3px solid #ff7300'}),#multi=True
+                        dcc.Dropdown(gene_index.symbols(), gene_index.symbols(1)[0], id='genes_dd', style={'color': 'black', 'border': '3px solid #ff7300'}),#multi=True
                         html.A("Gene info", id = "ensembl-gene-link", href='', target="_blank",style={"position": "absolute", 'backgroundColor': bg, "left": "150px", "top": "100px", 'color': "blue", 'width': "400px"}),
 
                     ],
@@ -302,7 +299,7 @@ def update_ppi_plot(method, n_clicks, gene_name):
         
         if G is None:
 
-            protein_id = ensembl_gene_protein_mapping[gencode_id]
+            protein_id = gene_index.protein_id(gencode_id)
             protein_list = [protein_id] 
             G = request_protein_interactions_network(protein_list)
 
@@ -397,7 +394,7 @@ def update_plot(n_clicks, x_range, filters, gene_name, tissue):
     global curr_fvalue_shapiro
     global curr_pvalue_shapiro
 
-    if gene_name not in list(all_genes_dict.keys()):
+    if gene_name not in gene_index:
         error = "Gene {} not in supported genes".format(gene_name)
         error_fig = empty_figure(error, "red")
         curr_violin = error_fig
@@ -441,7 +438,7 @@ def update_plot(n_clicks, x_range, filters, gene_name, tissue):
             
     print("Clicked {}, {}, {}".format(gene_name, tissue, filters))
     if gene_name is None:
-        gene_name = all_genes_dict.keys()[0]
+        gene_name = gene_index.symbols(1)[0]
     if tissue is None:
         tissue = all_tissues[0]
     if filters is None:
@@ -0,0 +1,109 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Anova, Kruskal-Wallis and Shapiro tests over any number of groups               *
+*                                                                                                           *
+*************************************************************************************************************
+
+The violin groups are stored as one ragged array: all the values concatenated (values) and the start of each
+group in it (offsets), so the per group sums are a single np.add.reduceat and the Kruskal ranks a single
+sort of all the samples, whatever the number of groups (54 tissues, 108 tissue x sex groups, ...).
+"""
+
+import numpy as np
+from scipy import stats
+
+def ragged(ys):
+    """
+    Parameters:
+        ys: list of arrays, the values of each group. Empty groups are dropped.
+    Returns:
+        values: float64 array, the concatenated values
+        offsets: int array, start of each group in values
+    """
+    ys = [np.asarray(y) for y in ys if len(y) > 0]
+    if not ys:
+        return np.empty(0), np.empty(0, dtype=np.int64)
+    sizes = np.array([len(y) for y in ys])
+    return np.concatenate(ys).astype(np.float64), np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+def group_sizes(values, offsets):
+
+    return np.diff(np.append(offsets, len(values)))
+
+def anova(values, offsets):
+    """
+    One way Anova, same result of scipy.stats.f_oneway(*groups).
+
+    Returns:
+        statistic, pvalue: float, None if there are less than 2 groups or no degrees of freedom within groups
+    """
+    k, n = len(offsets), len(values)
+    if k < 2 or n <= k:
+        return None, None
+    sizes = group_sizes(values, offsets)
+    #center on the grand mean to keep the sums of squares accurate
+    centered = values - values.mean()
+    sums = np.add.reduceat(centered, offsets)
+    ss_between = np.sum(sums**2 / sizes)
+    ss_within = np.sum(centered**2) - ss_between
+    if ss_within <= 0:
+        return None, None
+    f_value = (ss_between / (k - 1)) / (ss_within / (n - k))
+    return float(f_value), float(stats.f.sf(f_value, k - 1, n - k))
+
+def kruskal(values, offsets):
+    """
+    Kruskal-Wallis H test with tie correction, same result of scipy.stats.kruskal(*groups).
+
+    Returns:
+        statistic, pvalue: float, None if there are less than 2 groups or all the values are equal
+    """
+    k, n = len(offsets), len(values)
+    if k < 2:
+        return None, None
+    sizes = group_sizes(values, offsets)
+    #one sort gives both the average ranks and the sizes of the ties
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_values[1:] != sorted_values[:-1])))
+    ties = np.diff(np.append(starts, n)).astype(np.float64)
+    ranks = np.empty(n)
+    ranks[order] = np.repeat(starts + (ties + 1) / 2, ties.astype(np.int64))
+    rank_sums = np.add.reduceat(ranks, offsets)
+    h = 12.0 / (n * (n + 1)) * np.sum(rank_sums**2 / sizes) - 3 * (n + 1)
+    correction = 1 - np.sum(ties**3 - ties) / (n**3 - n)
+    if correction <= 0:
+        return None, None
+    h /= correction
+    return float(h), float(stats.chi2.sf(h, k - 1))
+
+def shapiro(values):
+    """
+    Shapiro-Wilk normality test of the pooled values.
+
+    Returns:
+        statistic, pvalue: float, None with less than 3 values
+    """
+    if len(values) < 3:
+        return None, None
+    result = stats.shapiro(values)
+    return float(result.statistic), float(result.pvalue)
+
+def group_tests(ys, between_groups = True):
+    """
+    Parameters:
+        ys: list of arrays, the values of each violin
+        between_groups: bool, default True. False to only test normality (a single group)
+    Returns:
+        results: dict {"Anova": (statistic, pvalue), "Kruskal": (statistic, pvalue), "Shapiro": (statistic, pvalue)}
+    """
+    values, offsets = ragged(ys)
+    results = {"Anova": (None, None), "Kruskal": (None, None)}
+    if between_groups:
+        results["Anova"] = anova(values, offsets)
+        results["Kruskal"] = kruskal(values, offsets)
+    results["Shapiro"] = shapiro(values)
+    return results
@@ -0,0 +1,334 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Benchmarks of the performance sensitive paths                                   *
+*                                                                                                           *
+*************************************************************************************************************
+
+Run all the benchmarks with `python benchmarks.py`, or some of them with `python benchmarks.py gene_index ...`
+No network access is needed.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+import numpy as np
+
+benchmarks = {}
+
+def benchmark(function):
+
+    benchmarks[function.__name__] = function
+    return function
+
+def best_time(function, repeat = 5):
+    """
+    Returns:
+        seconds: float, best wall time of repeat calls of function
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def report(name, seconds, baseline = None):
+
+    line = "    {:<45} {:>10.3f} ms".format(name, seconds*1000)
+    if baseline is not None:
+        line += "   ({:.1f}x)".format(baseline/seconds)
+    print(line)
+
+def synthetic_expression(subsets = (None, ), samples = 300, seed = 0):
+    """
+    Returns:
+        records: list of dict, GTex geneExpression "data" records for the 54 tissues and each subset group
+    """
+    from make_plots import all_tissues
+    rng = np.random.default_rng(seed)
+    return [{"tissueSiteDetailId": tissue, "subsetGroup": subset, "gencodeId": "ENSG00000000000.0", "unit": "TPM",
+             "data": rng.lognormal(2, 1, samples + int(rng.integers(0, samples))).round(3).tolist()}
+            for tissue in all_tissues for subset in subsets]
+
+@benchmark
+def gene_index():
+    """
+    Worker startup: eval() of the text dictionaries against opening the SQLite gene index, then 1000 lookups.
+    """
+    from gene_index import GeneIndex, build_gene_index_from_files
+
+    def eval_startup():
+        with open("all_genes_dict.txt", "r") as f:
+            all_genes_dict = dict(eval(str(f.readline())))
+        with open("ENSG_to_ENSP.txt", "r") as f:
+            mapping = dict(eval(f.read()))
+        return all_genes_dict, mapping
+
+    all_genes_dict, mapping = eval_startup()
+    symbols = list(all_genes_dict.keys())[::len(all_genes_dict)//1000][:1000]
+    path = os.path.join(tempfile.mkdtemp(), "gene_index.sqlite")
+    build_gene_index_from_files(output_file=path)
+
+    eval_time = best_time(eval_startup, repeat=3)
+    index_time = best_time(lambda: GeneIndex(path).symbols(1), repeat=3)
+    print("startup")
+    report("eval() of the text files", eval_time)
+    report("open GeneIndex", index_time, eval_time)
+
+    index = GeneIndex(path)
+    print("1000 membership checks + lookups")
+    report("list(all_genes_dict.keys())", best_time(lambda: [gene in list(all_genes_dict.keys()) and all_genes_dict[gene] for gene in symbols], repeat=1))
+    report("dict", best_time(lambda: [gene in all_genes_dict and all_genes_dict[gene] for gene in symbols]))
+    report("GeneIndex", best_time(lambda: [gene in index and index[gene] for gene in symbols]))
+
+@benchmark
+def expression_groups():
+    """
+    Extraction of the 54 tissues x 2 sex groups from a GTex response: chained boolean masks and float() boxing
+    per group against extract_expression_groups.
+    """
+    import pandas as pd
+    from make_plots import all_tissues, all_genders, extract_expression_groups
+
+    df = pd.DataFrame(synthetic_expression(all_genders))
+    tissues = np.unique(list(df["tissueSiteDetailId"]))
+    masks = lambda: {tissue: {gender: [float(elem) for elem in list(df["data"][df['tissueSiteDetailId'] == tissue][df['subsetGroup'] == gender].values[0])] for gender in all_genders} for tissue in tissues}
+    groups = lambda: extract_expression_groups(df)
+    baseline = best_time(masks, repeat=3)
+    report("boolean masks per group", baseline)
+    report("extract_expression_groups", best_time(groups), baseline)
+
+@benchmark
+def group_tests():
+    """
+    Anova and Kruskal over the 108 tissue x sex violins: scipy f_oneway/kruskal on the list of groups against
+    batch_stats on the ragged array.
+    """
+    from scipy import stats
+    import batch_stats
+    from make_plots import all_genders
+
+    ys = [np.asarray(record["data"], dtype=np.float32) for record in synthetic_expression(all_genders)]
+    scipy_tests = lambda: (stats.f_oneway(*ys), stats.kruskal(*ys))
+    batch_tests = lambda: (lambda values, offsets: (batch_stats.anova(values, offsets), batch_stats.kruskal(values, offsets)))(*batch_stats.ragged(ys))
+    baseline = best_time(scipy_tests)
+    report("scipy f_oneway + kruskal", baseline)
+    report("batch_stats anova + kruskal", best_time(batch_tests), baseline)
+
+@benchmark
+def violin_figures():
+    """
+    Build time of each violin figure: a validated fig.add_trace for each trace (as before fast_figure) against
+    the dict traces passed to fast_figure. The expression data is synthetic and fetched once.
+    """
+    import plotly.graph_objects as go
+    import make_plots
+
+    records = {None: synthetic_expression(), "sex": synthetic_expression(make_plots.all_genders)}
+
+    def add_trace_figure(traces, layout):
+        fig = go.Figure(layout=layout)
+        for trace in traces:
+            fig.add_trace(trace)
+        return fig
+
+    figures = {"plot_by_gene (54 violins)": lambda: make_plots.plot_by_gene("ENSG", "GENE"),
+               "plot_by_gene_and_gender (108 violins)": lambda: make_plots.plot_by_gene_and_gender("ENSG", "GENE"),
+               "multi_tissues_violin_plot (20 violins)": lambda: make_plots.multi_tissues_violin_plot("ENSG", "GENE", make_plots.all_tissues[:20]),
+               "multi_genes_violin_plot (40 violins)": lambda: make_plots.multi_genes_violin_plot(["ENSG1", "ENSG2"], ["GENE1", "GENE2"], make_plots.all_tissues[:20])}
+    #the patches are undone on exit, the next benchmarks see the real make_plots
+    with mock.patch.object(make_plots, "request_api_gene_expression_data", lambda gencode_id, attribute_subset = None: records[attribute_subset]):
+        for name, build in figures.items():
+            print(name)
+            with mock.patch.object(make_plots, "fast_figure", add_trace_figure):
+                baseline = best_time(build, repeat=3)
+            report("add_trace", baseline)
+            report("fast_figure", best_time(build), baseline)
+
+@benchmark
+def click_fetches():
+    """
+    Data of one Update Plots click on a single tissue grouped by gender and age, without the local sample table and
+    with 50 ms of latency for each GTex request: the violin fetches then the pie charts fetches in sequence (as
+    before the FetchGraph) against the graph of concurrent fetches.
+    """
+    import make_plots
+    from disk_cache import DiskCache
+
+    latency = 0.05
+    records = {None: synthetic_expression(), "sex": synthetic_expression(make_plots.all_genders), "ageBracket": synthetic_expression(make_plots.all_ages)}
+
+    def get_json(url):
+        time.sleep(latency)
+        if "attributeSubset=" in url:
+            return {"data": records[url.split("attributeSubset=")[1]]}
+        return {"data": records[None]} if "geneExpression" in url else {"data": [{}]*7}
+
+    gene, tissue = "ENSG00000000000.0", make_plots.all_tissues[0]
+
+    def sequential():
+        make_plots.plot_by_gene_tissue_age_and_gender(gene, "GENE", tissue)
+        make_plots.request_api_gene_expression_with_gender(gene)
+        make_plots.request_api_gene_expression_with_age(gene)
+        counts = {attribute: make_plots.request_api_sample_counts([tissue], attribute, values) for attribute, values in [("autolysisScore", make_plots.autolysis_scores), ("hardyScale", make_plots.deaths)]}
+        return counts
+
+    def graph():
+        graph = make_plots.fetch_graph()
+        graph.add("violin", lambda *records: make_plots.plot_by_gene_tissue_age_and_gender(gene, "GENE", tissue, groups=make_plots.expression_groups(*records)),
+                  make_plots.add_expression_fetch(graph, gene, "sex"), make_plots.add_expression_fetch(graph, gene, "ageBracket"))
+        counts = make_plots.add_samples_counts(graph, gene, [tissue])
+        return graph.result("violin"), graph.result(counts)
+
+    def empty_cache(fetch):
+        #every run starts from an empty expression cache, so the fetches are timed
+        def run():
+            with mock.patch.object(make_plots, "expression_cache", DiskCache(os.path.join(tempfile.mkdtemp(), "expression.sqlite"))):
+                return fetch()
+        return run
+
+    with mock.patch.object(make_plots, "get_json", get_json), mock.patch.object(make_plots, "sample_table", None):
+        baseline = best_time(empty_cache(sequential), repeat=3)
+        report("sequential fetches", baseline)
+        report("FetchGraph", best_time(empty_cache(graph), repeat=3), baseline)
+
+def synthetic_string_files(directory, proteins = 5000, links = 100, seed = 0):
+    """
+    Returns:
+        links_file, info_file: str, STRING protein.links.detailed and protein.info files of random links
+    """
+    import gzip
+    rng = np.random.default_rng(seed)
+    ids = ["9606.ENSP{:011d}".format(i) for i in range(proteins)]
+    info_file = os.path.join(directory, "protein.info.txt")
+    with open(info_file, "w") as f:
+        f.write("#string_protein_id\tpreferred_name\tprotein_size\tannotation\n")
+        f.writelines("{}\tGENE{}\t100\t-\n".format(protein, i) for i, protein in enumerate(ids))
+    sources = rng.integers(0, proteins, proteins*links//2)
+    targets = rng.integers(0, proteins, proteins*links//2)
+    pairs = np.unique(np.sort(np.stack([sources, targets], 1)[sources != targets], 1), axis=0)
+    scores = rng.integers(0, 1000, (len(pairs), 8))
+    links_file = os.path.join(directory, "protein.links.detailed.txt.gz")
+    with gzip.open(links_file, "wt") as f:
+        f.write("protein1 protein2 neighborhood fusion cooccurence coexpression experimental database textmining combined_score\n")
+        for (a, b), score in zip(pairs, scores):
+            line = " ".join(map(str, score))
+            f.write("{} {} {}\n{} {} {}\n".format(ids[a], ids[b], line, ids[b], ids[a], line))
+    return links_file, info_file
+
+@benchmark
+def string_network():
+    """
+    PPI networks from the local STRING store, on 5000 random proteins with 100 links each. There is no baseline
+    to run offline: the STRING API takes a network round trip (hundreds of ms) for each network.
+    """
+    from string_store import build_string_store, StringStore
+
+    directory = tempfile.mkdtemp()
+    build_string_store(*synthetic_string_files(directory), output_dir=directory)
+    report("open StringStore", best_time(lambda: StringStore(directory), repeat=3))
+    store = StringStore(directory)
+    for size in [1, 10, 100]:
+        names = ["GENE{}".format(i) for i in range(size)]
+        G = store.network(names, threshold=0)
+        report("network of {} proteins ({} nodes, {} edges)".format(size, G.number_of_nodes(), G.number_of_edges()), best_time(lambda: store.network(names)))
+
+def synthetic_string_response(links = 1000, seed = 0):
+    """
+    Returns:
+        lines: list of str, STRING network tsv-no-header response of random links between 1000 proteins
+    """
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(0, 1000, (links, 2))
+    scores = rng.integers(0, 1000, (links, 8)) / 1000
+    return ["9606.ENSP{0:011d}\t9606.ENSP{1:011d}\tGENE{0}\tGENE{1}\t9606\t{2}".format(a, b, "\t".join(map(str, score)))
+            for (a, b), score in zip(pairs.tolist(), scores.tolist())]
+
+@benchmark
+def string_response():
+    """
+    Parsing of a STRING network response: the previous parser rebuilt the graph after every line (quadratic),
+    the streaming parser filters the lines as they are read and builds the graph once.
+    """
+    import networkx as nx
+    from make_plots import parse_string_network, string_network_graph
+
+    def rebuild_per_line(lines, threshold = 0.4):
+        edgelist, weights = [], {}
+        for line in lines:
+            l = line.strip().split("\t")
+            n1, n2 = l[2], l[3]
+            experimental_score = float(l[10])
+            if experimental_score > threshold:
+                edgelist.append([n1, n2])
+                weights[(n1, n2)] = experimental_score
+            G = nx.from_edgelist(edgelist)
+            for (n1, n2), weight in weights.items():
+                G[n1][n2]['weight'] = weight
+        return G
+
+    def streaming(lines):
+        return string_network_graph(*parse_string_network(iter(lines)))
+
+    for links in [500, 2000, 100000]:
+        lines = synthetic_string_response(links)
+        seconds = best_time(lambda: streaming(lines), repeat=3)
+        baseline = best_time(lambda: rebuild_per_line(lines), repeat=1) if links <= 2000 else None
+        if baseline is not None:
+            report("rebuild per line, {} links".format(links), baseline)
+        report("streaming, {} links".format(links), seconds, baseline)
+
+@benchmark
+def network_layouts():
+    """
+    Layout of random scale free networks (2 links per new node, as the hubs of the PPI networks) by force_layout
+    against the networkx layouts, which are only run on the sizes they finish in reasonable time.
+    """
+    import networkx as nx
+    from force_layout import force_layout
+
+    for nodes in [100, 1000, 5000, 20000]:
+        G = nx.barabasi_albert_graph(nodes, 2, seed=0)
+        print("{} nodes, {} edges".format(nodes, G.number_of_edges()))
+        seconds = best_time(lambda: force_layout(G, seed=0), repeat=3 if nodes <= 5000 else 1)
+        spring = best_time(lambda: nx.spring_layout(G, seed=0), repeat=1) if nodes <= 2000 else None
+        if spring is not None:
+            report("nx.spring_layout", spring)
+        if nodes <= 500:
+            report("nx.kamada_kawai_layout", best_time(lambda: nx.kamada_kawai_layout(G), repeat=1))
+        report("force_layout", seconds, spring)
+        if nodes >= 5000:
+            #warm start from the layout of the network before 1% more nodes were added
+            pos = force_layout(G, seed=0)
+            H = G.copy()
+            H.add_edges_from((nodes + i, i) for i in range(nodes // 100))
+            report("force_layout warm start, 1% new nodes", best_time(lambda: force_layout(H, pos=pos, seed=0), repeat=3))
+
+@benchmark
+def network_figure():
+    """
+    visualize_network on precomputed positions (only the traces are built), colored by a string attribute as the
+    first PPI plot, for 1k to 50k edges: the time per edge should stay flat (above MAX_DRAWN_EDGES the edges are
+    thinned, so it drops).
+    """
+    import networkx as nx
+    from make_plots import visualize_network
+
+    for edges in [1000, 10000, 50000]:
+        G = nx.barabasi_albert_graph(edges // 2, 2, seed=0)
+        nx.set_node_attributes(G, {node: "green" if node < 10 else "blue" for node in G}, "color")
+        pos = {node: xy for node, xy in zip(G, np.random.default_rng(0).uniform(-1, 1, (len(G), 2)))}
+        seconds = best_time(lambda: visualize_network(G, color_by="color", size_by="color", layout=pos), repeat=3)
+        report("{} edges ({:.1f} us per edge)".format(G.number_of_edges(), seconds / G.number_of_edges() * 1e6), seconds)
+
+if __name__ == "__main__":
+
+    names = sys.argv[1:] or list(benchmarks.keys())
+    for name in names:
+        print("== {} ==".format(name))
+        benchmarks[name]()
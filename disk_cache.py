@@ -0,0 +1,172 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Persistent cache shared by all the server workers                               *
+*                                                                                                           *
+*************************************************************************************************************
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+#a get only updates the access time of an entry when the stored one is older than this, and each process adds
+#its hits and misses to the shared counters at most this often: a cache hit is normally a read only transaction
+ACCESS_RESOLUTION = 5
+
+class DiskCache:
+    """
+    Bounded key-value cache stored in a SQLite file. Values are zlib compressed bytes, the least recently used
+    entries are evicted when the total compressed size exceeds max_bytes, and entries written more than ttl
+    seconds ago expire. Being a single file on disk it is shared by every gunicorn worker (and thread) of the app.
+
+    Parameters:
+        path: str, path of the SQLite file, created if missing.
+        max_bytes: int, byte budget for the compressed values.
+        version: str, default None. Version of the cached data (e.g. the GTex dataset id), when it differs from
+                 the one stored in the file all the entries are dropped.
+        ttl: float, default None. Seconds after the set of an entry before it expires (so popular entries are
+             refreshed from upstream too), None to never expire.
+        idle_ttl: bool, default False. True to count ttl from the last get or set instead (e.g. sessions expire
+                  after ttl seconds of inactivity).
+    """
+
+    def __init__(self, path, max_bytes = 256*1024*1024, version = None, ttl = None, idle_ttl = False):
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.ttl = ttl
+        #column the ttl is counted from, the LRU eviction always uses accessed
+        self._expiry = "accessed" if idle_ttl else "written"
+        #an idle ttl needs access times precise at its own scale
+        self._resolution = min(ACCESS_RESOLUTION, ttl / 10) if idle_ttl and ttl is not None else ACCESS_RESOLUTION
+        self._local = threading.local()
+        #hits and misses of this process not yet added to the shared counters
+        self._counts_lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0}
+        self._counts_pid = os.getpid()
+        self._flushed = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL, written REAL)")
+            if "written" not in [column[1] for column in conn.execute("PRAGMA table_info(entries)")]:
+                #file of a previous version, its entries count as written when last used
+                conn.execute("ALTER TABLE entries ADD COLUMN written REAL")
+                conn.execute("UPDATE entries SET written = accessed")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_written ON entries (written)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('hits', '0'), ('misses', '0')")
+            row = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if version is not None and (row is None or row[0] != str(version)):
+                conn.execute("DELETE FROM entries")
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(version), ))
+
+    def _connection(self):
+        #one connection per process and thread, sqlite connections can't be shared after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """
+        Return the decompressed value stored for key, None if missing.
+        """
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, accessed, {} FROM entries WHERE key = ?".format(self._expiry), (key, )).fetchone()
+        if row is not None and self.ttl is not None and row[2] < now - self.ttl:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key, ))
+            row = None
+        if row is None:
+            self._count("misses", now)
+            return None
+        if row[1] < now - self._resolution:
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        self._count("hits", now)
+        return zlib.decompress(row[0])
+
+    def _count(self, name, now):
+
+        with self._counts_lock:
+            if self._counts_pid != os.getpid():
+                #counts inherited from the parent process, added to the shared counters by the parent
+                self._counts = {"hits": 0, "misses": 0}
+                self._counts_pid = os.getpid()
+                self._flushed = 0.0
+            self._counts[name] += 1
+            if now - self._flushed < ACCESS_RESOLUTION:
+                return
+        self.flush()
+
+    def flush(self):
+        """
+        Add the hits and misses of this process to the counters shared by all the workers.
+        """
+        with self._counts_lock:
+            counts = self._counts if self._counts_pid == os.getpid() else {"hits": 0, "misses": 0}
+            self._counts = {"hits": 0, "misses": 0}
+            self._counts_pid = os.getpid()
+            self._flushed = time.time()
+        if counts["hits"] or counts["misses"]:
+            self._connection().execute("UPDATE meta SET value = value + CASE name WHEN 'hits' THEN ? ELSE ? END WHERE name IN ('hits', 'misses')",
+                                       (counts["hits"], counts["misses"]))
+
+    def set(self, key, value):
+        """
+        Compress and store value (bytes) for key, then evict the least recently used entries over budget.
+        """
+        blob = zlib.compress(value, 6)
+        if len(blob) > self.max_bytes:
+            return
+        conn = self._connection()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO entries (key, value, size, accessed, written) VALUES (?, ?, ?, ?, ?)", (key, blob, len(blob), now, now))
+        self._evict(conn)
+
+    def _evict(self, conn):
+
+        if self.ttl is not None:
+            conn.execute("DELETE FROM entries WHERE {} < ?".format(self._expiry), (time.time() - self.ttl, ))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_delete = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((key, ))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+
+    def delete(self, key):
+
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key, ))
+
+    def clear(self):
+
+        self._connection().execute("DELETE FROM entries")
+
+    def stats(self):
+        """
+        Returns:
+            stats: dict, hits and misses counters (shared by all workers, each process adds its own every
+                   ACCESS_RESOLUTION seconds), number of entries and compressed bytes used.
+        """
+        self.flush()
+        conn = self._connection()
+        counters = dict(conn.execute("SELECT name, value FROM meta WHERE name IN ('hits', 'misses')").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": int(counters["hits"]), "misses": int(counters["misses"]), "entries": entries, "bytes": size, "max_bytes": self.max_bytes}
@@ -0,0 +1,193 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Offline expression store built from the GTex bulk files                         *
+*                                                                                                           *
+*************************************************************************************************************
+
+Local replacement of the /expression/geneExpression API for environments without (fast) access to
+gtexportal.org. Download from the GTex portal the gene TPM matrix (GCT), the sample attributes and the subject
+phenotypes files, then run once:
+
+    python expression_store.py gene_tpm.gct.gz SampleAttributesDS.txt SubjectPhenotypesDS.txt [output_dir]
+
+The output directory holds a gene-major float32 matrix (one contiguous row of all the samples for each gene,
+read through a memory map) with the samples sorted by tissue, and the sample -> tissue/sex/age index arrays.
+The samples table used by the pie charts (see sample_metadata.py) is written next to it.
+"""
+
+import gzip
+import json
+import os
+import sys
+import numpy as np
+from sample_metadata import save_sample_metadata
+
+GTEX_DATASET_ID = "gtex_v10"
+EXPRESSION_STORE_DIR = os.environ.get("GTEX_EXPRESSION_STORE", "expression_store")
+CHUNK_GENES = 512
+
+#codes of the GTex annotation files
+SEXES = {"1": "male", "2": "female"}
+HARDY_SCALE = {"0": "Ventilator case", "1": "Fast death - violent", "2": "Fast death - natural causes", "3": "Intermediate death", "4": "Slow death"}
+AUTOLYSIS_SCORE = {"0": "None", "1": "Mild", "2": "Moderate", "3": "Severe"}
+
+def open_text(path):
+
+    return gzip.open(path, "rt") if path.endswith(".gz") else open(path, "r")
+
+def read_table(path, columns):
+    """
+    Returns:
+        rows: list of dict {column: value} of a tab separated file with header, only the wanted columns
+    """
+    with open_text(path) as f:
+        header = f.readline().rstrip("\n").split("\t")
+        indexes = [header.index(column) if column in header else None for column in columns]
+        return [{column: (fields[i] if i is not None and i < len(fields) else "") for column, i in zip(columns, indexes)}
+                for fields in (line.rstrip("\n").split("\t") for line in f)]
+
+def tissue_site_detail_id(smtsd):
+    """
+    "Brain - Anterior cingulate cortex (BA24)" -> "Brain_Anterior_cingulate_cortex_BA24", as in the API
+    """
+    return smtsd.replace(" - ", "_").replace("(", "").replace(")", "").replace(" ", "_")
+
+def build_expression_store(gct_file, sample_attributes_file, subject_phenotypes_file, output_dir = EXPRESSION_STORE_DIR, dataset_id = GTEX_DATASET_ID):
+    """
+    Stream the GCT matrix into the gene-major memory-mapped store, CHUNK_GENES rows at a time.
+
+    Parameters:
+        gct_file: str, GTex gene TPM matrix (.gct or .gct.gz)
+        sample_attributes_file: str, GTex SampleAttributesDS.txt (SAMPID, SMTSD, SMATSSCR columns)
+        subject_phenotypes_file: str, GTex SubjectPhenotypesDS.txt (SUBJID, SEX, AGE, DTHHRDY columns)
+        output_dir: str, directory of the store
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    subjects = {row["SUBJID"]: row for row in read_table(subject_phenotypes_file, ["SUBJID", "SEX", "AGE", "DTHHRDY"])}
+    attributes = {}
+    for row in read_table(sample_attributes_file, ["SAMPID", "SMTSD", "SMATSSCR"]):
+        subject = subjects.get("-".join(row["SAMPID"].split("-")[:2]), {})
+        attributes[row["SAMPID"]] = {"sampleId": row["SAMPID"], "tissueSiteDetailId": tissue_site_detail_id(row["SMTSD"]),
+                                     "sex": SEXES.get(subject.get("SEX"), ""), "ageBracket": subject.get("AGE", ""),
+                                     "hardyScale": HARDY_SCALE.get(subject.get("DTHHRDY", "").split(".")[0], ""),
+                                     "autolysisScore": AUTOLYSIS_SCORE.get(row["SMATSSCR"].split(".")[0], "")}
+
+    with open_text(gct_file) as f:
+        f.readline() #version
+        n_genes = int(f.readline().split("\t")[0])
+        columns = f.readline().rstrip("\n").split("\t")[2:]
+        #keep the annotated samples, sorted by tissue so that every tissue is a contiguous slice of a gene row
+        keep = [i for i, sample in enumerate(columns) if sample in attributes and attributes[sample]["tissueSiteDetailId"]]
+        keep.sort(key=lambda i: (attributes[columns[i]]["tissueSiteDetailId"], columns[i]))
+        keep = np.array(keep)
+        samples = [attributes[columns[i]] for i in keep]
+
+        matrix = np.lib.format.open_memmap(os.path.join(output_dir, "expression.npy"), mode="w+", dtype=np.float32, shape=(n_genes, len(keep)))
+        genes = []
+        chunk = []
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            genes.append(fields[0])
+            chunk.append(np.array(fields[2:], dtype=np.float32)[keep])
+            if len(chunk) == CHUNK_GENES:
+                matrix[len(genes)-len(chunk):len(genes)] = chunk
+                chunk = []
+                print("Stored {}/{} genes".format(len(genes), n_genes))
+        if chunk:
+            matrix[len(genes)-len(chunk):len(genes)] = chunk
+        matrix.flush()
+        del matrix
+
+    index = {"sampleId": np.array([sample["sampleId"] for sample in samples])}
+    for column in ["tissueSiteDetailId", "sex", "ageBracket"]:
+        categories, codes = np.unique(np.array([sample[column] for sample in samples]), return_inverse=True)
+        index[column + "_categories"] = categories
+        index[column + "_codes"] = codes.astype(np.uint8)
+    np.savez(os.path.join(output_dir, "samples.npz"), **index)
+    np.save(os.path.join(output_dir, "genes.npy"), np.array(genes))
+    with open(os.path.join(output_dir, "meta.json"), "w") as f:
+        json.dump({"datasetId": dataset_id, "genes": len(genes), "samples": len(samples)}, f)
+    save_sample_metadata(samples, os.path.join(output_dir, "sample_metadata.npz"), dataset_id)
+    print("Saved {} genes x {} samples to {}".format(len(genes), len(samples), output_dir))
+
+class ExpressionStore:
+    """
+    Read side of the store, a drop-in source for request_api_gene_expression_data.
+
+    Parameters:
+        path: str, directory written by build_expression_store
+    """
+
+    def __init__(self, path = EXPRESSION_STORE_DIR):
+
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.dataset_id = json.load(f)["datasetId"]
+        self.matrix = np.load(os.path.join(path, "expression.npy"), mmap_mode="r")
+        genes = np.load(os.path.join(path, "genes.npy"))
+        #gencode ids with and without version, the versions of the app and of the GTex release can differ
+        self.rows = {gene.split(".")[0]: i for i, gene in enumerate(genes)}
+        self.rows.update({gene: i for i, gene in enumerate(genes)})
+        with np.load(os.path.join(path, "samples.npz")) as index:
+            tissues = index["tissueSiteDetailId_categories"]
+            tissue_codes = index["tissueSiteDetailId_codes"]
+            #samples are sorted by tissue: [start, end) of each tissue in a gene row
+            starts = np.searchsorted(tissue_codes, np.arange(len(tissues)), side="left")
+            ends = np.searchsorted(tissue_codes, np.arange(len(tissues)), side="right")
+            self.tissue_slices = {str(tissue): slice(int(start), int(end)) for tissue, start, end in zip(tissues, starts, ends)}
+            self.subsets = {"sex": (index["sex_categories"], index["sex_codes"]), "ageBracket": (index["ageBracket_categories"], index["ageBracket_codes"])}
+
+    def __contains__(self, gencode_id):
+
+        return gencode_id in self.rows or gencode_id.split(".")[0] in self.rows
+
+    def gene_expression_data(self, gencode_id, attribute_subset = None):
+        """
+        Same records as the "data" of the GTex geneExpression API, with float32 arrays as data.
+
+        Parameters:
+            gencode_id: str, gencode id of the gene
+            attribute_subset: str, default None. "sex" or "ageBracket"
+        Returns:
+            data: list of dict, one record for each tissue (and subset group)
+        """
+        row = self.rows.get(gencode_id, self.rows.get(gencode_id.split(".")[0]))
+        if row is None:
+            raise KeyError("Gene {} not in the expression store".format(gencode_id))
+        #one contiguous read of the gene over all the samples
+        values = np.array(self.matrix[row])
+        data = []
+        for tissue, tissue_slice in self.tissue_slices.items():
+            if attribute_subset is None:
+                data.append({"tissueSiteDetailId": tissue, "subsetGroup": None, "data": values[tissue_slice], "gencodeId": gencode_id, "unit": "TPM", "datasetId": self.dataset_id})
+                continue
+            categories, codes = self.subsets[attribute_subset]
+            tissue_codes = codes[tissue_slice]
+            #every group of every tissue, empty when the tissue has no sample of the group (e.g. female Testis) as in the API
+            for code, group in enumerate(categories):
+                mask = tissue_codes == code
+                if group:
+                    data.append({"tissueSiteDetailId": tissue, "subsetGroup": str(group), "data": values[tissue_slice][mask], "gencodeId": gencode_id, "unit": "TPM", "datasetId": self.dataset_id})
+        return data
+
+def load_expression_store(path = EXPRESSION_STORE_DIR, dataset_id = GTEX_DATASET_ID):
+    """
+    Returns:
+        store: ExpressionStore, None if the store was not built or belongs to another dataset.
+    """
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    store = ExpressionStore(path)
+    if store.dataset_id != dataset_id:
+        print("Ignoring {}: built for {} instead of {}".format(path, store.dataset_id, dataset_id))
+        return None
+    return store
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+    build_expression_store(*sys.argv[1:5])
@@ -0,0 +1,75 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Concurrent fetches of one Update Plots click                                    *
+*                                                                                                           *
+*************************************************************************************************************
+
+The data of a click (expression of each attribute subset, sample counts) is fetched by independent requests
+and the figures depend on some of them. A FetchGraph runs each task on a thread pool as soon as the tasks it
+depends on are done: independent requests overlap, so the latency of a click is the one of its slowest chain
+of requests instead of the sum of all of them, and a task added twice (e.g. the sex expression needed by the
+violins and by the pie charts) runs once.
+"""
+
+import threading
+from concurrent.futures import Future
+
+class FetchGraph:
+    """
+    Parameters:
+        pool: concurrent.futures.Executor running the tasks. Tasks never wait for each other on the pool, but
+              they may wait for requests sent on another pool, which must not be this one.
+    """
+
+    def __init__(self, pool):
+
+        self.pool = pool
+        self.futures = {}
+
+    def add(self, name, function, *dependencies):
+        """
+        Add the task name, a no-op if it was already added.
+
+        Parameters:
+            name: hashable, name of the task
+            function: callable, called with the results of the dependencies (in order) as arguments
+            dependencies: names of tasks already added
+        Returns:
+            future: concurrent.futures.Future of the result of the task. If a dependency fails the task fails
+                    with the same exception.
+        """
+        if name in self.futures:
+            return self.futures[name]
+        future = Future()
+        self.futures[name] = future
+        inputs = [self.futures[dependency] for dependency in dependencies]
+        remaining = [len(inputs)]
+        lock = threading.Lock()
+
+        def run():
+            try:
+                future.set_result(function(*[dependency.result() for dependency in inputs]))
+            except BaseException as e:
+                future.set_exception(e)
+
+        def dependency_done(_):
+            with lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                self.pool.submit(run)
+
+        if not inputs:
+            self.pool.submit(run)
+        for dependency in inputs:
+            dependency.add_done_callback(dependency_done)
+        return future
+
+    def result(self, name, timeout = None):
+        """
+        Wait for the task name and return its result (or raise its exception).
+        """
+        return self.futures[name].result(timeout)
@@ -0,0 +1,237 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Multilevel force-directed layout                                                *
+*                                                                                                           *
+*************************************************************************************************************
+
+Layout of the large networks composed by multi-gene selections, where nx.spring_layout (all pairs repulsion
+at every iteration) and nx.kamada_kawai_layout (all pairs shortest paths) take seconds to minutes.
+
+The graph is coarsened by heavy edge matching (the unmatched nodes join a matched neighbor, so stars collapse
+in one level) until it has COARSEST_NODES nodes, the coarsest graph is laid out with exact Fruchterman-Reingold
+forces, then the positions are copied to the nodes of each finer level and refined. Repulsion is exact up to
+EXACT_REPULSION_NODES nodes. Above that the pairs closer than CUTOFF optimal distances (found with a k-d
+tree) repel each other exactly and the farther nodes repel as the centers of mass of the cells of a fixed
+grid, so an iteration costs O(N log N) instead of O(N^2).
+All the forces are computed on arrays (scipy sparse adjacency, numpy edge lists), no Python loop over nodes.
+"""
+
+import time
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+
+LAYOUT_ITERATIONS = 50
+COARSEST_NODES = 50
+EXACT_REPULSION_NODES = 500
+#when the repulsion is not exact: exact repulsion of the nodes closer than CUTOFF optimal distances, the other
+#ones repel as the centers of mass of the cells of a GRID x GRID grid
+CUTOFF = 2
+GRID = 16
+FAR_FIELD_EVERY = 5
+MATCHING_ROUNDS = 3
+#coarsening stops when a level removes less than this fraction of the nodes
+MIN_COARSENING = 0.1
+#previous positions are reused when they cover at least this fraction of the nodes, and only refined
+WARM_START_FRACTION = 0.5
+WARM_START_ITERATIONS = 10
+
+def coarsen(A, rng):
+    """
+    One coarsening level: heavy edge matching (random ties) in MATCHING_ROUNDS vectorized rounds, then the
+    unmatched nodes join the group of a neighbor.
+
+    Parameters:
+        A: scipy csr matrix, symmetric weighted adjacency without self loops
+    Returns:
+        P: scipy csr matrix (nodes x groups), P[i, g] = 1 if node i belongs to group g
+    """
+    n = A.shape[0]
+    group = np.full(n, -1, dtype=np.int64)
+    coo = A.tocoo()
+    rows, cols, weights = coo.row.astype(np.int64), coo.col.astype(np.int64), coo.data
+    groups = 0
+    for _ in range(MATCHING_ROUNDS):
+        free = group < 0
+        keep = free[rows] & free[cols]
+        if not keep.any():
+            break
+        r, c = rows[keep], cols[keep]
+        score = weights[keep] * rng.random(len(r))
+        #heaviest free neighbor of each node: last edge of its row once sorted by score
+        order = np.lexsort((score, r))
+        r, c = r[order], c[order]
+        last = np.r_[r[1:] != r[:-1], True]
+        best = np.full(n, -1, dtype=np.int64)
+        best[r[last]] = c[last]
+        nodes = np.arange(n)
+        mutual = np.flatnonzero((best > nodes) & (best[np.maximum(best, 0)] == nodes))
+        group[mutual] = group[best[mutual]] = groups + np.arange(len(mutual))
+        groups += len(mutual)
+
+    #the unmatched nodes (e.g. the leaves of a hub) join the group of their heaviest matched neighbor
+    keep = (group[rows] < 0) & (group[cols] >= 0)
+    if keep.any():
+        r, c = rows[keep], cols[keep]
+        order = np.lexsort((weights[keep] * rng.random(len(r)), r))
+        r, c = r[order], c[order]
+        last = np.r_[r[1:] != r[:-1], True]
+        group[r[last]] = group[c[last]]
+    singletons = np.flatnonzero(group < 0)
+    group[singletons] = groups + np.arange(len(singletons))
+    groups += len(singletons)
+    return sp.csr_matrix((np.ones(n), (np.arange(n), group)), shape=(n, groups))
+
+def far_repulsion(pos, mass, k):
+    """
+    Returns:
+        displacement: array (nodes x 2), repulsion of the centers of mass of the GRID x GRID cells farther than
+                      CUTOFF * k
+    """
+    low, high = pos.min(axis=0), pos.max(axis=0)
+    cell = np.minimum(((pos - low) / np.maximum(high - low, 1e-12) * GRID).astype(np.int64), GRID - 1)
+    cell = cell[:, 0] * GRID + cell[:, 1]
+    cell_mass = np.bincount(cell, mass, GRID**2)
+    occupied = cell_mass > 0
+    cell_mass = cell_mass[occupied]
+    centers = np.stack([np.bincount(cell, mass * pos[:, axis], GRID**2)[occupied] for axis in range(2)], axis=1) / cell_mass[:, None]
+    dx = pos[:, 0, None] - centers[None, :, 0]
+    dy = pos[:, 1, None] - centers[None, :, 1]
+    distance2 = dx**2 + dy**2
+    force = k**2 * cell_mass[None, :] / np.maximum(distance2, 1e-12)
+    force[distance2 <= (CUTOFF * k)**2] = 0
+    return np.stack([(dx * force).sum(axis=1), (dy * force).sum(axis=1)], axis=1)
+
+def near_repulsion(pos, mass, k):
+    """
+    Returns:
+        displacement: array (nodes x 2), repulsion of the nodes closer than CUTOFF * k
+    """
+    displacement = np.zeros_like(pos)
+    pairs = cKDTree(pos).query_pairs(CUTOFF * k, output_type="ndarray")
+    if len(pairs) == 0:
+        return displacement
+    i, j = pairs[:, 0], pairs[:, 1]
+    delta = pos[i] - pos[j]
+    force = delta * (k**2 / np.maximum((delta**2).sum(axis=1), 1e-9 * k**2))[:, None]
+    for axis in range(2):
+        displacement[:, axis] = np.bincount(i, force[:, axis] * mass[j], len(pos)) - np.bincount(j, force[:, axis] * mass[i], len(pos))
+    return displacement
+
+def exact_repulsion(pos, mass, k):
+    """
+    Returns:
+        displacement: array (nodes x 2), repulsion of all the other nodes
+    """
+    dx = pos[:, 0, None] - pos[None, :, 0]
+    dy = pos[:, 1, None] - pos[None, :, 1]
+    distance2 = np.maximum(dx**2 + dy**2, 1e-9 * k**2)
+    np.fill_diagonal(distance2, np.inf)
+    force = k**2 * mass[None, :] / distance2
+    return np.stack([(dx * force).sum(axis=1), (dy * force).sum(axis=1)], axis=1)
+
+def relax(pos, A, mass, k, iterations, temperature, deadline = None):
+    """
+    Fruchterman-Reingold iterations with a linear cooling from temperature (largest move of a node) to 0,
+    stopped early at deadline (time.perf_counter() value).
+
+    Returns:
+        pos: array (nodes x 2), the refined positions (pos is updated in place)
+    """
+    coo = sp.triu(A, k=1).tocoo()
+    rows, cols, weights = coo.row, coo.col, coo.data
+    n = len(pos)
+    exact = n <= EXACT_REPULSION_NODES
+    for iteration in range(iterations):
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+        if exact:
+            displacement = exact_repulsion(pos, mass, k)
+        else:
+            #the far field changes slowly, it is only updated every FAR_FIELD_EVERY iterations
+            if iteration % FAR_FIELD_EVERY == 0:
+                far = far_repulsion(pos, mass, k)
+            displacement = far + near_repulsion(pos, mass, k)
+        #attraction d^2/k along the edges
+        delta = pos[rows] - pos[cols]
+        force = delta * (weights * np.sqrt((delta**2).sum(axis=1)) / k)[:, None]
+        for axis in range(2):
+            displacement[:, axis] += np.bincount(cols, force[:, axis], n) - np.bincount(rows, force[:, axis], n)
+        length = np.maximum(np.sqrt((displacement**2).sum(axis=1)), 1e-12)
+        step = temperature * (1 - iteration / iterations)
+        pos += displacement * (np.minimum(length, step) / length)[:, None]
+    return pos
+
+def force_layout(G, pos = None, iterations = LAYOUT_ITERATIONS, time_budget = None, seed = None, weight = "weight"):
+    """
+    Multilevel force-directed layout of G, a faster replacement of nx.spring_layout for large networks.
+
+    Parameters:
+        G: networkx Graph
+        pos: dict, default None. Previous positions (node: (x, y)) to start from: if they cover at least
+             WARM_START_FRACTION of the nodes only the finest level is refined (WARM_START_ITERATIONS at a
+             low temperature)
+        iterations: int, iterations of each level
+        time_budget: float, default None. Seconds after which the iterations stop, the layout is returned
+                     with the positions reached so far
+        seed: int, seed of the random starting positions and of the matching
+        weight: str, edge attribute used as attraction weight (1 when missing)
+    Returns:
+        pos: dict, node: (x, y) array, centered in 0 and scaled in [-1, 1] as the networkx layouts
+    """
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    nodes = list(G.nodes)
+    n = len(nodes)
+    if n == 0:
+        return {}
+    if n == 1:
+        return {nodes[0]: np.zeros(2)}
+    rng = np.random.default_rng(seed)
+    A = sp.csr_matrix(nx.to_scipy_sparse_array(G, nodelist=nodes, weight=weight, format="csr"), dtype=float)
+    A.setdiag(0)
+    A.eliminate_zeros()
+    A = A.maximum(A.T).tocsr()
+    #the positions live in a square of area n, where the optimal distance of the finest level is 1
+    side = np.sqrt(n)
+
+    previous = {} if pos is None else {node: pos[node] for node in nodes if node in pos}
+    if len(previous) >= WARM_START_FRACTION * n:
+        known = np.array([node in previous for node in nodes])
+        start = np.array([previous.get(node, (0, 0)) for node in nodes], dtype=float)
+        start[known] = nx.rescale_layout(start[known], scale=side / 2)
+        #new nodes start at the mean of their placed neighbors, or randomly
+        placed = A[:, known]
+        counts = np.asarray(placed.sum(axis=1)).ravel()
+        around = placed @ start[known] / np.maximum(counts, 1e-12)[:, None]
+        random = rng.uniform(-side / 2, side / 2, (n, 2))
+        start[~known] = np.where((counts > 0)[:, None], around, random)[~known] + rng.normal(0, 0.1, (n, 2))[~known]
+        layout = relax(start, A, np.ones(n), 1.0, min(iterations, WARM_START_ITERATIONS), 1.0, deadline)
+        return dict(zip(nodes, nx.rescale_layout(layout)))
+
+    levels = [(A, np.ones(n))]
+    prolongations = []
+    while levels[-1][0].shape[0] > COARSEST_NODES:
+        A_fine, mass = levels[-1]
+        P = coarsen(A_fine, rng)
+        if P.shape[1] > (1 - MIN_COARSENING) * A_fine.shape[0]:
+            break
+        A_coarse = (P.T @ A_fine @ P).tocsr()
+        A_coarse.setdiag(0)
+        A_coarse.eliminate_zeros()
+        levels.append((A_coarse, P.T @ mass))
+        prolongations.append(P)
+
+    A_level, mass = levels[-1]
+    k = np.sqrt(n / A_level.shape[0])
+    layout = rng.uniform(-side / 2, side / 2, (A_level.shape[0], 2))
+    layout = relax(layout, A_level, mass, k, iterations, side / 10, deadline)
+    for (A_level, mass), P in zip(reversed(levels[:-1]), reversed(prolongations)):
+        k = np.sqrt(n / A_level.shape[0])
+        #each node starts at the position of its group, with a small jitter to split the group
+        layout = P @ layout + rng.normal(0, 0.1 * k, (A_level.shape[0], 2))
+        layout = relax(layout, A_level, mass, k, iterations, 2 * k, deadline)
+    return dict(zip(nodes, nx.rescale_layout(layout)))
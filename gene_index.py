@@ -0,0 +1,179 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Gene symbol -> gencode id -> ENSP index                                         *
+*                                                                                                           *
+*************************************************************************************************************
+
+all_genes_dict.txt and ENSG_to_ENSP.txt stored as an embedded SQLite file: lookups are B-tree searches on
+the primary keys and the file is read through mmap, so all the gunicorn workers share the same pages of
+the OS page cache instead of parsing and keeping their own copy of the dictionaries.
+"""
+
+import ast
+import os
+import sqlite3
+import threading
+
+GENE_INDEX_FILE = os.environ.get("GENE_INDEX", "gene_index.sqlite")
+GENES_DICT_FILE = "all_genes_dict.txt"
+GENE_PROTEIN_FILE = "ENSG_to_ENSP.txt"
+#bumped when the tables change, older files are rebuilt
+SCHEMA_VERSION = 2
+
+def trigrams(text):
+
+    text = " {} ".format(text.upper())
+    return {text[i:i+3] for i in range(len(text)-2)}
+
+def build_gene_index(genes_dict, gene_protein_mapping, output_file = GENE_INDEX_FILE):
+    """
+    Write the index file, replacing an existing one atomically.
+
+    Parameters:
+        genes_dict: dict {gene symbol: gencode id}, the order is kept (the first symbol is the default gene)
+        gene_protein_mapping: dict {gencode id without version: ENSP id}, '' for non coding genes
+        output_file: str, path of the SQLite file
+    """
+    temp_file = "{}.{}.tmp".format(output_file, os.getpid())
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    conn = sqlite3.connect(temp_file)
+    conn.execute("CREATE TABLE genes (symbol TEXT PRIMARY KEY, gencode_id TEXT NOT NULL, position INTEGER NOT NULL) WITHOUT ROWID")
+    conn.execute("CREATE INDEX genes_position ON genes (position)")
+    conn.execute("CREATE TABLE proteins (gene_id TEXT PRIMARY KEY, protein_id TEXT NOT NULL) WITHOUT ROWID")
+    conn.executemany("INSERT INTO genes VALUES (?, ?, ?)", ((symbol, gencode_id, i) for i, (symbol, gencode_id) in enumerate(genes_dict.items())))
+    conn.executemany("INSERT INTO proteins VALUES (?, ?)", gene_protein_mapping.items())
+    #search terms (upper case symbol, gencode id with and without version, ENSP id) and symbol trigrams for fuzzy matches
+    conn.execute("CREATE TABLE terms (term TEXT, symbol TEXT, PRIMARY KEY (term, symbol)) WITHOUT ROWID")
+    conn.execute("CREATE TABLE trigrams (trigram TEXT, symbol TEXT, PRIMARY KEY (trigram, symbol)) WITHOUT ROWID")
+    terms = set()
+    for symbol, gencode_id in genes_dict.items():
+        gene_id = gencode_id.split(".")[0]
+        terms.update([(symbol.upper(), symbol), (gencode_id.upper(), symbol), (gene_id.upper(), symbol)])
+        if gene_protein_mapping.get(gene_id):
+            terms.add((gene_protein_mapping[gene_id].upper(), symbol))
+    conn.executemany("INSERT INTO terms VALUES (?, ?)", terms)
+    conn.executemany("INSERT OR IGNORE INTO trigrams VALUES (?, ?)", ((trigram, symbol) for symbol in genes_dict for trigram in trigrams(symbol)))
+    conn.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(temp_file, output_file)
+
+def build_gene_index_from_files(genes_dict_file = GENES_DICT_FILE, gene_protein_file = GENE_PROTEIN_FILE, output_file = GENE_INDEX_FILE):
+
+    with open(genes_dict_file, "r") as f:
+        genes_dict = ast.literal_eval(f.read())
+    with open(gene_protein_file, "r") as f:
+        gene_protein_mapping = ast.literal_eval(f.read())
+    build_gene_index(genes_dict, gene_protein_mapping, output_file)
+
+class GeneIndex:
+    """
+    Read only view of the index file, built from the text files the first time if missing.
+
+    Parameters:
+        path: str, path of the SQLite file written by build_gene_index
+    """
+
+    def __init__(self, path = GENE_INDEX_FILE):
+
+        if not os.path.exists(path) or self._schema_version(path) != SCHEMA_VERSION:
+            print("Building gene index {}".format(path))
+            build_gene_index_from_files(output_file=path)
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+
+    @staticmethod
+    def _schema_version(path):
+
+        conn = sqlite3.connect("file:{}?mode=ro".format(os.path.abspath(path)), uri=True)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.close()
+        return version
+
+    def _connection(self):
+
+        #one connection per process and thread, sqlite connections can't be shared after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect("file:{}?mode=ro&immutable=1".format(self.path), uri=True, check_same_thread=False)
+            conn.execute("PRAGMA mmap_size=268435456")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __contains__(self, symbol):
+
+        return self._connection().execute("SELECT 1 FROM genes WHERE symbol = ?", (symbol, )).fetchone() is not None
+
+    def __getitem__(self, symbol):
+        """
+        Returns:
+            gencode_id: str, gencode id of the gene symbol. Raises KeyError if the symbol is unknown.
+        """
+        row = self._connection().execute("SELECT gencode_id FROM genes WHERE symbol = ?", (symbol, )).fetchone()
+        if row is None:
+            raise KeyError(symbol)
+        return row[0]
+
+    def __len__(self):
+
+        return self._connection().execute("SELECT COUNT(*) FROM genes").fetchone()[0]
+
+    def protein_id(self, gene_id):
+        """
+        Returns:
+            protein_id: str, ENSP id of the gencode id (without version), '' for non coding genes. Raises KeyError if unknown.
+        """
+        row = self._connection().execute("SELECT protein_id FROM proteins WHERE gene_id = ?", (gene_id, )).fetchone()
+        if row is None:
+            raise KeyError(gene_id)
+        return row[0]
+
+    def symbols(self, limit = -1):
+        """
+        Returns:
+            symbols: list of str, gene symbols in the order of all_genes_dict.txt
+        """
+        return [row[0] for row in self._connection().execute("SELECT symbol FROM genes ORDER BY position LIMIT ?", (limit, ))]
+
+    def items(self):
+        """
+        Returns:
+            genes: list of (symbol, gencode id), in the order of all_genes_dict.txt
+        """
+        return self._connection().execute("SELECT symbol, gencode_id FROM genes ORDER BY position").fetchall()
+
+    def search(self, query, k = 20):
+        """
+        Incremental search over gene symbols, gencode ids and ENSP ids (case insensitive).
+
+        Parameters:
+            query: str, the text typed in the genes dropdown
+            k: int, maximum number of results
+        Returns:
+            symbols: list of str, exact matches first, then prefix matches, then symbols sharing the most trigrams with query
+        """
+        query = query.strip().upper()
+        if not query:
+            return []
+        conn = self._connection()
+        results = [row[0] for row in conn.execute("SELECT symbol FROM terms WHERE term = ? LIMIT ?", (query, k))]
+        if len(results) < k:
+            #prefix range scan on the primary key: query <= term < query + highest code point
+            for (symbol, ) in conn.execute("SELECT symbol FROM terms WHERE term > ? AND term < ? ORDER BY term LIMIT ?", (query, query + "\U0010ffff", 2*k)):
+                if symbol not in results:
+                    results.append(symbol)
+        #no fuzzy matching of Ensembl ids, their trigrams are mostly digits shared by every id
+        if len(results) < k and len(query) >= 3 and not query.startswith("ENS"):
+            query_trigrams = list(trigrams(query))
+            rows = conn.execute("SELECT symbol FROM trigrams WHERE trigram IN ({}) GROUP BY symbol ORDER BY COUNT(*) DESC, length(symbol) LIMIT ?".format(",".join("?"*len(query_trigrams))),
+                                query_trigrams + [2*k])
+            for (symbol, ) in rows:
+                if symbol not in results:
+                    results.append(symbol)
+        return results[:k]
@@ -0,0 +1,145 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Shared HTTP client for the GTex and STRING APIs                                 *
+*                                                                                                           *
+*************************************************************************************************************
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class HttpClient:
+    """
+    requests.Session with per-host keep-alive connection pools, connect/read timeouts and jittered exponential
+    retry for 429 and 5xx responses (and connection errors). Latency counters are kept for each endpoint
+    (host + path, without the query string), in memory or in a SQLite file shared by the processes.
+
+    Parameters:
+        connect_timeout: float, seconds to wait for the TCP/TLS connection.
+        read_timeout: float, seconds to wait for the response, a read timeout is never retried.
+        max_retries: int, number of retries after the first attempt.
+        backoff: float, base delay in seconds, the n-th retry waits a random time in [0, backoff * 2**n].
+        pool_maxsize: int, connections kept alive for each host.
+        stats_path: str, default None. SQLite file of the counters, so the counters of every process (e.g. the
+                    background jobs) are added up. None to keep them in memory for this client only.
+    """
+
+    def __init__(self, connect_timeout = 5, read_timeout = 20, max_retries = 3, backoff = 0.5, pool_maxsize = 16, stats_path = None):
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.stats_path = stats_path
+        self._local = threading.local()
+        if stats_path is not None:
+            directory = os.path.dirname(stats_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection().execute("CREATE TABLE IF NOT EXISTS stats (endpoint TEXT PRIMARY KEY, requests INTEGER, errors INTEGER, retries INTEGER, total_seconds REAL, max_seconds REAL)")
+
+    def _connection(self):
+        #one connection per process and thread, sqlite connections can't be shared after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.stats_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def request(self, method, url, **kwargs):
+        """
+        Send the request, retrying when needed. Returns the last requests.Response, connection errors are
+        raised once the retries are exhausted.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = "{0.netloc}{0.path}".format(urlsplit(url))
+        attempt = 0
+        while True:
+            response = None
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                self._record(endpoint, time.perf_counter() - start, error=True)
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                self._record(endpoint, time.perf_counter() - start, error=response.status_code >= 400)
+                if response.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    return response
+                #give the connection back to the pool, a streamed response is never read
+                response.close()
+            time.sleep(self._delay(attempt, response))
+            attempt += 1
+            self._add(endpoint, retries=1)
+
+    def _delay(self, attempt, response):
+
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), self.timeout[1])
+        return random.uniform(0, self.backoff * 2**attempt)
+
+    def _record(self, endpoint, seconds, error = False):
+
+        self._add(endpoint, requests=1, errors=int(error), seconds=seconds)
+
+    def _add(self, endpoint, requests = 0, errors = 0, retries = 0, seconds = 0.0):
+
+        if self.stats_path is not None:
+            #one small write per upstream request, negligible next to the request itself
+            self._connection().execute("""INSERT INTO stats VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (endpoint) DO UPDATE SET
+                                          requests = requests + excluded.requests, errors = errors + excluded.errors, retries = retries + excluded.retries,
+                                          total_seconds = total_seconds + excluded.total_seconds, max_seconds = MAX(max_seconds, excluded.max_seconds)""",
+                                       (endpoint, requests, errors, retries, seconds, seconds))
+            return
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {"requests": 0, "errors": 0, "retries": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stats["requests"] += requests
+            stats["errors"] += errors
+            stats["retries"] += retries
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def get(self, url, **kwargs):
+
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """
+        Returns:
+            stats: dict {endpoint: counters}, number of requests, errors and retries, total, mean and max latency in seconds
+                   (of all the processes sharing stats_path, if set).
+        """
+        if self.stats_path is not None:
+            columns = ["requests", "errors", "retries", "total_seconds", "max_seconds"]
+            rows = self._connection().execute("SELECT endpoint, {} FROM stats".format(", ".join(columns))).fetchall()
+            all_stats = {row[0]: dict(zip(columns, row[1:])) for row in rows}
+        else:
+            with self._lock:
+                all_stats = {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
+        return {endpoint: dict(stats, mean_seconds=stats["total_seconds"]/max(stats["requests"], 1)) for endpoint, stats in all_stats.items()}
@@ -7,17 +7,38 @@
 *************************************************************************************************************
 """
 
+import os
+import json
+import hashlib
 import plotly.graph_objects as go
-import requests
+import plotly.io as pio
 from plotly.subplots import make_subplots
 import networkx as nx 
 import pandas as pd 
 import numpy as np 
 from pandas import json_normalize
 import random 
+from concurrent.futures import ThreadPoolExecutor
+from sample_metadata import load_sample_table, SAMPLE_METADATA_FILE
+from disk_cache import DiskCache
+from singleflight import SharedSingleFlight
+from http_client import HttpClient
+from violin_summary import summary_violin_traces, summary_xaxis
+from expression_store import load_expression_store, EXPRESSION_STORE_DIR
+from fetch_graph import FetchGraph
+from force_layout import force_layout
+from string_store import load_string_store, STRING_STORE_DIR, STRING_VERSION, STRING_SPECIES, ADD_NODES
 """
 GTex API requests https://www.gtexportal.org/home/api-docs/
 """
+GTEX_API_URL = "https://gtexportal.org/api/v2"
+GTEX_DATASET_ID = "gtex_v10"
+
+#on disk cache of the expression responses, shared by all the gunicorn workers. Changing GTEX_DATASET_ID invalidates it
+CACHE_DIR = os.environ.get("GTEX_CACHE_DIR", "cache")
+EXPRESSION_CACHE_MAX_BYTES = int(os.environ.get("GTEX_EXPRESSION_CACHE_MAX_BYTES", 256*1024*1024))
+expression_cache = DiskCache(os.path.join(CACHE_DIR, "gtex_expression.sqlite"), max_bytes=EXPRESSION_CACHE_MAX_BYTES, version=GTEX_DATASET_ID)
+
 # template = plotly_dark
 template = "plotly_white"
 line_color = "black"
@@ -82,6 +103,107 @@ all_tissues = ['Adipose_Subcutaneous', 'Adipose_Visceral_Omentum', 'Adrenal_Glan
  'Stomach', 'Testis', 'Thyroid', 'Uterus', 'Vagina', 'Whole_Blood']
 
 
+def new_http_client():
+
+    #the latency counters are shared by the workers and the background jobs, they are read by /stats
+    return HttpClient(connect_timeout=float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5)), read_timeout=float(os.environ.get("HTTP_READ_TIMEOUT", 20)),
+                      max_retries=int(os.environ.get("HTTP_MAX_RETRIES", 3)), stats_path=os.path.join(CACHE_DIR, "upstream.sqlite"))
+
+#one pooled keep-alive session for all the GTex and STRING calls of a process
+http = new_http_client()
+
+#local expression matrix, None until `python expression_store.py ...` is run (the GTex API is used instead)
+expression_store = load_expression_store(EXPRESSION_STORE_DIR, GTEX_DATASET_ID)
+
+#STRING networks and links of the API, shared by all the workers. Changing STRING_VERSION invalidates it
+STRING_API_URL = "https://version-{}.string-db.org/api".format(STRING_VERSION.replace(".", "-"))
+STRING_CACHE_TTL = float(os.environ.get("STRING_CACHE_TTL", 7*24*60*60))
+STRING_CACHE_MAX_BYTES = int(os.environ.get("STRING_CACHE_MAX_BYTES", 64*1024*1024))
+string_cache = DiskCache(os.path.join(CACHE_DIR, "string.sqlite"), max_bytes=STRING_CACHE_MAX_BYTES, version=STRING_VERSION, ttl=STRING_CACHE_TTL)
+#score channels of the STRING network tsv, after the stringId_A, stringId_B, preferredName_A, preferredName_B and
+#ncbiTaxonId columns (score, nscore, fscore, pscore, ascore, escore, dscore, tscore), named as in the STRING store
+STRING_NETWORK_CHANNELS = ["combined_score", "neighborhood", "fusion", "cooccurence", "coexpression", "experimental", "database", "textmining"]
+#identifiers per STRING request (the API refuses more than 2000), larger selections are split
+STRING_MAX_IDENTIFIERS = int(os.environ.get("STRING_MAX_IDENTIFIERS", 500))
+
+#node positions of the PPI networks, computed once per graph and shared by the background jobs (other processes)
+LAYOUT_SEED = 42
+LAYOUT_CACHE_MAX_BYTES = int(os.environ.get("LAYOUT_CACHE_MAX_BYTES", 32*1024*1024))
+layout_cache = DiskCache(os.path.join(CACHE_DIR, "layouts.sqlite"), max_bytes=LAYOUT_CACHE_MAX_BYTES, version="{}-{}".format(nx.__version__, LAYOUT_SEED))
+#spring_layout and kamada_kawai_layout of larger networks are replaced by the multilevel force_layout
+FORCE_LAYOUT_MIN_NODES = int(os.environ.get("FORCE_LAYOUT_MIN_NODES", 500))
+LAYOUT_TIME_BUDGET = float(os.environ.get("LAYOUT_TIME_BUDGET", 10))
+#networks with more nodes + edges are drawn with WebGL (scattergl) instead of SVG, only the MAX_DRAWN_EDGES
+#edges with the highest weight are drawn
+WEBGL_MIN_ELEMENTS = int(os.environ.get("WEBGL_MIN_ELEMENTS", 1000))
+MAX_DRAWN_EDGES = int(os.environ.get("MAX_DRAWN_EDGES", 5000))
+
+#local STRING interactions, None until `python string_store.py ...` is run (the STRING API is used instead)
+string_store = load_string_store(STRING_STORE_DIR)
+
+#gene independent sample counts for the pie charts, None until `python sample_metadata.py` (or expression_store.py) is run
+sample_table = load_sample_table(SAMPLE_METADATA_FILE, GTEX_DATASET_ID)
+if sample_table is None and expression_store is not None:
+    sample_table = load_sample_table(os.path.join(EXPRESSION_STORE_DIR, "sample_metadata.npz"), GTEX_DATASET_ID)
+
+#bounded pool for the fan-out of independent requests (e.g. per tissue sample counts)
+FETCH_MAX_WORKERS = int(os.environ.get("FETCH_MAX_WORKERS", 16))
+fetch_pool = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS, thread_name_prefix="fetch")
+#pool of the FetchGraph tasks of a click, separated from fetch_pool: a task may wait for its fan-out on fetch_pool
+GRAPH_MAX_WORKERS = int(os.environ.get("GRAPH_MAX_WORKERS", 8))
+graph_pool = ThreadPoolExecutor(max_workers=GRAPH_MAX_WORKERS, thread_name_prefix="graph")
+
+#concurrent identical requests (e.g. many users selecting the same gene) share a single upstream call, also
+#when they come from different workers or background jobs (the leases and results live in a SQLite file)
+IN_FLIGHT_FILE = os.path.join(CACHE_DIR, "in_flight.sqlite")
+in_flight = SharedSingleFlight(IN_FLIGHT_FILE)
+
+def reinit_after_fork():
+    #the background callbacks run in forked processes, which inherit neither the threads of the pools
+    #nor safely the keep-alive connections and the locks of the parent. The de-duplication and the counters
+    #are in SQLite files, so they still span all the processes
+    global http, fetch_pool, graph_pool, in_flight
+    http = new_http_client()
+    fetch_pool = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS, thread_name_prefix="fetch")
+    graph_pool = ThreadPoolExecutor(max_workers=GRAPH_MAX_WORKERS, thread_name_prefix="graph")
+    in_flight = SharedSingleFlight(IN_FLIGHT_FILE)
+
+os.register_at_fork(after_in_child=reinit_after_fork)
+
+def get_json(url):
+    
+    return in_flight.do(("GET", url), lambda: http.get(url).json())
+
+def check_response(response):
+    """
+    Raise requests.HTTPError if the server failed (5xx, or 429 once the retries are exhausted), so the error page
+    is never parsed and cached as an answer. Other 4xx are STRING answers (e.g. unknown identifiers).
+    """
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+    return response
+
+def post_text(url, params):
+    
+    return in_flight.do(("POST", url, json.dumps(params, sort_keys=True)), lambda: check_response(http.post(url, data=params)).text)
+
+def post_lines(url, params, parse, *args):
+    """
+    POST whose text response is parsed line by line while it is downloaded, instead of being held as one string.
+
+    Parameters:
+        parse: callable, called with an iterator over the lines of the response and *args
+    Returns:
+        result: the value returned by parse
+    """
+    def request():
+        with http.post(url, data=params, stream=True) as response:
+            check_response(response)
+            response.encoding = response.encoding or "utf-8"
+            return parse(response.iter_lines(decode_unicode=True), *args)
+
+    return in_flight.do(("POST", url, json.dumps(params, sort_keys=True), parse.__name__, args), request)
+
 def request_api_subject_from_age(age):
      
     #age range, for example 60-69
@@ -100,7 +222,7 @@ def request_api_subject_from_age(age):
     elif age >= 60 and age <= 69:
         age = "60-69"
     
-    results = requests.get("https://gtexportal.org/api/v2/dataset/sample?format=json&datasetId=gtex_v10&ageBracket={}&pageSize=5000".format(age)).json()
+    results = get_json("https://gtexportal.org/api/v2/dataset/sample?format=json&datasetId=gtex_v10&ageBracket={}&pageSize=5000".format(age))
     dataframe = json_normalize(results["subject"]) 
     return dataframe
 
@@ -111,15 +233,59 @@ def request_api_subject_from_gender(gender):
     else: #elif gender == "F"
         gender = "female"
         
-    results = requests.get("https://gtexportal.org/api/v2/dataset/sample?format=json&datasetId=gtex_v10&sex={}&pageSize=5000".format(gender)).json()
+    results = get_json("https://gtexportal.org/api/v2/dataset/sample?format=json&datasetId=gtex_v10&sex={}&pageSize=5000".format(gender))
     dataframe = json_normalize(results["subject"]) 
     return dataframe
 
+def request_api_gene_expression_data(gencode_id, attribute_subset = None, use_cache = True):
+    """
+    Request the expression data of a gene from the local expression store if built, otherwise from the GTex API
+    going through the expression cache.
+
+    Parameters:
+        gencode_id: str, gencode id of the gene, for example ENSG00000223972.5
+        attribute_subset: str, default None. GTex attribute used to split the samples of each tissue ("sex" or "ageBracket")
+        use_cache: bool, default True. False to neither read nor fill the expression cache, for the batch jobs
+                   reading every gene once (they would evict all the entries the app uses)
+    Returns:
+        data: list of dict, the "data" records of the API response
+    """
+    if expression_store is not None and gencode_id in expression_store:
+        return expression_store.gene_expression_data(gencode_id, attribute_subset)
+
+    key = "{}|{}|{}".format(GTEX_DATASET_ID, gencode_id, attribute_subset or "")
+    cached = expression_cache.get(key) if use_cache else None
+    if cached is not None:
+        return json.loads(cached)
+
+    url = "{}/expression/geneExpression?datasetId={}&gencodeId={}&format=json".format(GTEX_API_URL, GTEX_DATASET_ID, gencode_id)
+    if attribute_subset is not None:
+        url += "&attributeSubset={}".format(attribute_subset)
+    data = get_json(url)["data"]
+    if use_cache:
+        expression_cache.set(key, json.dumps(data).encode())
+    return data
+
+def fetch_graph():
+    """
+    Returns:
+        graph: FetchGraph running its tasks on graph_pool
+    """
+    return FetchGraph(graph_pool)
+
+def add_expression_fetch(graph, gencode_id, attribute_subset = None):
+    """
+    Add to graph the fetch of the expression data of a gene (see request_api_gene_expression_data), named
+    ("expression", gencode_id, attribute_subset). Its result (the records) is passed to the plot functions as
+    groups=expression_groups(records).
+    """
+    name = ("expression", gencode_id, attribute_subset)
+    graph.add(name, lambda: request_api_gene_expression_data(gencode_id, attribute_subset))
+    return name
+
 def request_api_gene_expression(gene):
     
-    #print("https://gtexportal.org/api/v2/expression/geneExpression?datasetId=gtex_v10&gencodeId={}&format=json".format(gene))
-    results =  requests.get("https://gtexportal.org/api/v2/expression/geneExpression?datasetId=gtex_v10&gencodeId={}&format=json".format(gene)).json()
-    dataframe = pd.DataFrame(results["data"])
+    dataframe = pd.DataFrame(request_api_gene_expression_data(gene))
     return dataframe
 
 def request_api_subject_from_gender_and_age(gender, age):
@@ -134,28 +300,93 @@ def request_api_subject_from_gender_and_age(gender, age):
 
 def request_api_gene_expression_with_gender(gene):
     
-    #print("https://gtexportal.org/api/v2/expression/geneExpression?datasetId=gtex_v10&gencodeId={}&attributeSubset=sex&format=json".format(gene))
-    results =  requests.get("https://gtexportal.org/api/v2/expression/geneExpression?datasetId=gtex_v10&gencodeId={}&attributeSubset=sex&format=json".format(gene)).json()
-    dataframe = pd.DataFrame(results["data"])
+    dataframe = pd.DataFrame(request_api_gene_expression_data(gene, "sex"))
     return dataframe
 
 def request_api_gene_expression_with_age(gene):
     
-    #print("https://gtexportal.org/api/v2/expression/geneExpression?datasetId=gtex_v10&gencodeId={}&attributeSubset=ageBracket&format=json".format(gene))
-    results =  requests.get("https://gtexportal.org/api/v2/expression/geneExpression?datasetId=gtex_v10&gencodeId={}&attributeSubset=ageBracket&format=json".format(gene)).json()
-    dataframe = pd.DataFrame(results["data"])
+    dataframe = pd.DataFrame(request_api_gene_expression_data(gene, "ageBracket"))
     return dataframe
 
+def extract_expression_groups(df):
+    """
+    Convert a GTex expression response into typed arrays with a single pass over its rows, instead of
+    masking the whole dataframe again for every tissue and group.
+
+    Parameters:
+        df: pandas.DataFrame, returned by request_api_gene_expression, _with_gender or _with_age
+    Returns:
+        groups: dict {(tissueSiteDetailId, subsetGroup): numpy.array of float32}, subsetGroup is None without attributeSubset
+    """
+    subsets = df["subsetGroup"] if "subsetGroup" in df.columns else [None]*len(df)
+    groups = {}
+    for tissue, subset, data in zip(df["tissueSiteDetailId"], subsets, df["data"]):
+        groups.setdefault((tissue, subset), np.asarray(data, dtype=np.float32))
+    return groups
+
+def expression_groups(*records):
+    """
+    Returns:
+        groups: dict, extract_expression_groups of the records of one gene, merged over the attribute subsets (their
+                subset groups don't overlap)
+    """
+    groups = {}
+    for subset_records in records:
+        groups.update(extract_expression_groups(pd.DataFrame(subset_records)))
+    return groups
+
 """
 Violin plots
 """
 
-def plot_by_gene_and_gender_and_tissue(gencode_id, gene_name, tissue):
+#set to 1 to validate every trace of the dict built figures again (e.g. after editing violin_trace)
+VALIDATE_FIGURES = os.environ.get("VALIDATE_FIGURES", "0") == "1"
 
-    df = request_api_gene_expression_with_gender(gencode_id)
+def violin_trace(x0, y, name, fillcolor, **kwargs):
+    """
+    Returns:
+        trace: dict, a go.Violin with the style shared by all the violin plots, as plotly JSON (no magic underscores)
+    """
+    trace = {"type": "violin", "x0": x0, "y": y, "name": name, "fillcolor": fillcolor, "points": "outliers", "opacity": 0.8,
+             "box": {"visible": True}, "meanline": {"visible": True}, "line": {"color": line_color}}
+    trace.update(kwargs)
+    return trace
+
+def violin_layout(title, **kwargs):
+    """
+    Returns:
+        layout: dict, layout shared by the violin plots with the template already resolved
+    """
+    layout = {"template": pio.templates[template], "hovermode": "x unified", "autosize": False, "width": 1500, "height": 800,
+              "title": {"text": title, "font": {"size": 24, "color": line_color}},
+              "xaxis": {"rangeslider": {"visible": True}}, "yaxis": {"title": {"text": "TPM", "font": {"size": 24}}}}
+    layout.update(kwargs)
+    return layout
+
+def fast_figure(traces, layout):
+    """
+    Build the figure from trace and layout dicts in one call, skipping the validation that go.Violin(...) and
+    fig.add_trace run for every trace. Later updates (update_layout, ...) are still validated.
+    """
+    if VALIDATE_FIGURES:
+        return go.Figure(data=traces, layout=layout)
+    try:
+        return go.Figure(data=traces, layout=layout, _validate=False)
+    except TypeError:
+        #plotly versions without the _validate argument
+        return go.Figure(data=traces, layout=layout)
+
+def set_summary_xaxis(fig, tissues):
+    #summary violins are drawn at numeric positions, same range as the category axis of the raw violins
+    fig.update_xaxes(**summary_xaxis(tissues))
+
+def plot_by_gene_and_gender_and_tissue(gencode_id, gene_name, tissue, groups = None):
+
+    if groups is None:
+        groups = extract_expression_groups(request_api_gene_expression_with_gender(gencode_id))
     fig = go.Figure()
     genders = ["male", "female"]
-    data = {gender: [float(elem) for elem in list(df["data"][df['tissueSiteDetailId'] == tissue][df['subsetGroup'] == gender].values[0])] for gender in genders}
+    data = {gender: groups[(tissue, gender)] for gender in genders}
     colors = ["cyan", "pink"]
     for i, (gender, data_tissue_gender) in enumerate(data.items()):
          fig.add_trace(go.Violin(x0 = tissue, y=data_tissue_gender, points='outliers', name = gender, box_visible=True,  line_color=line_color, fillcolor = colors[i], meanline_visible=True, opacity=0.8))
@@ -165,44 +396,45 @@ def plot_by_gene_and_gender_and_tissue(gencode_id, gene_name, tissue):
     width=1500, height=800, legend=dict(font=dict(size= 24)), title_font_color = line_color)
     fig.update_yaxes(title = dict(font=dict(size= 24)))
     fig.update_xaxes(title = dict(font=dict(size= 24)))
-    return fig, pd.DataFrame.from_dict(data, orient='index')
+    return fig, pd.DataFrame.from_dict(data, orient='index'), list(data.values())
 
-def plot_by_gene_and_gender(gencode_id, gene_name):
+def plot_by_gene_and_gender(gencode_id, gene_name, summary = False, groups = None):
     
-    df = request_api_gene_expression_with_gender(gencode_id)
-    print(df)
+    if groups is None:
+        groups = extract_expression_groups(request_api_gene_expression_with_gender(gencode_id))
     fig = go.Figure()
     genders = ["male", "female"]
-    tissues = np.unique(list(df["tissueSiteDetailId"]))
-    data = {tissue: {gender: [float(elem) for elem in list(df["data"][df['tissueSiteDetailId'] == tissue][df['subsetGroup'] == gender].values[0])] for gender in genders} for tissue in tissues}
-    print(data)
+    tissues = sorted({tissue for tissue, _ in groups})
+    data = {tissue: {gender: groups[(tissue, gender)] for gender in genders} for tissue in tissues}
     colors = ["cyan", "pink"]
-    for i, (tissue, data_tissue) in enumerate(data.items()):
-        for j, (gender, data_tissue_gender) in enumerate(data_tissue.items()):
-            if i == 0:
-                fig.add_trace(go.Violin(x0 = tissue, y=data_tissue_gender, points='outliers', legendgroup=gender, scalegroup=gender, name=gender, box_visible=True,  line_color=line_color, fillcolor = colors[j], meanline_visible=True, opacity=0.8))
-            else:
-                fig.add_trace(go.Violin(x0 = tissue, y=data_tissue_gender, points='outliers', legendgroup=gender, scalegroup=gender, showlegend=False, box_visible=True,  line_color=line_color, fillcolor = colors[j], meanline_visible=True, opacity=0.8))
-    
-    fig.update_xaxes(type='category')
-    fig.update_layout(violinmode='group', hovermode='x unified', template=template, yaxis_title="TPM", title= "Violin plot of Gene {} grouped by Gender".format(gene_name), title_font_size=24, autosize=False, width=1500, height=800, xaxis=dict(rangeslider=dict(
-                     visible=True)), title_font_color = line_color)
-
-    fig.update_yaxes(autorange = True,fixedrange = False, title = dict(font=dict(size= 24)))
-    return fig, pd.DataFrame.from_dict(data, orient='index')
+    traces = []
+    if summary:
+        #male and female violins side by side around the tissue position
+        for j, gender in enumerate(genders):
+            traces.extend(summary_violin_traces([(i - 0.2 + 0.4*j, data_tissue[gender]) for i, data_tissue in enumerate(data.values())], [gender]*len(data), [colors[j]]*len(data), width=0.4))
+    else:
+        for i, (tissue, data_tissue) in enumerate(data.items()):
+            for j, (gender, data_tissue_gender) in enumerate(data_tissue.items()):
+                traces.append(violin_trace(tissue, data_tissue_gender, gender, colors[j], legendgroup=gender, scalegroup=gender, showlegend=i == 0))
+
+    layout = violin_layout("Violin plot of Gene {} grouped by Gender".format(gene_name), violinmode="group")
+    layout["yaxis"].update(autorange=True, fixedrange=False)
+    fig = fast_figure(traces, layout)
+    if summary:
+        set_summary_xaxis(fig, tissues)
+    else:
+        fig.update_xaxes(type='category')
+    return fig, pd.DataFrame.from_dict(data, orient='index'), [data_tissue_gender for data_tissue in data.values() for data_tissue_gender in data_tissue.values()]
 
 
-def plot_by_gene_and_tissue_and_age(gencode_id, gene_name, tissue):
+def plot_by_gene_and_tissue_and_age(gencode_id, gene_name, tissue, groups = None):
     
-    df = request_api_gene_expression_with_age(gencode_id)
-    print(df)
+    if groups is None:
+        groups = extract_expression_groups(request_api_gene_expression_with_age(gencode_id))
     fig = go.Figure()
-    tissues = all_tissues
-    ages = np.unique(list(df["subsetGroup"]))
+    ages = sorted({age for _, age in groups})
     colors = ["red", "green", "blue", "cyan", "yellow", "orange"]
-    #data = {tissue: {age: [float(elem) for elem in list(df['data'][df['tissueSiteDetailId'] == tissue][df['subsetGroup'] == age].values[0])] for age in ages} for tissue in tissues}
-    data = {age: [float(elem) for elem in list(df["data"][df['tissueSiteDetailId'] == tissue][df['subsetGroup'] == age].values[0])] for age in ages}
-    print(data)
+    data = {age: groups[(tissue, age)] for age in ages if (tissue, age) in groups}
     #for i, (tissue, data_tissue) in enumerate(data.items()):
         #for j, (age, data_tissue_age) in enumerate(data_tissue.items()):
     for j, (age, data_tissue_age) in enumerate(data.items()):
@@ -215,67 +447,58 @@ def plot_by_gene_and_tissue_and_age(gencode_id, gene_name, tissue):
     fig.update_layout(violinmode='group', hovermode='x unified', template=template,  yaxis_title="TPM", title= "Violin plot of Gene {}, Tissue {} grouped by age".format(gene_name, tissue), title_font_size=24, autosize=False, width=1500, height=800, xaxis=dict(rangeslider=dict(visible=True)), legend=dict(font=dict(size= 20)), title_font_color = line_color)
                                                                                                                                                                                                                                                                          
     fig.update_yaxes(autorange = True,fixedrange = False, title = dict(font=dict(size= 24)))
-    return fig, pd.DataFrame.from_dict(data, orient='index')
+    return fig, pd.DataFrame.from_dict(data, orient='index'), list(data.values())
 
-def plot_by_gene(gencode_id, gene_name):
+def plot_by_gene(gencode_id, gene_name, summary = False, groups = None):
     
     selected_colors = []
-    df = request_api_gene_expression(gencode_id)
+    if groups is None:
+        groups = extract_expression_groups(request_api_gene_expression(gencode_id))
     tissues = all_tissues
-    data = {tissue:[float(elem) for elem in list(df["data"][df['tissueSiteDetailId'] == tissue].values[0])] for tissue in tissues}
-    fig = go.Figure()
+    data = {tissue: groups[(tissue, None)] for tissue in tissues}
+    traces = []
     for i, (tissue, tissue_data) in enumerate(data.items()):
         while(True):
             color = random.sample(colors, 1)[0]
             if color not in selected_colors:
                 selected_colors.append(color)
                 break
-        fig.add_trace(go.Violin(x0 = tissue, y=tissue_data, points='outliers', name = tissue, box_visible=True,  line_color=line_color, fillcolor = color, meanline_visible=True, opacity=0.8))
+        if not summary:
+            traces.append(violin_trace(tissue, tissue_data, tissue, color))
+    if summary:
+        #one outline trace per tissue, the boxes and the outliers of all the tissues in two traces
+        traces = summary_violin_traces(list(enumerate(data.values())), tissues, selected_colors, outliers_color="lightgray")
     
-    fig.update_xaxes(type='category')
-    fig.update_layout(template=template, hovermode='x unified', yaxis_title="TPM", title= "Violin plot of Gene {}".format(gene_name), title_font_size=24, autosize=False, width=1500, height=800, xaxis=dict(rangeslider=dict(
-                     visible=True)), title_font_color = line_color)
-    fig.update_yaxes(title = dict(font=dict(size= 24)))
-    return fig, pd.DataFrame.from_dict(data, orient='index')
+    fig = fast_figure(traces, violin_layout("Violin plot of Gene {}".format(gene_name)))
+    if summary:
+        set_summary_xaxis(fig, tissues)
+    else:
+        fig.update_xaxes(type='category')
+    return fig, pd.DataFrame.from_dict(data, orient='index'), list(data.values())
 
-def plot_by_gene_and_tissue(gene, gene_name, tissue):
+def plot_by_gene_and_tissue(gene, gene_name, tissue, groups = None):
     
-    df = request_api_gene_expression(gene)
+    if groups is None:
+        groups = extract_expression_groups(request_api_gene_expression(gene))
     fig = go.Figure()
-    data = [float(elem) for elem in list(df["data"][df['tissueSiteDetailId'] == tissue].values[0])]
+    data = groups[(tissue, None)]
     fig.add_trace(go.Violin(x0=tissue, y=data, name=tissue, box_visible=True, line_color=line_color, meanline_visible=True, fillcolor='lightseagreen', points="outliers", opacity=0.8))
     fig.update_layout(template=template, hovermode='x unified', yaxis_title="TPM", title= "Violin plot of Gene {} and Tissue {}".format(gene_name, tissue), title_font_size=24, title_font_color = line_color)
     fig.update_yaxes(title = dict(font=dict(size= 20, color = line_color)))
-    return fig, pd.DataFrame.from_dict(data)
+    return fig, pd.DataFrame.from_dict(data), [data]
 
 
-def plot_by_gene_and_gender_and_tissue_and_age(gencode_id, gene_name, tissue):
-    #maybe create the dataframe here, input gender and gene and tissue
-    df = request_api_gene_expression_with_gender(gencode_id)
-    fig = go.Figure()
-    genders = ["male", "female"]
-    ages = ["20-29", "30-39", "40-49", "50-59", "60-69", "70-79"]
-    data = {gender: {age: [float(elem) for elem in list(df["data"][df['tissueSiteDetailId'] == tissue][df['subsetGroup'] == gender][df['ageBracket'] == age].values[0])] for age in ages} for gender in genders}
-    colors = ["cyan", "pink"]
-    for i, (gender, data_tissue_gender) in enumerate(data.items()):
-         fig.add_trace(go.Violin(x0 = tissue, y=data_tissue_gender, points='outliers', name = gender, box_visible=True,  line_color=line_color, fillcolor = colors[i], meanline_visible=True, opacity=0.8))
-    
-    fig.update_xaxes(type='category')
-    fig.update_layout(violinmode='group', hovermode='x unified', template=template,  yaxis_title="TPM", title= "Violin plot of Gene {} and Tissue {} grouped by gender".format(gene_name, tissue), autosize=False,
-    width=1500, height=800, legend=dict(font=dict(size= 24)), title_font_size=24, title_font_color = line_color)
-    fig.update_yaxes(title = dict(font=dict(size= 24)))
-    fig.update_xaxes(title = dict(font=dict(size= 24)))
-    return fig, pd.DataFrame.from_dict(data, orient='index')
-
-def plot_by_gene_tissue_age_and_gender(gencode_id, gene_name, tissue):
+def plot_by_gene_tissue_age_and_gender(gencode_id, gene_name, tissue, groups = None):
 
-    df_gender = request_api_gene_expression_with_gender(gencode_id)
-    df_age = request_api_gene_expression_with_age(gencode_id)
+    if groups is None:
+        groups = expression_groups(request_api_gene_expression_data(gencode_id, "sex"), request_api_gene_expression_data(gencode_id, "ageBracket"))
+    groups_gender = groups_age = groups
     genders = ["male", "female"]
     ages = ["20-29", "30-39", "40-49", "50-59", "60-69", "70-79"]
-    data_gender = {gender: [float(elem) for elem in list(df_gender["data"][df_gender['tissueSiteDetailId'] == tissue][df_gender['subsetGroup'] == gender].values[0])] for gender in genders}
-    data_age = {age: [float(elem) for elem in list(df_age["data"][df_age['tissueSiteDetailId'] == tissue][df_age['subsetGroup'] == age].values[0])] for age in ages}
-    data = {age: {gender: [float(elem1) for elem1 in data_gender[gender] for elem2 in data_age[age] if elem1 == elem2] for gender in genders} for age in ages}
+    data_gender = {gender: groups_gender[(tissue, gender)] for gender in genders}
+    data_age = {age: groups_age[(tissue, age)] for age in ages if (tissue, age) in groups_age}
+    #samples of both groups, matched by their expression value
+    data = {age: {gender: data_gender[gender][np.isin(data_gender[gender], data_age[age])] for gender in genders} for age in data_age}
     
     fig = go.Figure()
     idx = 0
@@ -291,82 +514,126 @@ def plot_by_gene_tissue_age_and_gender(gencode_id, gene_name, tissue):
     # fig.update_yaxes(autorange = True,fixedrange = False)
     fig.update_yaxes(title = dict(font=dict(size= 24)))
     fig.update_xaxes(title = dict(font=dict(size= 24)))
-    return fig, pd.DataFrame.from_dict(data, orient='index')
+    return fig, pd.DataFrame.from_dict(data, orient='index'), [data_age_gender for data_age in data.values() for data_age_gender in data_age.values()]
 
 
 #api for pie charts
+deaths = ["Ventilator%20case", "Fast%20death%20-%20violent", "Fast%20death%20-%20natural%20causes", "Intermediate%20death", "Slow%20death"]
+autolysis_scores = ["None", "Mild", "Moderate", "Severe"]
+
+def request_api_sample_count(tissue, attribute, value):
+    
+    response = get_json("{}/dataset/sample?datasetId={}&tissueSiteDetailId={}&{}={}&format=json&pageSize=2000&sortBy=sampleId&sortDirection=asc".format(GTEX_API_URL, GTEX_DATASET_ID, tissue, attribute, value))
+    return len(response["data"])
+
+def request_api_sample_counts(tissues, attribute, values):
+    """
+    Count the GTex samples of each tissue for each value of a sample attribute. The requests are sent
+    concurrently on fetch_pool, so at most FETCH_MAX_WORKERS of them are in flight at the same time.
+
+    Parameters:
+        tissues: list of str, tissueSiteDetailId of the tissues
+        attribute: str, sample attribute, for example "hardyScale" or "autolysisScore"
+        values: list of str, url encoded values of the attribute
+    Returns:
+        results: dict {tissue: {value: number of samples}}
+    """
+    queries = [(tissue, value) for tissue in tissues for value in values]
+    counts = fetch_pool.map(lambda query: request_api_sample_count(query[0], attribute, query[1]), queries)
+    results = {tissue: {} for tissue in tissues}
+    for (tissue, value), count in zip(queries, counts):
+        results[tissue][value.replace("%20", " ")] = count
+    return results
+
 def request_api_gene_expression_with_tissue_and_death(tissue):
   
-    deaths = ["Ventilator%20case", "Fast%20death%20-%20violent", "Fast%20death%20-%20natural%20causes", "Intermediate%20death", "Slow%20death"]
-    results = {}
-    for death in deaths:
-        response = requests.get("https://gtexportal.org/api/v2/dataset/sample?datasetId=gtex_v10&tissueSiteDetailId={}&hardyScale={}&format=json&pageSize=2000&sortBy=sampleId&sortDirection=asc".format(tissue, death)).json()
-        results[death.replace("%20", " ")] = len(response["data"])
-        #print(results)
-    return results
+    return request_api_sample_counts([tissue], "hardyScale", deaths)[tissue]
 
 def request_api_gene_expression_with_tissue_and_autolysisScore(tissue):
     
-    autolysisScore = ["None", "Mild", "Moderate", "Severe"]
-    
-    results = {}
-    for score in autolysisScore:
-        response = requests.get("https://gtexportal.org/api/v2/dataset/sample?datasetId=gtex_v10&tissueSiteDetailId={}&autolysisScore={}&format=json&pageSize=2000&sortBy=sampleId&sortDirection=asc".format(tissue, score)).json()
-        #print(2, response)
-        results[score] = len(response["data"])
-    return results
-
+    return request_api_sample_counts([tissue], "autolysisScore", autolysis_scores)[tissue]
 
 def request_api_gene_expression_all_tissues_and_death():
   
-    deaths = ["Ventilator%20case", "Fast%20death%20-%20violent", "Fast%20death%20-%20natural%20causes", "Intermediate%20death", "Slow%20death"]
-    results = {}
-    for tissue in all_tissues:
-        temp = {}
-        for death in deaths:
-            response = requests.get("https://gtexportal.org/api/v2/dataset/sample?datasetId=gtex_v10&tissueSiteDetailId={}&hardyScale={}&format=json&pageSize=2000&sortBy=sampleId&sortDirection=asc".format(tissue, death)).json()
-            temp[death.replace("%20", " ")] = len(response["data"])
-        results[tissue] = temp
-        
-    return results
+    return request_api_sample_counts(all_tissues, "hardyScale", deaths)
 
 def request_api_gene_expression_all_tissues_and_autolysisScore():
     
-    autolysisScore = ["None", "Mild", "Moderate", "Severe"]
-    
-    results = {}
-    for tissue in all_tissues:
-        temp = {}
-        for score in autolysisScore:
-            response = requests.get("https://gtexportal.org/api/v2/dataset/sample?datasetId=gtex_v10&tissueSiteDetailId={}&autolysisScore={}&format=json&pageSize=2000&sortBy=sampleId&sortDirection=asc".format(tissue, score)).json()
-            temp[score] = len(response["data"])
-        results[tissue] = temp
-    return results
+    return request_api_sample_counts(all_tissues, "autolysisScore", autolysis_scores)
+
+def request_samples_counts(gene, tissues):
+    """
+    Number of samples of each tissue by sex, age bracket, autolysis score and hardy scale. The counts come from
+    the local sample table (see sample_metadata.py) when it was built, otherwise from the GTex API: the sex and
+    age counts are then the lengths of the expression data of gene.
+
+    Parameters:
+        gene: str, gencode id of the gene, only used without the sample table
+        tissues: list of str, tissueSiteDetailId of the tissues
+    Returns:
+        counts: dict {attribute: {tissue: {value: number of samples}}}, attribute in "sex", "ageBracket", "autolysisScore", "hardyScale"
+    """
+    graph = fetch_graph()
+    return graph.result(add_samples_counts(graph, gene, tissues))
+
+def expression_counts(records, tissues, subsets):
+    """
+    Returns:
+        counts: dict {tissue: {subset: number of samples}} of the "data" records of an expression response
+    """
+    counts = {tissue: {subset: 0 for subset in subsets} for tissue in tissues}
+    for record in records:
+        if record["tissueSiteDetailId"] in counts and record["subsetGroup"] in subsets:
+            counts[record["tissueSiteDetailId"]][record["subsetGroup"]] += len(record["data"])
+    return counts
+
+def add_samples_counts(graph, gene, tissues):
+    """
+    Add to graph the "samples_counts" task, result of request_samples_counts, and the fetches it depends on:
+    none with the sample table, otherwise the sex and age expression of gene and the autolysis score and
+    hardy scale sample counts, all sent concurrently.
+
+    Returns:
+        name: str, name of the task
+    """
+    if sample_table is not None:
+        graph.add("samples_counts", lambda: {"sex": sample_table.counts_all_tissues("sex", all_genders, tissues),
+                                             "ageBracket": sample_table.counts_all_tissues("ageBracket", all_ages, tissues),
+                                             "autolysisScore": sample_table.counts_all_tissues("autolysisScore", autolysis_scores, tissues),
+                                             "hardyScale": sample_table.counts_all_tissues("hardyScale", [death.replace("%20", " ") for death in deaths], tissues)})
+        return "samples_counts"
+
+    genders = add_expression_fetch(graph, gene, "sex")
+    ages = add_expression_fetch(graph, gene, "ageBracket")
+    graph.add(("sample_counts", "autolysisScore"), lambda: request_api_sample_counts(tissues, "autolysisScore", autolysis_scores))
+    graph.add(("sample_counts", "hardyScale"), lambda: request_api_sample_counts(tissues, "hardyScale", deaths))
+    graph.add("samples_counts", lambda genders, ages, autolysis, hardy: {"sex": expression_counts(genders, tissues, all_genders), "ageBracket": expression_counts(ages, tissues, all_ages),
+                                                                         "autolysisScore": autolysis, "hardyScale": hardy},
+              genders, ages, ("sample_counts", "autolysisScore"), ("sample_counts", "hardyScale"))
+    return "samples_counts"
+
 #pie chart
 
-def plot_gene_tissue_data(gene, gene_name, tissue):
+def plot_gene_tissue_data(gene, gene_name, tissue, counts = None):
     
-    df_genders = request_api_gene_expression_with_gender(gene)
-    df_ages = request_api_gene_expression_with_age(gene)
-
     gender_colors = ["cyan", "pink"]
-    genders = ["male", "female"]
     age_colors = ["red", "green", "blue", "cyan", "yellow", "orange"]
-    ages = ["20-29", "30-39", "40-49", "50-59", "60-69", "70-79"]
     #scores = ["None", "Mild", "Moderate", "Severe"]
     score_colors = ["red", "green", "blue", "cyan", "yellow", "orange"]
     #deaths = ["Ventilator case", "Fast death - violent", "Fast death - natural causes", "Intermediate death", "Slow death"]
     deaths_colors = ["red", "green", "blue", "cyan", "yellow", "orange"]
     
-    data_genders = {gender: [float(elem) for elem in list(df_genders["data"][df_genders['tissueSiteDetailId'] == tissue][df_genders['subsetGroup'] == gender].values[0])] for gender in genders} #.values[0]
-    data_ages = {age: [float(elem) for elem in list(df_ages["data"][df_ages['tissueSiteDetailId'] == tissue][df_ages['subsetGroup'] == age].values[0])] for age in ages} #.values[0]
-    data_score = request_api_gene_expression_with_tissue_and_autolysisScore(tissue)
-    data_deaths = request_api_gene_expression_with_tissue_and_death(tissue)
+    if counts is None:
+        counts = request_samples_counts(gene, [tissue])
+    data_genders = counts["sex"][tissue]
+    data_ages = counts["ageBracket"][tissue]
+    data_score = counts["autolysisScore"][tissue]
+    data_deaths = counts["hardyScale"][tissue]
     
     fig = make_subplots(rows=2, cols=2, specs=[[{'type':'domain'}, {'type':'domain'}], [{'type':'domain'}, {'type':'domain'}]], subplot_titles=['Donors gender', 'Donors age', 'Donors autolysis score', 'Donors death'])
-    fig.add_trace(go.Pie(labels=list(data_genders.keys()), values=[len(gender_list) for gender_list in data_genders.values()], marker_colors=gender_colors, name="Gender"),
+    fig.add_trace(go.Pie(labels=list(data_genders.keys()), values=list(data_genders.values()), marker_colors=gender_colors, name="Gender"),
                   1, 1)
-    fig.add_trace(go.Pie(labels=list(data_ages.keys()), values=[len(age_list) for age_list in data_ages.values()], marker_colors=age_colors, name="Age"),
+    fig.add_trace(go.Pie(labels=list(data_ages.keys()), values=list(data_ages.values()), marker_colors=age_colors, name="Age"),
                   1, 2)
     fig.add_trace(go.Pie(labels=list(data_score.keys()), values= list(data_score.values()), marker_colors=score_colors, name="Autolysis score"),
                   2, 1)
@@ -377,31 +644,27 @@ def plot_gene_tissue_data(gene, gene_name, tissue):
                       'showgrid': False}, yaxis = {'showgrid': True}, showlegend=False, title_font_color = line_color)    
     return fig
 
-def plot_gene_data(gene, gene_name):
+def plot_gene_data(gene, gene_name, counts = None):
     
-    df_genders = request_api_gene_expression_with_gender(gene)
-    df_ages = request_api_gene_expression_with_age(gene)
-
     gender_colors = ["cyan", "pink"]
-    genders = ["male", "female"]
     age_colors = ["red", "green", "blue", "cyan", "yellow", "orange"]
-    ages = ["20-29", "30-39", "40-49", "50-59", "60-69", "70-79"]
     #scores = ["None", "Mild", "Moderate", "Severe"]
     score_colors = ["red", "green", "blue", "cyan", "yellow", "orange"]
     #deaths = ["Ventilator case", "Fast death - violent", "Fast death - natural causes", "Intermediate death", "Slow death"]
     deaths_colors = ["red", "green", "blue", "cyan", "yellow", "orange"]
     
-    data_genders = {gender: [float(elem) for elem in list(df_genders["data"][df_genders['subsetGroup'] == gender].values[0])] for gender in genders} #.values[0]
-    data_ages = {age: [float(elem) for elem in list(df_ages["data"][df_ages['subsetGroup'] == age].values[0])] for age in ages} #.values[0]
-    data_score = request_api_gene_expression_all_tissues_and_autolysisScore()
-    data_deaths = request_api_gene_expression_all_tissues_and_death()
-    data_tissues = {tissue: len(list(data_tissue)) for tissue, data_tissue in data_score.items()}
+    #number of samples of each group summed over all the tissues
+    if counts is None:
+        counts = request_samples_counts(gene, all_tissues)
+    data_genders, data_ages, data_score, data_deaths = [{value: sum(counts_tissue[value] for counts_tissue in counts[attribute].values()) for value in list(counts[attribute].values())[0]}
+                                                         for attribute in ["sex", "ageBracket", "autolysisScore", "hardyScale"]]
+    data_tissues = {tissue: sum(counts_tissue.values()) for tissue, counts_tissue in counts["autolysisScore"].items()}
 
 
-    fig = make_subplots(rows=3, cols=2, specs=[[{'type':'domain'}, {'type':'domain'}], [{'type':'domain'}, {'type':'domain'}], [{'type':'domain'}, {'type':'domain'}]], subplot_titles=['Donors gender', 'Donors age', 'Donors autolysis score', 'Donors death'])
-    fig.add_trace(go.Pie(labels=list(data_genders.keys()), values=[len(gender_list) for gender_list in data_genders.values()], marker_colors=gender_colors, name="Gender"),
+    fig = make_subplots(rows=3, cols=2, specs=[[{'type':'domain'}, {'type':'domain'}], [{'type':'domain'}, {'type':'domain'}], [{'type':'domain'}, {'type':'domain'}]], subplot_titles=['Donors gender', 'Donors age', 'Donors autolysis score', 'Donors death', 'Tissues'])
+    fig.add_trace(go.Pie(labels=list(data_genders.keys()), values=list(data_genders.values()), marker_colors=gender_colors, name="Gender"),
                   1, 1)
-    fig.add_trace(go.Pie(labels=list(data_ages.keys()), values=[len(age_list) for age_list in data_ages.values()], marker_colors=age_colors, name="Age"),
+    fig.add_trace(go.Pie(labels=list(data_ages.keys()), values=list(data_ages.values()), marker_colors=age_colors, name="Age"),
                   1, 2)
     fig.add_trace(go.Pie(labels=list(data_score.keys()), values= list(data_score.values()), marker_colors=score_colors, name="Autolysis score"),
                   2, 1)
@@ -416,10 +679,75 @@ def plot_gene_data(gene, gene_name):
 
 #PPI plot
 
+def graph_key(G):
+    """
+    Returns:
+        key: str, hash of the nodes, edges and edge weights of G, independent of their insertion order
+    """
+    nodes = sorted(map(str, G.nodes))
+    edges = sorted(tuple(sorted((str(n1), str(n2)))) + (round(float(weight), 6), ) for n1, n2, weight in G.edges(data="weight", default=1))
+    return hashlib.sha1(json.dumps([nodes, edges]).encode()).hexdigest()
+
+def compute_layout(G, layout = "spring_layout", pos = None):
+    """
+    Parameters:
+        pos: dict, default None. Previous positions of the nodes, force_layout starts from them
+    Returns:
+        pos: dict, node: (x, y) position of layout, the random layouts are seeded with LAYOUT_SEED
+    """
+    if layout == "force_layout":
+        pos = force_layout(G, pos=pos, time_budget=LAYOUT_TIME_BUDGET, seed=LAYOUT_SEED)
+    elif layout == "graphviz_layout":
+        pos = nx.nx_pydot.graphviz_layout(G)
+    elif layout == "pydot_layout":
+        pos = nx.nx_pydot.pydot_layout(G)
+    elif layout == "bipartite_layout":
+        top = nx.bipartite.sets(G)[0]
+        pos = nx.bipartite_layout(G, top)
+    elif layout == "circular_layout":
+        pos = nx.circular_layout(G)
+    elif layout == "kamada_kawai_layout":
+        pos = nx.kamada_kawai_layout(G)
+    elif layout == "planar_layout":
+        pos = nx.planar_layout(G)
+    elif layout == "random_layout":
+        pos = nx.random_layout(G, seed=LAYOUT_SEED)
+    elif layout == "rescale_layout":
+        pos = nx.rescale_layout(G)
+    elif layout == "spring_layout":
+        pos = nx.spring_layout(G, seed=LAYOUT_SEED)
+    elif layout == "spectral_layout":
+        pos = nx.spectral_layout(G)
+    elif layout == "spiral_layout":
+        pos = nx.spiral_layout(G)
+    elif layout == "multipartite_layout":
+        pos = nx.multipartite_layout(G)
+    return pos
+
+def network_layout(G, layout = "spring_layout"):
+    """
+    Node positions of layout through the layout cache: every plot of the same network (method changes, labels)
+    reuses the positions of the first one, so the nodes don't move between them.
+
+    Returns:
+        pos: dict, node: (x, y)
+    """
+    if layout in ("spring_layout", "kamada_kawai_layout") and G.number_of_nodes() > FORCE_LAYOUT_MIN_NODES:
+        layout = "force_layout"
+    nodes = sorted(G.nodes, key=str)
+    key = "{}|{}".format(layout, graph_key(G))
+    cached = layout_cache.get(key)
+    if cached is not None:
+        return dict(zip(nodes, map(tuple, json.loads(cached))))
+    #positions of a previous drawing of the nodes, e.g. when the cached layout was evicted
+    pos = compute_layout(G, layout, nx.get_node_attributes(G, "pos") or None)
+    layout_cache.set(key, json.dumps([[float(x) for x in pos[node]] for node in nodes]).encode())
+    return pos
+
 def visualize_network(G, color_by = None, size_by = None, title = None, layout = "spring_layout", size_scale=10, with_labels = False):
     """
       Layouts: [graphviz_layout, pydot_layout, bipartite_layout, circular_layout, kamada_kawai_layout, planar_layout, random_layout, rescale_layout,
-                spring_layout, spectral_layout, spiral_layout, multipartite_layout] 
+                spring_layout, spectral_layout, spiral_layout, multipartite_layout, force_layout] or a dict of positions
       Size_by: "color_by", None, List or "node_attribute" in G.nodes(data=True)
     """
     if title is None:
@@ -431,65 +759,46 @@ def visualize_network(G, color_by = None, size_by = None, title = None, layout =
         if size_by == "color_by":
             size_by = color_by 
     if layout is not None:
-        if layout == "graphviz_layout":
-            pos = nx.nx_pydot.graphviz_layout(G)
-        elif layout == "pydot_layout":
-            pos = nx.nx_pydot.pydot_layout(G)
-        elif layout == "bipartite_layout":
-            top = nx.bipartite.sets(G)[0]
-            pos = nx.bipartite_layout(G, top)
-        elif layout == "circular_layout":
-            pos = nx.circular_layout(G)
-        elif layout == "kamada_kawai_layout":
-            pos = nx.kamada_kawai_layout(G)
-        elif layout == "planar_layout":
-            pos = nx.planar_layout(G)
-        elif layout == "random_layout":
-            pos = nx.random_layout(G)
-        elif layout == "rescale_layout":
-            pos = nx.rescale_layout(G)
-        elif layout == "spring_layout":
-            pos = nx.spring_layout(G)
-        elif layout == "spectral_layout":
-            pos = nx.spectral_layout(G)
-        elif layout == "spiral_layout":
-            pos = nx.spiral_layout(G)
-        elif layout == "multipartite_layout":
-            pos = nx.multipartite_layout(G)
-        elif isinstance(layout, dict):
-            pos = layout
-
+        pos = layout if isinstance(layout, dict) else network_layout(G, layout)
         nx.set_node_attributes(G, pos, "pos")
 
-    edge_x = []
-    edge_y = []
-    edge_text = []
-    for edge in G.edges():
-        x0, y0 = G.nodes[edge[0]]['pos']
-        x1, y1 = G.nodes[edge[1]]['pos']
-        edge_x.append(x0)
-        edge_x.append(x1)
-        edge_x.append(None)
-        edge_y.append(y0)
-        edge_y.append(y1)
-        edge_y.append(None)
-        edge_text.append("Edge {} - {}".format(edge[0], edge[1]))
-
-    edge_trace = go.Scatter(
+    #positions and edges as arrays, the traces are built by a few numpy operations instead of per node loops
+    nodes = list(G.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    node_pos = np.array([G.nodes[node]['pos'] for node in nodes], dtype=float).reshape(-1, 2)
+    edge_list = list(G.edges(data="weight", default=1))
+    edges = np.array([(index[n1], index[n2]) for n1, n2, _ in edge_list], dtype=np.int64).reshape(-1, 2)
+    #browsers render WebGL traces of thousands of points without stalling, SVG ones don't
+    trace_type = "scattergl" if len(nodes) + len(edges) > WEBGL_MIN_ELEMENTS else "scatter"
+    if len(edges) > MAX_DRAWN_EDGES:
+        weights = np.array([weight for _, _, weight in edge_list], dtype=float)
+        kept = np.sort(np.argpartition(-weights, MAX_DRAWN_EDGES - 1)[:MAX_DRAWN_EDGES])
+        edges = edges[kept]
+        edge_list = [edge_list[i] for i in kept]
+    sources, targets = node_pos[edges[:, 0]], node_pos[edges[:, 1]]
+    #segments separated by NaN (a gap in the line)
+    gaps = np.full(len(edges), np.nan)
+    edge_x = np.column_stack([sources[:, 0], targets[:, 0], gaps]).ravel()
+    edge_y = np.column_stack([sources[:, 1], targets[:, 1], gaps]).ravel()
+
+    edge_trace = dict(
+                                  type=trace_type,
                                   x=edge_x, y=edge_y,
                                   line=dict(width=1.0, color=line_color), #0.5
-                                  hoverinfo='text',
-                                  text=edge_text,
+                                  hoverinfo='skip',
                                   mode='lines'
                             )
+    #hover of the edges on an invisible marker at their midpoint
+    middles = (sources + targets) / 2
+    edge_hover_trace = dict(
+                                  type=trace_type,
+                                  x=middles[:, 0], y=middles[:, 1],
+                                  mode='markers',
+                                  marker=dict(size=6, opacity=0),
+                                  hoverinfo='text',
+                                  text=["Edge {} - {}".format(n1, n2) for n1, n2, _ in edge_list]
+                            )
 
-    node_x = []
-    node_y = []
-    for node in G.nodes():
-        x, y = G.nodes[node]['pos']
-        node_x.append(x)
-        node_y.append(y)
-    
     if color_by == "color": #WITH LABELS OR NONE METHODS
         showscale = False
         marker = dict(
@@ -511,203 +820,364 @@ def visualize_network(G, color_by = None, size_by = None, title = None, layout =
                                   size=14,
                                   colorbar=dict(
                                     thickness=15,
-                                    title=color_by,
-                                    xanchor='left',
-                                    titleside='right'
+                                    title=dict(text=color_by, side='right'),
+                                    xanchor='left'
                                   )
                      )
 
+    if color_by is not None:
+        node_color = [G.nodes[node][color_by] for node in nodes]
+        if size_by is not None:
+            if any(isinstance(value, str) for value in node_color):
+                #categories sized by their rank, computed once for all the nodes
+                _, values = np.unique(np.array(node_color, dtype=str), return_inverse=True)
+                values = values + 1
+            else:
+                values = np.array(node_color, dtype=float)
+            marker["size"] = values * size_scale
+        marker["color"] = node_color
 
-    node_trace = go.Scatter(
-                               x=node_x, y=node_y,
+    node_trace = dict(
+                               type=trace_type,
+                               x=node_pos[:, 0], y=node_pos[:, 1],
                                mode= "markers",
                                hoverinfo="name+text",
                                marker = marker,
-                               line_width=2
-                               
+                               line=dict(width=2),
+                               #the positions are shown as plain tuples, not numpy arrays
+                               text=["Node: {}\n\n".format(node) + "".join("{}: {}\n".format(attribute_name, tuple(node_pos[i].tolist()) if attribute_name == "pos" else value) for attribute_name, value in attributes.items())
+                                     for i, (node, attributes) in enumerate(G.nodes(data=True))]
                             )
-    if color_by is not None:
-        node_color = []
-        node_size = []
-        for node, attributes in G.nodes(data=True):
-            value = attributes[color_by]
-            node_color.append(value)
-            if isinstance(value, str):
-                colors_str = [elem[color_by] for elem in list(dict(G.nodes(data=True)).values())]
-                map_size_with_color = {elem: i+1 for i, elem in enumerate(np.unique(colors_str))}
-                value = map_size_with_color[value]
-
-            if size_by is not None:
-                size = value*size_scale
-            else: 
-                size = 14
-            node_size.append(size)
-        node_trace.marker.color = node_color
-        if size_by is not None:
-            node_trace.marker.size = node_size
 
-    annotations = []
+    traces = [edge_trace, edge_hover_trace, node_trace]
     if with_labels:
-        for node in G.nodes(data=True):
-            annotations.append(
-                dict(
-                    x=node[1]["pos"][0],
-                    y=node[1]["pos"][1],
-                    text=node[0], # node name that will be displayed
-                    xanchor='left',
-                    xshift=10,
-                    font=dict(color=line_color, size=18), #14
-                    showarrow=False, arrowhead=1, ax=-10, ay=-10
-                )
-            )
-    
-    nodes_text = []
-    for node, attributes in G.nodes(data=True):
-        node_text = "Node: {}\n\n".format(node)
-        for attribute_name, value in dict(attributes).items():
-            node_text += "{}: {}\n".format(attribute_name, value)
-        nodes_text.append(node_text)
-    node_trace.text = nodes_text
-
-    #print(annotations)
-    fig = go.Figure(data=[edge_trace, node_trace],
-                      layout=go.Layout(
-                      title=title,
-                      title_font_size=24,
-                      title_font_color = line_color,
+        #node names as one text trace, one layout annotation per node is slow to render
+        traces.append(dict(
+                    type=trace_type,
+                    x=node_pos[:, 0], y=node_pos[:, 1],
+                    mode='text',
+                    text=[str(node) for node in nodes], # node name that will be displayed
+                    textposition='middle right',
+                    textfont=dict(color=line_color, size=18), #14
+                    hoverinfo='skip'
+                ))
+
+    #the traces are plain dicts and are not validated one element at a time, see fast_figure
+    fig = fast_figure(traces,
+                      dict(
+                      title=dict(text=title, font=dict(size=24, color=line_color)),
                       #font = {"color ": line_color},
                       showlegend= False,
                       hovermode='closest',
                       margin=dict(b=20,l=5,r=5,t=40),
                       xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
                       yaxis=dict(showgrid=False, zeroline=False, showticklabels=False), 
-                      template=template,
+                      template=pio.templates[template],
                       autosize=False, 
                       width=900, 
-                      height=800,
-                      annotations = annotations
+                      height=800
                       ),
     )
     return fig
 
-def request_protein_interactions_network(protein_id, threshold=0.4):
+def string_cache_key(method, identifiers, *params):
+    """
+    Returns:
+        key: str, cache key of a STRING request: the identifiers are upper cased, without duplicates and sorted
+             (the network and the link don't depend on their order)
+    """
+    identifiers = [identifiers] if isinstance(identifiers, str) else identifiers
+    identifiers = sorted({str(identifier).strip().upper() for identifier in identifiers})
+    return "|".join([method, str(STRING_SPECIES), *map(str, params), ",".join(identifiers)])
+
+def encode_network(G):
+    """
+    Compact form of a network for the STRING cache: the node names, the edges as arrays of node positions and
+    one array per edge attribute.
+    """
+    if G is None:
+        return b"null"
+    nodes = list(G.nodes)
+    positions = {node: i for i, node in enumerate(nodes)}
+    edges = list(G.edges(data=True))
+    names = list(dict.fromkeys(name for _, _, data in edges for name in data))
+    return json.dumps({"nodes": nodes, "sources": [positions[n1] for n1, _, _ in edges], "targets": [positions[n2] for _, n2, _ in edges],
+                       "attributes": {name: [data.get(name) for _, _, data in edges] for name in names}}).encode()
+
+def decode_network(value):
+
+    network = json.loads(value)
+    if network is None:
+        return None
+    G = nx.Graph()
+    G.add_nodes_from(network["nodes"])
+    nodes, attributes = network["nodes"], network["attributes"]
+    G.add_edges_from((nodes[n1], nodes[n2], {name: values[i] for name, values in attributes.items()}) for i, (n1, n2) in enumerate(zip(network["sources"], network["targets"])))
+    return G
+
+def string_chunks(identifiers):
+
+    return [identifiers[i:i+STRING_MAX_IDENTIFIERS] for i in range(0, len(identifiers), STRING_MAX_IDENTIFIERS)]
+
+def resolve_string_ids(identifiers):
+    """
+    Map gene names or ENSP ids to STRING proteins with one request per STRING_MAX_IDENTIFIERS identifiers.
+
+    Parameters:
+        identifiers: list of str, gene names or ENSP ids
+    Returns:
+        names: dict, identifier: preferred name of its STRING protein, only for the identifiers STRING knows
+    """
+    identifiers = list(dict.fromkeys(identifier for identifier in identifiers if identifier))
+    names = {}
+    if string_store is not None:
+        for identifier in identifiers:
+            nodes = string_store.resolve([identifier])
+            if len(nodes):
+                names[identifier] = str(string_store.names[nodes[0]])
+        return names
+
+    for chunk in string_chunks(identifiers):
+        key = string_cache_key("get_string_ids", chunk)
+        cached = string_cache.get(key)
+        if cached is not None:
+            names.update(json.loads(cached))
+            continue
+        request_url = "/".join([STRING_API_URL, "json", "get_string_ids"])
+        params = {
+
+            "identifiers" : "%0d".join(chunk),
+            "species" : STRING_SPECIES,
+            "limit" : 1, #best match of each identifier
+            "caller_identity" : "gtex_visualizer"
+
+        }
+        try:
+            matches = json.loads(post_text(request_url, params))
+        except ValueError: #error page instead of json
+            matches = []
+        resolved = {chunk[match["queryIndex"]]: match["preferredName"] for match in matches if isinstance(match, dict) and "preferredName" in match}
+        string_cache.set(key, json.dumps(resolved).encode())
+        names.update(resolved)
+    return names
+
+def request_genes_network(identifiers, threshold=0.4):
+    """
+    STRING network of several genes: their identifiers are resolved in one batch and their network is fetched by
+    one multi-identifier request, with ADD_NODES partners per gene added to the whole selection (the best linked
+    partners of the selection, a gene may get none of them).
+
+    Parameters:
+        identifiers: dict, gene name: list of its identifiers in order of preference (e.g. name then ENSP id)
+        threshold: float, minimum experimental score of the edges
+    Returns:
+        G: networkx Graph, None if STRING doesn't know any gene. The "gene" node attribute is the input gene
+           of the protein, or of the closest selected protein for the added partners (None if not connected),
+           "selected" is True for the proteins of the genes
+    """
+    names = resolve_string_ids([identifier for gene_identifiers in identifiers.values() for identifier in gene_identifiers])
+    seeds = {}
+    for gene, gene_identifiers in identifiers.items():
+        name = next((names[identifier] for identifier in gene_identifiers if identifier in names), None)
+        if name is not None:
+            seeds.setdefault(name, gene)
+    if not seeds:
+        return None
+
+    G = request_protein_interactions_network(list(seeds), threshold, add_nodes=ADD_NODES*len(seeds))
+    if G is None:
+        return None
+    sources = [seed for seed in seeds if seed in G]
+    _, paths = nx.multi_source_dijkstra(G, sources, weight=None) if sources else ({}, {})
+    nx.set_node_attributes(G, {node: seeds[paths[node][0]] if node in paths else None for node in G.nodes}, "gene")
+    nx.set_node_attributes(G, {node: node in seeds for node in G.nodes}, "selected")
+    return G
+
+def request_protein_interactions_network(protein_id, threshold=0.4, add_nodes=None):
+    """
+    STRING network of the proteins, from the local STRING store if built, otherwise from the STRING API going
+    through the STRING cache.
+
+    Parameters:
+        protein_id: list of str, protein names or ENSP ids
+        threshold: float, minimum experimental score of the edges
+        add_nodes: int, default None. Number of partners added to the whole set of proteins (not to each one), None
+                   for the STRING default (ADD_NODES for a single protein, none otherwise)
+    Returns:
+        G: networkx Graph, None if STRING doesn't know the proteins
+    """
+    if string_store is not None:
+        return string_store.network(protein_id, threshold, add_nodes=add_nodes)
+
+    key = string_cache_key("network", protein_id, threshold, add_nodes)
+    cached = string_cache.get(key)
+    if cached is not None:
+        return decode_network(cached)
+    G = request_api_protein_interactions_network(protein_id, threshold, add_nodes)
+    string_cache.set(key, encode_network(G))
+    return G
+
+def parse_string_network(lines, threshold=0.4):
+    """
+    Single pass parser of a STRING network tsv-no-header response: each line is filtered on its experimental
+    score as soon as it is read and only the kept edges are stored.
+
+    Parameters:
+        lines: iterable of str, lines of the response
+        threshold: float, minimum experimental score of the edges
+    Returns:
+        sources: list of str, preferred name of the first protein of the edges
+        targets: list of str, preferred name of the second protein of the edges
+        scores: numpy array (number of edges x STRING_NETWORK_CHANNELS), all the scores of the edges
+        None if STRING answered an error
+    """
+    channels = len(STRING_NETWORK_CHANNELS)
+    experimental = 5 + STRING_NETWORK_CHANNELS.index("experimental")
+    sources, targets, scores = [], [], []
+    for line in lines:
+        if "Error" in line:
+            return None
+        l = line.rstrip("\r").split("\t")
+        if len(l) < 5 + channels:
+            continue
+        ## filter the interaction according to experimental score
+        if float(l[experimental]) > threshold:
+            sources.append(l[2])
+            targets.append(l[3])
+            scores.append(l[5:5+channels])
+    return sources, targets, np.array(scores, dtype=float).reshape(-1, channels)
+
+def request_api_protein_interactions_network(protein_id, threshold=0.4, add_nodes=None):
     
-    string_api_url = "https://version-11-5.string-db.org/api"
     output_format = "tsv-no-header"
     method = "network"
-    request_url = "/".join([string_api_url, output_format, method])
-    
-    params = {
-
-        "identifiers" : "%0d".join(protein_id), # your protein
-        "species" : 9606, # species NCBI identifier 
-         #"caller_identity" : "test_for_now" # your app name
+    request_url = "/".join([STRING_API_URL, output_format, method])
+    parsed = []
 
-    }
-
-    response = requests.post(request_url, data=params)
-    edgelist = []
-    weights = {}
+    #links between proteins of different chunks are missing, only for selections above STRING_MAX_IDENTIFIERS
+    for chunk in string_chunks(list(protein_id)):
+        params = {
 
-    if "Error" in response.text:
-        return None 
-    else:
-        for line in response.text.strip().split("\n"):
+            "identifiers" : "%0d".join(chunk), # your protein
+            "species" : STRING_SPECIES, # species NCBI identifier 
+             #"caller_identity" : "test_for_now" # your app name
 
-            l = line.strip().split("\t")
+        }
+        if add_nodes is not None:
+            params["add_nodes"] = round(add_nodes * len(chunk) / len(protein_id))
 
-            n1, n2 = l[2], l[3]
+        edges = post_lines(request_url, params, parse_string_network, threshold)
+        if edges is not None:
+            parsed.append(edges)
 
-            ## filter the interaction according to experimental score
-            experimental_score = float(l[10])
-            if experimental_score > threshold:
+    if not parsed:
+        return None
+    #one graph for all the chunks, built once
+    sources = [source for edges in parsed for source in edges[0]]
+    targets = [target for edges in parsed for target in edges[1]]
+    return string_network_graph(sources, targets, np.concatenate([edges[2] for edges in parsed]))
 
-                #print("\t".join([n1, n2, "experimentally confirmed (prob. %.3f)" % experimental_score])) 
-                edgelist.append([n1, n2])
-                weights[(n1, n2)] = experimental_score
-            
-            G = nx.from_edgelist(edgelist)
-    
-            for (n1, n2), weight in weights.items():
-                 G[n1][n2]['weight'] = weight
-        return G
+def string_network_graph(sources, targets, scores):
+    """
+    Returns:
+        G: networkx Graph of the parsed edges, with the STRING_NETWORK_CHANNELS scores as edge attributes and
+           the experimental score as weight
+    """
+    weight = STRING_NETWORK_CHANNELS.index("experimental")
+    G = nx.Graph()
+    G.add_edges_from((n1, n2, dict(zip(STRING_NETWORK_CHANNELS, score), weight=score[weight])) for n1, n2, score in zip(sources, targets, scores.tolist()))
+    return G
 
 def get_url_string(protein_name):
     
-    string_api_url = "https://version-11-5.string-db.org/api"
+    if string_store is not None:
+        #link to the same network on the STRING website, without the get_link round trip
+        identifiers = [protein_name] if isinstance(protein_name, str) else protein_name
+        return "https://version-{}.string-db.org/cgi/network?identifiers={}&species={}".format(string_store.version.replace(".", "-"), "%0d".join(identifiers), string_store.species)
+
+    key = string_cache_key("get_link", protein_name)
+    cached = string_cache.get(key)
+    if cached is not None:
+        return cached.decode()
+
     output_format = "tsv-no-header"
     method = "get_link"
-    request_url = "/".join([string_api_url, output_format, method])
+    request_url = "/".join([STRING_API_URL, output_format, method])
     
     params = {
 
         "identifiers" : protein_name, # your protein
-        "species" : 9606, # species NCBI identifier for HUMAN proteins
+        "species" : STRING_SPECIES, # species NCBI identifier for HUMAN proteins
         "caller_identity" : "gtex_visualizer" 
 
     }
 
-    response = requests.post(request_url, data=params).text    
+    response = post_text(request_url, params)
+    #an error message instead of a link is returned but not cached
+    if response.startswith("http"):
+        string_cache.set(key, response.encode())
     return response
 
 
 #multi dropdown tissues plot (up to 20 tissues)
 
-def multi_tissues_violin_plot(gene, gene_name, tissues):
+def multi_tissues_violin_plot(gene, gene_name, tissues, groups = None):
    
-    df = request_api_gene_expression(gene)
+    if groups is None:
+        groups = extract_expression_groups(request_api_gene_expression(gene))
     limit = 20
-    fig = go.Figure()
-    unique_tissues = np.unique(tissues)
+    traces = []
+    unique_tissues = [tissue for tissue in np.unique(tissues) if tissue != "All"][:limit]
     selected_colors = []
-    for tissue in unique_tissues[:limit]:
-        if tissue != "All":
-            while(True):
-                color = random.sample(colors, 1)[0]
-                if color not in selected_colors:
-                    selected_colors.append(color)
-                    break
-            data = [float(elem) for elem in list(df[df['tissueSiteDetailId'] == tissue].values[0])]
-            fig.add_trace(go.Violin(x0=tissue, y=data, name=tissue, box_visible=True, line_color=line_color, meanline_visible=True, fillcolor=color, points="outliers", opacity=0.8))
-    fig.update_layout(template=template, hovermode='x unified', yaxis_title="TPM", title= "Violin plot of Gene {} and First {} Tissues selected".format(gene_name, limit), autosize=False, width=1500, height=800, xaxis=dict(rangeslider=dict(
-                     visible=True)))
-    return fig, pd.DataFrame.from_dict({tissue: list(df[df['tissueSiteDetailId'] == tissue].values[0]) for tissue in unique_tissues[:limit]}, orient='index')
+    data = {}
+    for tissue in unique_tissues:
+        while(True):
+            color = random.sample(colors, 1)[0]
+            if color not in selected_colors:
+                selected_colors.append(color)
+                break
+        data[tissue] = groups[(tissue, None)]
+        traces.append(violin_trace(tissue, data[tissue], tissue, color))
+    title = "Violin plot of Gene {} and First {} Tissues selected".format(gene_name, limit)
+    fig = fast_figure(traces, violin_layout(title))
+    return fig, pd.DataFrame.from_dict(data, orient='index'), list(data.values())
 
 #multi dropdown genes plots (up to 2 genes and all tissues)
 
-def multi_genes_violin_plot(genes, genes_name, tissues):
+def multi_genes_violin_plot(genes, genes_name, tissues, groups = None):
+    """
+    Parameters:
+        groups: dict, default None. gencode id: expression groups of the gene, fetched if None
+    """
 
-    dfs = {}
-    for gene in genes:
-        dfs[gene] = request_api_gene_expression(gene)
-    
     limit_total = 40
-    unique_tissues = np.unique(tissues)
-    unique_genes = np.unique(genes)
-    unique_genes_name = np.unique(genes_name)
-    if len(unique_genes)*len(unique_tissues) > limit_total:
-        if len(unique_genes) > 2:
-            limit_g = 2
-        if len(unique_tissues) > 20:
-            limit_t = 20
-    else:
-        limit_g = len(unique_genes)
-        limit_t = len(unique_tissues)
-
-    fig = go.Figure()
+    unique_tissues = [tissue for tissue in np.unique(tissues) if tissue != "All"]
+    #keep each gencode id with its gene name
+    unique_genes = list(dict.fromkeys(zip(genes, genes_name)))
+    limit_g = len(unique_genes)
+    limit_t = len(unique_tissues)
+    if limit_g*limit_t > limit_total:
+        limit_g = min(limit_g, 2)
+        limit_t = min(limit_t, 20)
+
+    if groups is None:
+        groups = {gene: extract_expression_groups(request_api_gene_expression(gene)) for gene, _ in unique_genes[:limit_g]}
+    traces = []
 
     selected_colors = []
-    for i, gene in enumerate(unique_genes[:limit_g]): 
-        gene_name = unique_genes_name[i]
+    data = {}
+    ys = []
+    for gene, gene_name in unique_genes[:limit_g]: 
+        data[gene] = {}
         for tissue in unique_tissues[:limit_t]:
-            if tissue != "All":
-                while(True):
-                    color = random.sample(colors, 1)[0]
-                    if color not in selected_colors:
-                        selected_colors.append(color)
-                    break
-                data = [float(elem) for elem in list(dfs[gene][dfs[gene]['tissueSiteDetailId'] == tissue].values[0])]
-                fig.add_trace(go.Violin(x0=tissue, y=data, name="{}_{}".format(gene_name, tissue), box_visible=True, line_color=line_color, meanline_visible=True, fillcolor=color, points="outliers", opacity=0.8))
-    fig.update_layout(violinmode='group', hovermode='x unified', template=template, yaxis_title="TPM", title= "Violin plot of First {} Genes and First {} Tissues selected".format(limit_g, limit_t), autosize=False, width=1500, height=800, xaxis=dict(rangeslider=dict(
-                     visible=True)))
-    return fig, pd.DataFrame.from_dict({gene: {tissue: list(dfs[gene][dfs[gene]['tissueSiteDetailId'] == tissue].values[0]) for tissue in unique_tissues[:limit_t]} for gene in unique_genes[:limit_g]}, orient='index')
+            while(True):
+                color = random.sample(colors, 1)[0]
+                if color not in selected_colors:
+                    selected_colors.append(color)
+                break
+            data[gene][tissue] = groups[gene][(tissue, None)]
+            ys.append(data[gene][tissue])
+            traces.append(violin_trace(tissue, data[gene][tissue], "{}_{}".format(gene_name, tissue), color))
+    title = "Violin plot of First {} Genes and First {} Tissues selected".format(limit_g, limit_t)
+    fig = fast_figure(traces, violin_layout(title, violinmode="group"))
+    return fig, pd.DataFrame.from_dict(data, orient='index'), ys
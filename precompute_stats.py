@@ -0,0 +1,142 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Genome wide Anova and Kruskal tables for the ranking view                       *
+*                                                                                                           *
+*************************************************************************************************************
+
+Batch job running the "Group by Gender" and "Group by Age" tests of every gene in every tissue:
+
+    python precompute_stats.py [output_file] [workers]
+
+Genes are processed by a pool of processes and committed as they complete, so an interrupted run resumes from
+the genes not stored yet. The expression data comes from the offline expression store if built (see
+expression_store.py), otherwise from the GTex API without going through the expression cache of the app:
+every gene is read once, caching them would only evict the genes the users look at.
+"""
+
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from batch_stats import anova, kruskal, ragged
+
+GENE_STATS_FILE = os.environ.get("GTEX_GENE_STATS", "gene_stats.sqlite")
+#grouping -> GTex attribute subset, the names are the ones of the "Plot by" dropdown
+GROUPINGS = {"Group by Gender": "sex", "Group by Age": "ageBracket"}
+RANK_COLUMNS = ["anova_p", "kruskal_p", "anova_f", "kruskal_h"]
+COMMIT_EVERY = 50
+
+def create_tables(conn):
+
+    #WITHOUT ROWID clustered on (grouping, tissue): a ranking query reads one contiguous range of the file
+    conn.execute("""CREATE TABLE IF NOT EXISTS gene_stats (grouping TEXT, tissue TEXT, gene_id INTEGER, n INTEGER,
+                    anova_f REAL, anova_p REAL, kruskal_h REAL, kruskal_p REAL, PRIMARY KEY (grouping, tissue, gene_id)) WITHOUT ROWID""")
+    conn.execute("CREATE TABLE IF NOT EXISTS genes (gene_id INTEGER PRIMARY KEY, symbol TEXT UNIQUE, gencode_id TEXT)")
+
+def gene_stats(symbol, gencode_id):
+    """
+    Tests of one gene, run in the worker processes.
+
+    Returns:
+        rows: list of (grouping, tissue, n, anova_f, anova_p, kruskal_h, kruskal_p)
+    """
+    from make_plots import request_api_gene_expression_data
+
+    rows = []
+    for grouping, attribute_subset in GROUPINGS.items():
+        groups = {}
+        for record in request_api_gene_expression_data(gencode_id, attribute_subset, use_cache=False):
+            groups.setdefault(record["tissueSiteDetailId"], []).append(np.asarray(record["data"], dtype=np.float32))
+        for tissue, ys in groups.items():
+            values, offsets = ragged(ys)
+            rows.append((grouping, tissue, len(values), *anova(values, offsets), *kruskal(values, offsets)))
+    return rows
+
+def precompute_stats(genes, output_file = GENE_STATS_FILE, workers = None):
+    """
+    Parameters:
+        genes: list of (symbol, gencode id)
+        output_file: str, SQLite file of the results, the genes already in it are skipped
+        workers: int, default None (number of CPUs). Number of worker processes
+    """
+    conn = sqlite3.connect(output_file)
+    conn.execute("PRAGMA journal_mode=WAL")
+    create_tables(conn)
+    done = {row[0] for row in conn.execute("SELECT symbol FROM genes")}
+    todo = [(symbol, gencode_id) for symbol, gencode_id in genes if symbol not in done]
+    print("{} genes done, {} to go".format(len(done), len(todo)))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(gene_stats, symbol, gencode_id): (symbol, gencode_id) for symbol, gencode_id in todo}
+        for i, future in enumerate(as_completed(futures), 1):
+            symbol, gencode_id = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                #not marked as done, retried by the next run
+                print("Failed {} {}: {}".format(symbol, gencode_id, e))
+                continue
+            #the gene row is the checkpoint, written in the same transaction as its results
+            gene_id = conn.execute("INSERT INTO genes (symbol, gencode_id) VALUES (?, ?)", (symbol, gencode_id)).lastrowid
+            conn.executemany("INSERT OR REPLACE INTO gene_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?)", ((grouping, tissue, gene_id, *values) for grouping, tissue, *values in rows))
+            if i % COMMIT_EVERY == 0:
+                conn.commit()
+                print("Done {}/{} genes".format(i, len(todo)))
+    conn.commit()
+    conn.close()
+
+class StatsTable:
+    """
+    Read only view of the results for the ranking view of the app.
+
+    Parameters:
+        path: str, SQLite file written by precompute_stats
+    """
+
+    def __init__(self, path = GENE_STATS_FILE):
+
+        self.path = os.path.abspath(path)
+
+    def _connection(self):
+
+        return sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True)
+
+    def rank(self, tissue, grouping, order_by = "kruskal_p", gene_query = "", limit = 100):
+        """
+        Parameters:
+            tissue: str, GTex tissue id
+            grouping: str, "Group by Gender" or "Group by Age"
+            order_by: str, one of RANK_COLUMNS. p values are sorted ascending, statistics descending
+            gene_query: str, default "". Only the genes whose symbol starts with it
+            limit: int, maximum number of rows
+        Returns:
+            rows: list of dict, with the gene symbol, gencode id, number of samples and the tests results
+        """
+        if order_by not in RANK_COLUMNS:
+            raise ValueError("Can't rank by {}".format(order_by))
+        direction = "ASC" if order_by.endswith("_p") else "DESC"
+        conn = self._connection()
+        rows = conn.execute("""SELECT symbol, gencode_id, n, anova_f, anova_p, kruskal_h, kruskal_p FROM gene_stats JOIN genes USING (gene_id)
+                               WHERE grouping = ? AND tissue = ? AND {0} IS NOT NULL AND symbol LIKE ? ORDER BY {0} {1} LIMIT ?""".format(order_by, direction),
+                            (grouping, tissue, gene_query.strip().upper().replace("%", "") + "%", limit)).fetchall()
+        conn.close()
+        columns = ["gene", "gencode_id", "n", "anova_f", "anova_p", "kruskal_h", "kruskal_p"]
+        return [dict(zip(columns, row)) for row in rows]
+
+def load_stats_table(path = GENE_STATS_FILE):
+    """
+    Returns:
+        table: StatsTable, None if precompute_stats.py was not run
+    """
+    if not os.path.exists(path):
+        return None
+    return StatsTable(path)
+
+if __name__ == "__main__":
+
+    from gene_index import GeneIndex
+    precompute_stats(GeneIndex().items(), sys.argv[1] if len(sys.argv) > 1 else GENE_STATS_FILE, int(sys.argv[2]) if len(sys.argv) > 2 else None)
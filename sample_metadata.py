@@ -0,0 +1,129 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Local table of the GTex samples attributes                                      *
+*                                                                                                           *
+*************************************************************************************************************
+
+The pie charts only need the number of samples of each tissue by sex, age bracket, hardy scale and autolysis
+score, which do not depend on the selected gene. Run this script once (and again for a new GTex release) to
+download all the samples from /dataset/sample and store them as a compact columnar table:
+
+    python sample_metadata.py [output_file]
+"""
+
+import os
+import sys
+import numpy as np
+from http_client import HttpClient
+
+GTEX_API_URL = "https://gtexportal.org/api/v2"
+GTEX_DATASET_ID = "gtex_v10"
+SAMPLE_METADATA_FILE = os.environ.get("GTEX_SAMPLE_METADATA", "sample_metadata.npz")
+SAMPLE_COLUMNS = ["tissueSiteDetailId", "sex", "ageBracket", "hardyScale", "autolysisScore"]
+
+def request_all_samples(dataset_id = GTEX_DATASET_ID, items_per_page = 1000):
+    """
+    Download every sample of the dataset, following the pagination of the GTex API.
+
+    Returns:
+        samples: list of dict, the records of all the pages
+    """
+    http = HttpClient(read_timeout=60)
+    samples = []
+    page = 0
+    while True:
+        response = http.get("{}/dataset/sample?datasetId={}&format=json&page={}&itemsPerPage={}&sortBy=sampleId&sortDirection=asc".format(GTEX_API_URL, dataset_id, page, items_per_page))
+        response.raise_for_status()
+        results = response.json()
+        samples.extend(results["data"])
+        number_of_pages = results["paging_info"]["numberOfPages"]
+        print("Downloaded page {}/{}".format(page+1, number_of_pages))
+        page += 1
+        if page >= number_of_pages:
+            break
+    return samples
+
+def save_sample_metadata(samples, output_file = SAMPLE_METADATA_FILE, dataset_id = GTEX_DATASET_ID):
+    """
+    Save the samples as a columnar .npz: for each attribute in SAMPLE_COLUMNS an array of small integer codes
+    and the list of its categories.
+
+    Parameters:
+        samples: list of dict, records with sampleId and the SAMPLE_COLUMNS attributes (as returned by /dataset/sample)
+    """
+    columns = {"sampleId": np.array([sample["sampleId"] for sample in samples]), "datasetId": np.array(dataset_id)}
+    for column in SAMPLE_COLUMNS:
+        values = np.array([str(sample.get(column) or "") for sample in samples])
+        categories, codes = np.unique(values, return_inverse=True)
+        columns[column + "_categories"] = categories
+        columns[column + "_codes"] = codes.astype(np.uint16)
+    np.savez_compressed(output_file, **columns)
+    print("Saved {} samples to {}".format(len(samples), output_file))
+
+def build_sample_metadata(output_file = SAMPLE_METADATA_FILE, dataset_id = GTEX_DATASET_ID):
+    """
+    Crawl the samples of the dataset from the GTex API and save them with save_sample_metadata.
+    """
+    save_sample_metadata(request_all_samples(dataset_id), output_file, dataset_id)
+
+class SampleTable:
+    """
+    In memory samples table. The number of samples of each (tissue, attribute value) pair is computed once
+    when the table is loaded, the count methods are then dictionary lookups.
+
+    Parameters:
+        path: str, .npz file written by build_sample_metadata
+    """
+
+    def __init__(self, path = SAMPLE_METADATA_FILE):
+
+        with np.load(path) as table:
+            self.dataset_id = str(table["datasetId"])
+            self.n_samples = len(table["sampleId"])
+            self.tissues = list(table["tissueSiteDetailId_categories"])
+            tissue_codes = table["tissueSiteDetailId_codes"].astype(np.int64)
+            self._counts = {}
+            for column in SAMPLE_COLUMNS[1:]:
+                categories = list(table[column + "_categories"])
+                codes = table[column + "_codes"].astype(np.int64)
+                #group by tissue and value with a single bincount over the flattened pair index
+                counts = np.bincount(tissue_codes * len(categories) + codes, minlength=len(self.tissues)*len(categories))
+                counts = counts.reshape(len(self.tissues), len(categories))
+                self._counts[column] = {tissue: dict(zip(categories, counts[i].tolist())) for i, tissue in enumerate(self.tissues)}
+
+    def counts(self, column, tissue, values):
+        """
+        Returns:
+            counts: dict {value: number of samples of tissue with column == value}, in the order of values
+        """
+        tissue_counts = self._counts[column].get(tissue, {})
+        return {value: tissue_counts.get(value, 0) for value in values}
+
+    def counts_all_tissues(self, column, values, tissues = None):
+        """
+        Returns:
+            counts: dict {tissue: {value: number of samples}}
+        """
+        if tissues is None:
+            tissues = self.tissues
+        return {tissue: self.counts(column, tissue, values) for tissue in tissues}
+
+def load_sample_table(path = SAMPLE_METADATA_FILE, dataset_id = GTEX_DATASET_ID):
+    """
+    Returns:
+        table: SampleTable, None if the file was not built yet or belongs to another dataset.
+    """
+    if not os.path.exists(path):
+        return None
+    table = SampleTable(path)
+    if table.dataset_id != dataset_id:
+        print("Ignoring {}: built for {} instead of {}".format(path, table.dataset_id, dataset_id))
+        return None
+    return table
+
+if __name__ == "__main__":
+
+    build_sample_metadata(sys.argv[1] if len(sys.argv) > 1 else SAMPLE_METADATA_FILE)
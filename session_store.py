@@ -0,0 +1,70 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Server side state of each browser session                                       *
+*                                                                                                           *
+*************************************************************************************************************
+
+The callbacks keep the figures and the last query of each user here instead of module globals, so any worker
+(process or thread) can serve any request. Every value is a separate entry of a DiskCache keyed by session id
+and name: two callbacks of the same session running in parallel (e.g. violin and PPI) update different keys
+and never overwrite each other's state. Values that are only valid together (e.g. a query and its figures)
+must be one value, the entries are evicted one by one.
+"""
+
+import pickle
+from disk_cache import DiskCache
+
+class Session:
+    """
+    State of one session, values are read from and written to the store at each get/set.
+
+    Parameters:
+        store: SessionStore
+        session_id: str, id kept by the browser in the session-id dcc.Store
+    """
+
+    def __init__(self, store, session_id):
+
+        self.store = store
+        self.session_id = session_id
+
+    def _key(self, name):
+
+        return "{}|{}".format(self.session_id, name)
+
+    def get(self, name, default = None):
+
+        value = self.store.cache.get(self._key(name))
+        if value is None:
+            return self.store.defaults.get(name, default)
+        return pickle.loads(value)
+
+    def set(self, name, value):
+
+        self.store.cache.set(self._key(name), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def update(self, **values):
+
+        for name, value in values.items():
+            self.set(name, value)
+
+class SessionStore:
+    """
+    Parameters:
+        path: str, SQLite file shared by all the workers
+        max_bytes: int, byte budget of all the sessions (compressed), the least recently used values are evicted
+        ttl: float, seconds of inactivity after which the values of a session expire
+        defaults: dict, default {}. Value returned for names never set (or expired)
+    """
+
+    def __init__(self, path, max_bytes = 512*1024*1024, ttl = 2*60*60, defaults = None):
+
+        self.cache = DiskCache(path, max_bytes=max_bytes, ttl=ttl, idle_ttl=True)
+        self.defaults = defaults or {}
+
+    def session(self, session_id):
+
+        return Session(self, session_id)
@@ -0,0 +1,207 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Single-flight de-duplication of concurrent requests                             *
+*                                                                                                           *
+*************************************************************************************************************
+
+SingleFlight shares a call between the threads of a process. The background callbacks run each job in its own
+process, so SharedSingleFlight also shares it between processes: the leader holds a lease row in a SQLite file
+and leaves its pickled result there for the processes waiting on the lease.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution: the first caller runs the function, the others
+    wait for it and get the same result (or the same exception). Once the call returns the key is forgotten,
+    so later calls run again.
+    """
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Parameters:
+            key: hashable, identifies identical calls (for example method and url of a request)
+            function: callable, called with *args and **kwargs only by the first caller
+        Returns:
+            result: the value returned by function
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+class SharedSingleFlight:
+    """
+    SingleFlight shared by all the processes using the same SQLite file. The threads of a process wait on an
+    in memory SingleFlight, its leader then takes the lease of the key or polls the result of the process
+    holding it. A lease is taken over when its process is gone (e.g. a cancelled background job) or after
+    lease_seconds.
+
+    Parameters:
+        path: str, path of the SQLite file, created if missing.
+        lease_seconds: float, longest call, after which a lease is considered abandoned.
+        poll_interval: float, seconds between two checks of a waiting process.
+        result_ttl: float, seconds the results (and errors) of the leaders are kept for the waiting processes.
+    """
+
+    def __init__(self, path, lease_seconds = 120, poll_interval = 0.05, result_ttl = 60):
+
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._local = threading.local()
+        self._flight = SingleFlight()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, token TEXT, pid INTEGER, expires REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS results (token TEXT PRIMARY KEY, value BLOB, created REAL)")
+
+    def _connection(self):
+        #one connection per process and thread, sqlite connections can't be shared after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Parameters:
+            key: identifies identical calls, its repr is the key of the lease
+            function: callable, called with *args and **kwargs only by the leader of all the processes. Its
+                      result (or exception) must be picklable to be shared with the other processes
+        Returns:
+            result: the value returned by function
+        """
+        return self._flight.do(key, self._do, repr(key), function, args, kwargs)
+
+    def _do(self, key, function, args, kwargs):
+
+        while True:
+            token, leader = self._acquire(key)
+            if leader:
+                break
+            value = self._wait(key, token)
+            if value is not None:
+                failed, result = pickle.loads(value)
+                if failed:
+                    raise result
+                return result
+            #the leader died without a result, the next process takes the lease
+
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self._store(token, (True, e))
+            raise
+        else:
+            self._store(token, (False, result))
+            return result
+        finally:
+            self._connection().execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+
+    def _acquire(self, key):
+        """
+        Returns:
+            token: str, token of the current lease of key
+            leader: bool, True if the lease was taken by this process
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT token, pid, expires FROM leases WHERE key = ?", (key, )).fetchone()
+            if row is not None and row[2] > now and process_alive(row[1]):
+                return row[0], False
+            token = uuid.uuid4().hex
+            conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?)", (key, token, os.getpid(), now + self.lease_seconds))
+            return token, True
+        finally:
+            conn.execute("COMMIT")
+
+    def _wait(self, key, token):
+        """
+        Returns:
+            value: bytes, pickled (failed, result) of the leader holding token, None if the lease was abandoned
+        """
+        conn = self._connection()
+        while True:
+            row = conn.execute("SELECT value FROM results WHERE token = ?", (token, )).fetchone()
+            if row is not None:
+                return row[0]
+            lease = conn.execute("SELECT token, pid, expires FROM leases WHERE key = ?", (key, )).fetchone()
+            if lease is None or lease[0] != token:
+                #released between the two queries: the result may have been written just before
+                row = conn.execute("SELECT value FROM results WHERE token = ?", (token, )).fetchone()
+                return None if row is None else row[0]
+            if lease[2] <= time.time() or not process_alive(lease[1]):
+                return None
+            time.sleep(self.poll_interval)
+
+    def _store(self, token, outcome):
+
+        try:
+            value = pickle.dumps(outcome)
+        except Exception:
+            #not shareable, the waiting processes call function themselves
+            return
+        conn = self._connection()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (token, value, now))
+        conn.execute("DELETE FROM results WHERE created < ?", (now - self.result_ttl, ))
+
+def process_alive(pid):
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
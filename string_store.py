@@ -0,0 +1,247 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Offline STRING interactions store                                               *
+*                                                                                                           *
+*************************************************************************************************************
+
+Local replacement of the STRING network API for the PPI plots. Download from string-db.org the human detailed
+links and protein info files, then run once:
+
+    python string_store.py 9606.protein.links.detailed.v11.5.txt.gz 9606.protein.info.v11.5.txt.gz [output_dir]
+
+The links are stored as a compressed sparse row (CSR) adjacency matrix: the neighbors of a protein are one
+contiguous slice of indices.npy (read through a memory map) and scores.npy holds the score channels of each
+edge (neighborhood, ..., experimental, ..., combined_score) as integers in [0, 1000]. Proteins are found by
+ENSP id (with or without the taxon prefix) or preferred name.
+"""
+
+import gzip
+import json
+import os
+import sys
+import numpy as np
+import networkx as nx
+import pandas as pd
+
+STRING_VERSION = "11.5"
+STRING_SPECIES = 9606
+STRING_STORE_DIR = os.environ.get("STRING_STORE", "string_store")
+CHUNK_LINKS = 1000000
+#defaults of the STRING network API: medium confidence and, for a single protein, its 10 best partners
+REQUIRED_SCORE = 400
+ADD_NODES = 10
+
+def open_text(path):
+
+    return gzip.open(path, "rt") if path.endswith(".gz") else open(path, "r")
+
+def build_string_store(links_file, info_file, output_dir = STRING_STORE_DIR, version = STRING_VERSION, species = STRING_SPECIES):
+    """
+    Stream the links file CHUNK_LINKS lines at a time into the CSR store.
+
+    Parameters:
+        links_file: str, STRING protein.links.detailed file (.txt or .txt.gz, space separated with header)
+        info_file: str, STRING protein.info file (#string_protein_id, preferred_name columns)
+        output_dir: str, directory of the store
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    info = pd.read_csv(info_file, sep="\t", usecols=[0, 1], dtype=str)
+    proteins = info.iloc[:, 0].to_numpy()
+    names = info.iloc[:, 1].fillna("").to_numpy()
+    names = np.where(names == "", proteins, names)
+
+    with open_text(links_file) as f:
+        channels = f.readline().split()[2:]
+    rows, cols, scores = [], [], []
+    dropped = 0
+    for chunk in pd.read_csv(links_file, sep=" ", chunksize=CHUNK_LINKS, dtype={"protein1": str, "protein2": str}):
+        sources = pd.Categorical(chunk["protein1"], categories=proteins).codes
+        targets = pd.Categorical(chunk["protein2"], categories=proteins).codes
+        known = (sources >= 0) & (targets >= 0)
+        dropped += int((~known).sum())
+        rows.append(sources[known].astype(np.int32))
+        cols.append(targets[known].astype(np.int32))
+        scores.append(chunk[channels].to_numpy()[known].astype(np.uint16))
+        print("Read {} links".format(sum(len(r) for r in rows)))
+    rows, cols, scores = np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+    if dropped:
+        print("Dropped {} links of proteins missing from {}".format(dropped, info_file))
+
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(len(proteins) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(proteins)), out=indptr[1:])
+    np.save(os.path.join(output_dir, "indptr.npy"), indptr)
+    np.save(os.path.join(output_dir, "indices.npy"), cols[order])
+    np.save(os.path.join(output_dir, "scores.npy"), scores[order])
+    #ids without the taxon prefix, as the ENSP ids of the gene index
+    np.save(os.path.join(output_dir, "proteins.npy"), np.array([protein.split(".", 1)[-1] for protein in proteins]))
+    np.save(os.path.join(output_dir, "names.npy"), names.astype(str))
+    with open(os.path.join(output_dir, "meta.json"), "w") as f:
+        json.dump({"version": str(version), "species": int(species), "channels": channels, "proteins": len(proteins), "links": len(cols)}, f)
+    print("Saved {} proteins and {} links to {}".format(len(proteins), len(cols), output_dir))
+
+class StringStore:
+    """
+    Read side of the store, a drop-in source for request_protein_interactions_network.
+
+    Parameters:
+        path: str, directory written by build_string_store
+    """
+
+    def __init__(self, path = STRING_STORE_DIR):
+
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.version = meta["version"]
+        self.species = meta["species"]
+        self.channels = meta["channels"]
+        self.indptr = np.load(os.path.join(path, "indptr.npy"))
+        self.indices = np.load(os.path.join(path, "indices.npy"), mmap_mode="r")
+        self.scores = np.load(os.path.join(path, "scores.npy"), mmap_mode="r")
+        self.proteins = np.load(os.path.join(path, "proteins.npy"))
+        self.names = np.load(os.path.join(path, "names.npy"))
+        #upper case preferred names, then ENSP ids with and without the taxon prefix (the ids win on collisions)
+        self.index = {name.upper(): i for i, name in enumerate(self.names)}
+        self.index.update({protein.upper(): i for i, protein in enumerate(self.proteins)})
+        self.index.update({"{}.{}".format(self.species, protein).upper(): i for i, protein in enumerate(self.proteins)})
+
+    def __len__(self):
+
+        return len(self.proteins)
+
+    def channel(self, name):
+        """
+        Returns:
+            column: int, column of the score channel name in scores.npy
+        """
+        return self.channels.index(name)
+
+    def resolve(self, identifiers):
+        """
+        Returns:
+            nodes: array of int, the proteins of identifiers (ENSP ids or preferred names) found in the store,
+                   in order and without duplicates
+        """
+        nodes = (self.index.get(str(identifier).strip().upper()) for identifier in identifiers)
+        return np.array(list(dict.fromkeys(node for node in nodes if node is not None)), dtype=np.int64)
+
+    def neighbors(self, node, min_score = 0, channel = "combined_score"):
+        """
+        Returns:
+            nodes: array of int, neighbors of node with a score of at least min_score on channel
+            scores: array of int, their scores on channel
+        """
+        start, end = self.indptr[node], self.indptr[node + 1]
+        scores = np.asarray(self.scores[start:end, self.channel(channel)])
+        keep = scores >= min_score
+        return np.asarray(self.indices[start:end])[keep], scores[keep]
+
+    def _links(self, nodes):
+        #positions of all the links of nodes in indices/scores, with their source, for a single gather
+        starts, ends = self.indptr[nodes], self.indptr[nodes + 1]
+        positions = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] or [np.zeros(0, dtype=np.int64)])
+        return np.repeat(nodes, ends - starts), positions
+
+    def expand(self, nodes, hops = 1, min_score = REQUIRED_SCORE, channel = "combined_score", limit = None):
+        """
+        k-hop expansion of a set of proteins.
+
+        Parameters:
+            nodes: array of int, seed proteins
+            hops: int, number of expansions
+            min_score: int, minimum score of the followed links on channel
+            limit: int, default None. At each hop only the limit new proteins with the best links are added
+        Returns:
+            nodes: array of int, the seeds followed by the added proteins
+        """
+        selected = list(nodes)
+        seen = set(selected)
+        frontier = np.asarray(nodes, dtype=np.int64)
+        for _ in range(hops):
+            if len(frontier) == 0:
+                break
+            _, positions = self._links(frontier)
+            targets, scores = np.asarray(self.indices[positions]), np.asarray(self.scores[positions, self.channel(channel)])
+            keep = scores >= min_score
+            targets, scores = targets[keep], scores[keep]
+            #best score of each new protein, then the best proteins first
+            order = np.argsort(-scores, kind="stable")
+            new = [int(target) for target in dict.fromkeys(targets[order].tolist()) if target not in seen][:limit]
+            seen.update(new)
+            selected.extend(new)
+            frontier = np.array(new, dtype=np.int64)
+        return np.array(selected, dtype=np.int64)
+
+    def edges(self, nodes, min_score = 0, channel = "combined_score"):
+        """
+        Links between the proteins of nodes, each one once.
+
+        Returns:
+            sources: array of int
+            targets: array of int
+            scores: array of int (number of edges x channels), all the score channels of the edges
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        sources, positions = self._links(nodes)
+        targets = np.asarray(self.indices[positions])
+        member = np.zeros(len(self.proteins), dtype=bool)
+        member[nodes] = True
+        scores = np.asarray(self.scores[positions])
+        keep = member[targets] & (sources < targets) & (scores[:, self.channel(channel)] >= min_score)
+        return sources[keep], targets[keep], scores[keep]
+
+    def network(self, identifiers, threshold = 0.4, required_score = REQUIRED_SCORE, add_nodes = None):
+        """
+        Network of the STRING network API used by request_protein_interactions_network: the proteins of identifiers
+        plus the added partners, and their links with a combined score of at least required_score, keeping the links
+        with an experimental score above threshold.
+
+        Parameters:
+            identifiers: list of str, protein names or ENSP ids
+            threshold: float, minimum experimental score of the edges
+            required_score: int, minimum combined score of the links
+            add_nodes: int, default None. Partners added to the whole set of proteins, not to each protein: the
+                       add_nodes proteins with the best link to any of them. None for the API default, ADD_NODES
+                       for a single protein and none for several. For a single protein these are the partners the
+                       API adds, for several the API ranks the candidates with its own score and may pick others.
+        Returns:
+            G: networkx Graph with preferred names as nodes, the score channels (in [0, 1]) as edge attributes and
+               the experimental score as weight, None if no identifier is found
+        """
+        seeds = self.resolve(identifiers)
+        if len(seeds) == 0:
+            return None
+        if add_nodes is None:
+            add_nodes = ADD_NODES if len(seeds) == 1 else 0
+        nodes = self.expand(seeds, hops=1, min_score=required_score, limit=add_nodes) if add_nodes else seeds
+        sources, targets, scores = self.edges(nodes, required_score)
+        scores = scores / 1000
+        experimental = self.channel("experimental")
+        keep = scores[:, experimental] > threshold
+        G = nx.Graph()
+        G.add_edges_from((n1, n2, dict(zip(self.channels, score), weight=score[experimental]))
+                         for n1, n2, score in zip(self.names[sources[keep]].tolist(), self.names[targets[keep]].tolist(), scores[keep].tolist()))
+        return G
+
+def load_string_store(path = STRING_STORE_DIR, version = STRING_VERSION):
+    """
+    Returns:
+        store: StringStore, None if the store was not built or belongs to another STRING version.
+    """
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    store = StringStore(path)
+    if store.version != str(version):
+        print("Ignoring {}: built for STRING {} instead of {}".format(path, store.version, version))
+        return None
+    return store
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    build_string_store(*sys.argv[1:4])
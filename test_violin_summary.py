@@ -0,0 +1,45 @@
+"""
+Payload of the summary violins: the size of a figure must not depend on the number of samples, and the 108 violins
+of the All tissues plot grouped by gender must stay within a few hundred bytes each.
+"""
+
+import numpy as np
+import plotly.io as pio
+import plotly.graph_objects as go
+from violin_summary import summary_violin_traces, violin_summary, quantize_x, X_UNITS
+
+TISSUES = 54
+#serialized data of the 108 violins grouped by gender, about 1 KB per violin before the int16/spline outlines
+MAX_GENDER_PAYLOAD = 36 * 1024
+
+def gender_payload(samples, seed = 0):
+
+    rng = np.random.default_rng(seed)
+    traces = []
+    for j, (gender, color) in enumerate([("male", "cyan"), ("female", "pink")]):
+        groups = [(i - 0.2 + 0.4*j, rng.lognormal(3, 1, samples)) for i in range(TISSUES)]
+        traces.extend(summary_violin_traces(groups, [gender]*TISSUES, [color]*TISSUES, width=0.4))
+    return len(pio.json.to_json_plotly(go.Figure(data=traces).to_plotly_json()["data"]))
+
+def test_gender_payload_is_bounded():
+
+    assert gender_payload(200) < MAX_GENDER_PAYLOAD
+
+def test_payload_does_not_depend_on_samples():
+
+    assert abs(gender_payload(100) - gender_payload(10000)) < 0.05 * gender_payload(100)
+
+def test_summary_statistics():
+
+    y = np.r_[np.arange(100.0), 1000.0]
+    summary = violin_summary(y)
+    assert summary["median"] == 50
+    assert summary["upperfence"] == 99
+    assert list(summary["outliers"]) == [1000]
+    assert violin_summary([]) is None
+
+def test_quantize_x():
+
+    assert quantize_x([0, 0.2, 53.8]).tolist() == [0, 0.2 * X_UNITS, 53.8 * X_UNITS]
+    assert quantize_x([0, 1.5]).dtype == np.int16
+    assert quantize_x([0, 1000]).dtype == np.int32
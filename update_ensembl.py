@@ -1,6 +1,7 @@
 import gzip
 import re
 import requests
+from gene_index import build_gene_index_from_files
 
 # URL of the latest GTF file from GENCODE (GRCh38.p13)
 GTF_URL = "https://ftp.ebi.ac.uk/pub/databases/gencode/Gencode_human/release_39/gencode.v39.annotation.gtf.gz"
@@ -40,3 +41,4 @@ def extract_genes(gtf_filename, output_filename, output_filename_dict):
 # Run the functions
 download_gtf(GTF_URL, GTF_FILE)
 extract_genes(GTF_FILE, OUTPUT_FILE, OUTPUT_DICT_FILE)
+build_gene_index_from_files(OUTPUT_DICT_FILE)
@@ -0,0 +1,145 @@
+"""
+*************************************************************************************************************
+*                                                                                                           *
+*   GTex data visualizer developed by Ugo Lomoio at Magna Graecia University of Catanzaro                   *
+*                                                                                                           *
+*                           Server side violin summaries                                                    *
+*                                                                                                           *
+*************************************************************************************************************
+
+A go.Violin ships every sample value to the browser, which computes the kernel density again at each render.
+In summary mode the density is computed here on a fixed grid (binned KDE: histogram convolved with the
+Gaussian kernel through the FFT) and each violin is sent as a filled spline outline of SUMMARY_POINTS points
+per side, with its quartiles, mean and fences drawn by a go.Box with precomputed statistics plus a few
+outliers: the size of a violin no longer depends on its number of samples.
+The x coordinates are integers (X_UNITS per category position) sent as int16 arrays and the y coordinates
+float32 arrays, one box and one outliers trace hold all the violins of a figure.
+"""
+
+import numpy as np
+import plotly.graph_objects as go
+
+#points of each side of an outline, smoothed by the spline line shape
+SUMMARY_POINTS = 10
+#outliers kept for each violin, evenly spaced in their sorted order (the extremes are always kept)
+SUMMARY_OUTLIERS = 8
+KDE_GRID = 512
+#x axis units of one category position, the x of the summary traces are rounded to integers of these units
+X_UNITS = 200
+
+def bandwidth(y):
+    """
+    Silverman's rule of thumb, the default bandwidth of the plotly violins.
+    """
+    if len(y) < 2:
+        return 0.0
+    iqr = np.subtract(*np.percentile(y, [75, 25]))
+    spread = min(np.std(y, ddof=1), iqr / 1.349) or np.std(y, ddof=1)
+    return 1.059 * spread * len(y) ** -0.2
+
+def binned_kde(y, points = SUMMARY_POINTS, grid = KDE_GRID):
+    """
+    Gaussian kernel density of y over [min - 2 bandwidth, max + 2 bandwidth], the "soft" span of the plotly violins.
+
+    Returns:
+        ys: array of points values, where the density is sampled
+        density: array of points values, scaled to a maximum of 1
+    """
+    y = np.asarray(y, dtype=np.float64)
+    bw = bandwidth(y)
+    if bw <= 0:
+        #constant data, a flat line at the value
+        return np.array([y.min(), y.max()]), np.array([1.0, 1.0])
+    low, high = y.min() - 2*bw, y.max() + 2*bw
+    counts, edges = np.histogram(y, bins=grid, range=(low, high))
+    step = edges[1] - edges[0]
+    #kernel sampled on the bins offsets, the zero padded FFT product is the linear convolution
+    offsets = np.arange(-grid + 1, grid) * step
+    kernel = np.exp(-0.5 * (offsets / bw)**2)
+    size = 1 << int(np.ceil(np.log2(3*grid)))
+    density = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size)[grid-1:2*grid-1]
+    density = np.clip(density, 0, None)
+    centers = (edges[:-1] + edges[1:]) / 2
+    ys = np.linspace(low, high, points)
+    density = np.interp(ys, centers, density)
+    return ys, density / density.max()
+
+def violin_summary(y):
+    """
+    Returns:
+        summary: dict with the KDE outline ("ys", "density") and the box statistics as computed by plotly
+            (linear quartiles, fences at the farthest values within 1.5 IQR, at most SUMMARY_OUTLIERS values beyond them)
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) == 0:
+        return None
+    q1, median, q3 = np.percentile(y, [25, 50, 75])
+    iqr = q3 - q1
+    inside = y[(y >= q1 - 1.5*iqr) & (y <= q3 + 1.5*iqr)]
+    ys, density = binned_kde(y)
+    outliers = np.sort(y[(y < inside.min()) | (y > inside.max())])
+    if len(outliers) > SUMMARY_OUTLIERS:
+        outliers = outliers[np.linspace(0, len(outliers) - 1, SUMMARY_OUTLIERS).round().astype(np.int64)]
+    return {"ys": ys, "density": density, "q1": q1, "median": median, "q3": q3, "mean": y.mean(),
+            "lowerfence": inside.min(), "upperfence": inside.max(), "outliers": outliers}
+
+def quantize_x(x):
+    """
+    Returns:
+        x: int16 array (int32 when out of range) of the positions x (in category positions) in X_UNITS
+    """
+    x = np.round(np.asarray(x, dtype=np.float64) * X_UNITS)
+    return x.astype(np.int16 if len(x) == 0 or np.abs(x).max() < 2**15 else np.int32)
+
+def summary_xaxis(labels):
+    """
+    Returns:
+        xaxis: dict, layout of the linear x axis of the summary traces, with the tick labels at the category positions
+    """
+    return dict(type='linear', tickmode='array', tickvals=[i * X_UNITS for i in range(len(labels))], ticktext=labels,
+                range=[-0.5 * X_UNITS, (len(labels) - 0.5) * X_UNITS])
+
+def summary_violin_traces(groups, names, colors, width = 0.8, outliers_color = None):
+    """
+    Traces drawing a set of violins: one trace with the filled outlines of each legend name, then one box trace
+    with the statistics and one marker trace with the outliers of all the violins.
+
+    Parameters:
+        groups: list of (x position, values), x positions are category positions (use summary_xaxis for the axis)
+        names: list of str, legend name of each group, the groups of the same name share one outline trace
+        colors: list of str, fill color of each group (the first color of a name is used)
+        width: float, maximum width of a violin in category positions
+        outliers_color: str, default None. Color of the outliers, the color of their group's name if None
+    Returns:
+        traces: list of plotly trace dicts (see fast_figure)
+    """
+    summaries = [(x, name, color, violin_summary(y)) for (x, y), name, color in zip(groups, names, colors)]
+    summaries = [(x, name, color, summary) for x, name, color, summary in summaries if summary is not None]
+    outline_colors = {}
+    for _, name, color, _ in summaries:
+        outline_colors.setdefault(name, color)
+    traces = []
+    for name, color in outline_colors.items():
+        violins = [(x, summary) for x, violin_name, _, summary in summaries if violin_name == name]
+        #all the outlines of a name in a single trace, closed polygons separated by NaN gaps
+        outline_x = np.concatenate([np.concatenate((x + summary["density"]*width/2, x - summary["density"][::-1]*width/2, [np.nan])) for x, summary in violins])
+        outline_y = np.concatenate([np.concatenate((summary["ys"], summary["ys"][::-1], [np.nan])) for _, summary in violins])
+        #the NaN of y is enough to break the polygons, the gaps of x can be stored as integers
+        traces.append(dict(type="scatter", x=quantize_x(np.nan_to_num(outline_x)), y=outline_y.astype(np.float32), fill="toself", fillcolor=color, opacity=0.8, mode="lines",
+                           line=dict(color="black", width=1, shape="spline"), hoverinfo="skip", name=name))
+    if not summaries:
+        return traces
+    stats = {key: np.array([summary[key] for *_, summary in summaries], dtype=np.float32) for key in ["q1", "median", "q3", "mean", "lowerfence", "upperfence"]}
+    #one legend name: the box and the outliers are hidden with its outlines
+    legend = dict(name="")
+    if len(traces) == 1:
+        legend = dict(name=traces[0]["name"], legendgroup=traces[0]["name"])
+        traces[0]["legendgroup"] = traces[0]["name"]
+    traces.append(dict(type="box", x=quantize_x([x for x, *_ in summaries]), boxpoints=False, width=width/8 * X_UNITS, fillcolor="white", line=dict(color="black", width=1),
+                       showlegend=False, **legend, **stats))
+    outliers_x = np.concatenate([np.full(len(summary["outliers"]), x) for x, *_, summary in summaries])
+    outliers_y = np.concatenate([summary["outliers"] for *_, summary in summaries])
+    traces.append(dict(type="scatter", x=quantize_x(outliers_x), y=outliers_y.astype(np.float32), mode="markers",
+                       marker=dict(color=outliers_color or traces[0]["fillcolor"], size=3, line=dict(color="black", width=0.5)),
+                       showlegend=False, hovertemplate="%{y}<extra>" + legend["name"] + "</extra>", **legend))
+    return traces